@@ -0,0 +1,100 @@
+"""
+Discounted returns and GAE(lambda) over whole rollouts without a Python loop over steps.
+
+Arrays are time-major: shape (T,) for one env or (T, N) for N envs stepped together, NumPy or torch
+(results come back as the same kind as rewards). terminated and truncated are the env's flags for each
+step. A terminated step has no future. A truncated step (time limit, lost process) does: it is
+bootstrapped from the value of the state it was cut at, next_values[t] if the caller has it, otherwise
+values[t] as the closest stand-in. The step after either one belongs to a new episode, so nothing
+flows back across it.
+
+Ex:
+    advantages, returns = gae(rewards, values, terminated, truncated, last_value, gamma=0.99, lam=0.95)
+"""
+import numpy as np
+import torch
+
+
+def reverse_scan(a, b):
+    '''
+    x[t] = b[t] + a[t] * x[t + 1] for every t (x[T] = 0), in log2(T) vectorized passes
+    of a parallel prefix scan instead of T dependent steps. The inputs are not modified.
+    '''
+
+    a = a.copy() if isinstance(a, np.ndarray) else a.clone()
+    x = b.copy() if isinstance(b, np.ndarray) else b.clone()
+    shift = 1
+    while shift < len(x):
+        # Each step absorbs the partial result `shift` steps ahead of it, then the spans double
+        x[:-shift] = x[:-shift] + a[:-shift] * x[shift:]
+        a[:-shift] = a[:-shift] * a[shift:]
+        shift *= 2
+    return x
+
+
+def _float64(like):
+    '''Converter to float64 arrays of the same kind as like. Sums over long rollouts drift in float32.'''
+    if isinstance(like, np.ndarray):
+        return lambda x: np.asarray(x, dtype=np.float64)
+    return lambda x: torch.as_tensor(x, dtype=torch.float64, device=like.device)
+
+
+def _output(x, like):
+    if isinstance(like, np.ndarray):
+        return x.astype(like.dtype if like.dtype == np.float64 else np.float32)
+    return x.to(like.dtype if like.dtype == torch.float64 else torch.float32)
+
+
+def _flags(f64, terminated, truncated):
+    terminated = f64(terminated) > 0
+    truncated = f64(truncated) > 0 if truncated is not None else terminated & False
+    return terminated, truncated
+
+
+def gae(rewards, values, terminated, truncated=None, last_value=0.0, gamma=0.99, lam=0.95, next_values=None):
+    '''
+    Generalized advantage estimates and the matching returns (advantages + values).
+    last_value is the value of the state after the last step (one per env for batched rollouts),
+    it is not used where the last step ended the episode.
+    '''
+
+    f64 = _float64(rewards)
+    lib = np if isinstance(rewards, np.ndarray) else torch
+    r, v = f64(rewards), f64(values)
+    terminated, truncated = _flags(f64, terminated, truncated)
+
+    # Value of the state each step led to
+    following = lib.zeros_like(v)
+    following[:-1] = v[1:]
+    following[-1] = f64(last_value)
+    following = lib.where(truncated, f64(next_values) if next_values is not None else v, following)
+    following = lib.where(terminated, 0.0, following)
+
+    deltas = r + gamma * following - v
+    decay = lib.where(terminated | truncated, f64(0.0), f64(gamma * lam))
+    advantages = reverse_scan(decay, deltas)
+    return _output(advantages, rewards), _output(advantages + v, rewards)
+
+
+def discounted_returns(rewards, terminated, truncated=None, last_value=0.0, gamma=0.99, next_values=None):
+    '''
+    Discounted returns. The last step is bootstrapped with last_value unless it ended the episode.
+    Truncated steps are bootstrapped with next_values, without them they can only be cut off like
+    terminated ones.
+    '''
+
+    f64 = _float64(rewards)
+    lib = np if isinstance(rewards, np.ndarray) else torch
+    r = f64(rewards)
+    terminated, truncated = _flags(f64, terminated, truncated)
+
+    bootstrap = lib.zeros_like(r)
+    bootstrap[-1] = f64(last_value)
+    if next_values is not None:
+        bootstrap = lib.where(truncated, f64(next_values), bootstrap)
+    else:
+        bootstrap = lib.where(truncated, 0.0, bootstrap)
+    bootstrap = lib.where(terminated, 0.0, bootstrap)
+
+    decay = lib.where(terminated | truncated, f64(0.0), f64(gamma))
+    return _output(reverse_scan(decay, r + gamma * bootstrap), rewards)
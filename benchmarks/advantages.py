@@ -0,0 +1,78 @@
+"""
+Returns and GAE over rollouts of 2k to 1M steps: the old PPOAgent.compute_returns loop
+(list.insert(0, ...), quadratic) and a plain reverse loop against the vectorized scan in advantages.py.
+
+Usage: python -m benchmarks.advantages [--sizes 2048 65536 1048576] [--envs 1] [--legacy-max 131072]
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from advantages import gae, discounted_returns
+
+
+def legacy_returns(rewards, is_terminals, gamma=0.99, next_value=0):
+    returns = []
+    G = next_value
+    for reward, is_terminal in zip(reversed(rewards), reversed(is_terminals)):
+        if is_terminal:
+            G = 0
+        G = reward + gamma * G
+        returns.insert(0, G)
+    return returns
+
+
+def loop_gae(rewards, values, terminated, truncated, last_value, gamma=0.99, lam=0.95):
+    advantages = np.zeros_like(rewards)
+    running = np.zeros(rewards.shape[1:])
+    for t in reversed(range(len(rewards))):
+        following = values[t + 1] if t + 1 < len(rewards) else last_value
+        following = np.where(truncated[t], values[t], following)
+        following = np.where(terminated[t], 0.0, following)
+        delta = rewards[t] + gamma * following - values[t]
+        running = delta + np.where(terminated[t] | truncated[t], 0.0, gamma * lam) * running
+        advantages[t] = running
+    return advantages
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2048, 16384, 131072, 1048576])
+    parser.add_argument("--envs", type=int, default=1)
+    parser.add_argument("--legacy-max", type=int, default=131072, help="skip the quadratic loop above this")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f'{"steps":>9s} {"legacy ms":>10s} {"returns ms":>11s} {"loop gae ms":>12s} {"gae ms":>8s} {"gae torch ms":>13s}')
+    for size in args.sizes:
+        steps = size // args.envs
+        shape = (steps, args.envs) if args.envs > 1 else (steps,)
+        rewards = rng.normal(size=shape).astype(np.float32)
+        values = rng.normal(size=shape).astype(np.float32)
+        terminated = rng.random(shape) < 0.002
+        truncated = (rng.random(shape) < 0.001) & ~terminated
+        last_value = np.zeros(shape[1:], dtype=np.float32)
+
+        legacy = "skipped"
+        if args.envs == 1 and size <= args.legacy_max:
+            expected, ms = timed(legacy_returns, rewards.tolist(), terminated.tolist())
+            legacy = f'{ms:.1f}'
+            got = discounted_returns(rewards, terminated)
+            assert np.allclose(got, expected, atol=1e-3)
+
+        _, returns_ms = timed(discounted_returns, rewards, terminated, truncated, last_value)
+        expected, loop_ms = timed(loop_gae, rewards, values, terminated, truncated, last_value)
+        (advantages, _), gae_ms = timed(gae, rewards, values, terminated, truncated, last_value)
+        assert np.allclose(advantages, expected, atol=1e-3)
+
+        tensors = [torch.from_numpy(x) for x in (rewards, values, terminated, truncated, last_value)]
+        _, torch_ms = timed(gae, *tensors)
+        print(f'{size:9d} {legacy:>10s} {returns_ms:11.1f} {loop_ms:12.1f} {gae_ms:8.1f} {torch_ms:13.1f}')
@@ -0,0 +1,61 @@
+"""
+Size and cost of ActorCritic for the old hard-coded 400x400x3 input against encoders built
+from DS3Env's observation space: parameters, FLOPs per observation, checkpoint size
+and forward+backward time of one batch on CPU.
+
+Usage: python -m benchmarks.encoder_cost [--batch 64] [--repeat 5]
+"""
+import argparse
+import io
+import time
+
+import torch
+
+from ppo_agent import ActorCritic
+
+CONFIGS = [
+    ("legacy 400x400x3", dict(frame_shape=(400, 400, 3))),
+    ("128x128x1", dict(frame_shape=(128, 128, 1))),
+    ("128x128x1 stack 4", dict(frame_shape=(128, 128, 1), frame_stack=4)),
+    ("128x128x1 compact", dict(frame_shape=(128, 128, 1), compact=True)),
+    ("128x128x1 stack 4 compact", dict(frame_shape=(128, 128, 1), frame_stack=4, compact=True)),
+]
+
+
+def checkpoint_mb(model):
+    buf = io.BytesIO()
+    torch.save(model.state_dict(), buf)
+    return buf.tell() / 2**20
+
+
+def train_step_ms(model, batch, repeat):
+    stats = torch.rand(batch, model.state_dim)
+    frames = torch.randint(0, 256, (batch, *model.frame_shape), dtype=torch.uint8)
+    optimizer = torch.optim.Adam(model.parameters())
+
+    times = []
+    for i in range(repeat + 1):
+        start = time.perf_counter()
+        probs, value = model(stats, frames)
+        loss = value.mean() - probs.log().mean()
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+        if i:
+            # First one warms up the allocator
+            times.append(time.perf_counter() - start)
+    return min(times) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f'{"":28s} {"params":>12s} {"MFLOPs":>10s} {"ckpt MiB":>9s} {"fwd+bwd ms":>11s}')
+    for name, kwargs in CONFIGS:
+        model = ActorCritic(5, 9, **kwargs)
+        cost = model.complexity()
+        print(f'{name:28s} {cost["params"]:12,d} {cost["flops"] / 1e6:10.1f} {checkpoint_mb(model):9.1f} '
+              f'{train_step_ms(model, args.batch, args.repeat):11.1f}')
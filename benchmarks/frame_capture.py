@@ -0,0 +1,53 @@
+"""
+Time spent on the step's critical path to get one observation frame:
+  blocking: grab + preprocess inside the step, like get_frame.get_one_frame
+  engine:   capture.FrameCapture.latest() while a background thread grabs
+
+Frames come from capture.SyntheticSource, grab_latency stands in for the screen grab itself.
+
+Usage: python -m benchmarks.frame_capture [--width 1920 --height 1080] [--grab-ms 8] [--steps 200]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.frame_preprocess import legacy_preprocess
+from capture import FrameCapture, SyntheticSource
+
+
+def report(name, samples):
+    samples = np.array(samples) * 1e3
+    print(f'{name:<9} mean: {samples.mean():8.3f} ms   p50: {np.percentile(samples, 50):8.3f} ms   '
+          f'p99: {np.percentile(samples, 99):8.3f} ms')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--grab-ms", type=float, default=8.0)
+    parser.add_argument("--steps", type=int, default=200)
+    parser.add_argument("--step-ms", type=float, default=50.0, help="time the rest of the step takes")
+    args = parser.parse_args()
+
+    source = SyntheticSource(args.width, args.height, grab_latency=args.grab_ms / 1e3)
+
+    samples = []
+    for _ in range(args.steps):
+        start = time.perf_counter()
+        out = np.empty((128, 128, 1), dtype=np.uint8)
+        legacy_preprocess(source.grab(), out)
+        samples.append(time.perf_counter() - start)
+    report("blocking", samples)
+
+    samples = []
+    with FrameCapture(source) as capture:
+        capture.latest()
+        for _ in range(args.steps):
+            time.sleep(args.step_ms / 1e3)
+            start = time.perf_counter()
+            frame, stamp = capture.latest()
+            samples.append(time.perf_counter() - start)
+        print(f'engine captured {capture.frame_count} frames, dropped {capture.dropped}')
+    report("engine", samples)
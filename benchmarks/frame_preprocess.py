@@ -0,0 +1,59 @@
+"""
+Per-frame latency and allocations of frame preprocessing:
+  legacy:   np.array(grab)[:, :, :3] -> BGR2GRAY -> resize -> reshape, like get_frame.get_one_frame
+  pipeline: preprocess.FramePreprocessor writing into a reused output buffer
+
+Usage: python -m benchmarks.frame_preprocess [--frames 100]
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import cv2
+
+from preprocess import FramePreprocessor
+
+
+def legacy_preprocess(src, out):
+    frame = np.array(src)[:, :, :3]
+    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    frame = cv2.resize(frame, (128, 128), interpolation=cv2.INTER_AREA)
+    out[...] = frame.reshape(128, 128, 1)
+
+
+def measure(fn, src, frames):
+    out = np.empty((128, 128, 1), dtype=np.uint8)
+    fn(src, out)
+
+    start = time.perf_counter()
+    for _ in range(frames):
+        fn(src, out)
+    latency = (time.perf_counter() - start) / frames
+
+    tracemalloc.start()
+    fn(src, out)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return latency, peak
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=100)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for width, height in [(1920, 1080), (2560, 1440)]:
+        src = rng.integers(0, 256, size=(height, width, 4), dtype=np.uint8)
+        rows = [
+            ("legacy", legacy_preprocess),
+            ("pipeline", FramePreprocessor()),
+            ("pipe+roi", FramePreprocessor(roi=(0.0, 0.1, 1.0, 0.85))),
+            ("pipe+first", FramePreprocessor(resize_first=True, interpolation=cv2.INTER_LINEAR)),
+        ]
+
+        print(f'{width}x{height}')
+        for name, fn in rows:
+            latency, peak = measure(fn, src, args.frames)
+            print(f'  {name:<10} {latency * 1e3:7.3f} ms/frame   peak alloc: {peak / 1024:8.1f} KiB')
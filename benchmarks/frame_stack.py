@@ -0,0 +1,93 @@
+"""
+Step overhead and per-step copy volume of 4-frame stacking: train.py's VecFrameStack + VecTransposeImage
+against frame_stack.FrameStack inside the env, on a stand-in env that returns DS3Env-shaped
+observations instantly so only the stacking (and the vec env around it) is measured.
+
+Usage: python -m benchmarks.frame_stack [--steps 20000] [--episode-len 500] [--n-stack 4]
+"""
+import argparse
+import time
+
+import numpy as np
+import gymnasium as gym
+from gymnasium import spaces
+from stable_baselines3.common.vec_env import DummyVecEnv, VecFrameStack, VecTransposeImage
+
+from frame_stack import FrameStack
+
+
+class StandIn(gym.Env):
+    '''DS3Env's spaces, a new random frame every step, episodes of a fixed length'''
+
+    def __init__(self, episode_len):
+        self.observation_space = spaces.Dict({
+            'stats': spaces.Box(low=0, high=1, shape=(5,), dtype=np.float32),
+            'frame': spaces.Box(low=0, high=255, shape=(128, 128, 1), dtype=np.uint8)
+        })
+        self.action_space = spaces.Discrete(9)
+        self.episode_len = episode_len
+        rng = np.random.default_rng(0)
+        self.frames = rng.integers(0, 256, (64, 128, 128, 1), dtype=np.uint8)
+        self.t = 0
+
+
+    def _obs(self):
+        return {'stats': np.full(5, self.t % 2, dtype=np.float32), 'frame': self.frames[self.t % 64].copy()}
+
+
+    def reset(self, seed=None, options=None):
+        self.t = 0
+        return self._obs(), {}
+
+
+    def step(self, action):
+        self.t += 1
+        return self._obs(), 0.0, self.t >= self.episode_len, False, {}
+
+
+def chains(episode_len, n_stack):
+    return {
+        "no stacking": lambda: DummyVecEnv([lambda: StandIn(episode_len)]),
+        "VecFrameStack + VecTransposeImage": lambda: VecTransposeImage(
+            VecFrameStack(DummyVecEnv([lambda: StandIn(episode_len)]), n_stack, channels_order="last")),
+        "FrameStack": lambda: DummyVecEnv([lambda: FrameStack(StandIn(episode_len), n_stack)]),
+    }
+
+
+def copy_volume(name, frame_bytes, n_stack):
+    '''Frame bytes written per step by each layer, from what each one does with the observation'''
+    dummy = 2  # DummyVecEnv copies the obs into its buffer and out again
+    if name == "no stacking":
+        return dummy * frame_bytes
+    if name == "FrameStack":
+        # One transposed write, the rare compaction, then DummyVecEnv's two copies of the stack
+        return frame_bytes + dummy * n_stack * frame_bytes
+    # DummyVecEnv on single frames, np.roll of the stack, the new frame, the transposed copy
+    return dummy * frame_bytes + n_stack * frame_bytes + frame_bytes + n_stack * frame_bytes
+
+
+def step_time(env, steps):
+    env.reset()
+    actions = np.zeros(1, dtype=np.int64)
+    for _ in range(100):
+        env.step(actions)
+
+    start = time.perf_counter()
+    for _ in range(steps):
+        env.step(actions)
+    return (time.perf_counter() - start) / steps * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", type=int, default=20_000)
+    parser.add_argument("--episode-len", type=int, default=500)
+    parser.add_argument("--n-stack", type=int, default=4)
+    args = parser.parse_args()
+
+    frame_bytes = 128 * 128
+    print(f'{"":36s} {"us/step":>8s} {"KiB copied/step":>16s}')
+    for name, make in chains(args.episode_len, args.n_stack).items():
+        us = step_time(make(), args.steps)
+        kib = copy_volume(name, frame_bytes, args.n_stack) / 1024
+        print(f'{name:36s} {us:8.1f} {kib:16.0f}')
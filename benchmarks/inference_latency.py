@@ -0,0 +1,82 @@
+"""
+Per-action CPU latency (p50/p99) of the current paths, PPOAgent.select_action and SB3's
+model.predict on train.py's policy, against inference.InferenceEngine (TorchScript, fp32 and
+dynamic int8) at a few thread counts.
+
+Usage: python -m benchmarks.inference_latency [--calls 1000] [--threads 1 2 4]
+"""
+import argparse
+import os
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import torch
+
+from inference import InferenceEngine
+from ppo_agent import PPOAgent
+
+
+def latency(fn, obs, calls, warmup=50):
+    for _ in range(warmup):
+        fn(obs)
+
+    times = np.empty(calls)
+    for i in range(calls):
+        start = time.perf_counter()
+        fn(obs)
+        times[i] = time.perf_counter() - start
+    return np.percentile(times, 50) * 1000, np.percentile(times, 99) * 1000
+
+
+def sb3_model(path):
+    '''train.py's PPO policy on train.py's wrapper chain, saved to path'''
+    from stable_baselines3 import PPO
+    from stable_baselines3.common.vec_env import DummyVecEnv, VecFrameStack, VecTransposeImage
+    from benchmarks.replay_throughput import synthetic_trace
+    from replay import ReplayEnv
+
+    trace = synthetic_trace(600)
+    env = VecTransposeImage(VecFrameStack(DummyVecEnv([lambda: ReplayEnv(trace)]), n_stack=4, channels_order="last"))
+    policy_kwargs = {"net_arch": {"pi": [128, 128], "vf": [128, 128]}, "activation_fn": torch.nn.ReLU}
+    model = PPO("MultiInputPolicy", env, policy_kwargs=policy_kwargs, device="cpu", n_steps=1024)
+    model.save(path)
+    return model, env
+
+
+def report(name, p50, p99):
+    print(f'{name:40s} p50 {p50:7.2f} ms   p99 {p99:7.2f} ms')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=1000)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore")
+    default_threads = torch.get_num_threads()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        rng = np.random.default_rng(0)
+
+        # PPOAgent at DS3Env's observation shape
+        agent = PPOAgent(state_dim=5, action_dim=9, device="cpu", frame_shape=(128, 128, 1))
+        agent.save(os.path.join(tmp, "agent.pth"))
+        obs = {"frame": rng.integers(0, 256, (128, 128, 1), dtype=np.uint8), "stats": rng.random(5, dtype=np.float32)}
+        report(f'PPOAgent.select_action ({default_threads} threads)', *latency(agent.select_action, obs, args.calls))
+        for threads in args.threads:
+            for quantize in (False, True):
+                engine = InferenceEngine.from_checkpoint(os.path.join(tmp, "agent.pth"), threads=threads, quantize=quantize)
+                report(f'engine {"int8" if quantize else "fp32"} ({threads} threads)', *latency(engine.act, obs, args.calls))
+
+        # SB3 policy as train.py builds it, on stacked channel-first frames
+        model, env = sb3_model(os.path.join(tmp, "sb3.zip"))
+        stacked = {key: value[0] for key, value in env.reset().items()}
+        report(f'SB3 model.predict ({default_threads} threads)',
+               *latency(lambda o: model.predict(o, deterministic=True), stacked, args.calls))
+        for threads in args.threads:
+            for quantize in (False, True):
+                engine = InferenceEngine.from_checkpoint(os.path.join(tmp, "sb3.zip"), threads=threads, quantize=quantize)
+                report(f'engine from SB3 {"int8" if quantize else "fp32"} ({threads} threads)',
+                       *latency(engine.act, stacked, args.calls))
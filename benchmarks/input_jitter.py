@@ -0,0 +1,50 @@
+"""
+Timing jitter of input_scheduler.InputScheduler against a FakeGamepad, compared with the
+blocking time.sleep pattern controller.py uses. Lateness is actual - intended send time.
+
+Usage: python -m benchmarks.input_jitter [--actions 200]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from input_scheduler import InputScheduler, FakeGamepad, tap, STICK
+
+B, RB = 0x2000, 0x0200
+
+
+def report(name, late, updates):
+    late = np.array(late) * 1e3
+    print(f'{name:<9} mean: {late.mean():7.3f} ms   p50: {np.percentile(late, 50):7.3f} ms   '
+          f'p99: {np.percentile(late, 99):7.3f} ms   max: {late.max():7.3f} ms   updates: {updates}')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--actions", type=int, default=200)
+    args = parser.parse_args()
+
+    # Blocking: forward roll the way controller.forward_roll_dodge does it
+    pad = FakeGamepad()
+    late = []
+    for _ in range(args.actions):
+        pad.left_joystick_float(x_value_float=0.0, y_value_float=1.0)
+        pad.press_button(button=B)
+        pad.update()
+        intended = time.perf_counter() + 0.05
+        time.sleep(0.05)
+        pad.release_button(button=B)
+        pad.update()
+        late.append(pad.updates[-1][0] - intended)
+    report("blocking", late, len(pad.updates))
+
+    pad = FakeGamepad()
+    inputs = InputScheduler(pad).start()
+    roll = [(0.0, STICK, (0.0, 1.0))] + tap(B, 0.05)
+    for i in range(args.actions):
+        handle = inputs.submit(roll if i % 2 else tap(RB, 0.1))
+        handle.wait()
+    inputs.stop()
+    stats = inputs.jitter()
+    report("scheduler", [sent - intended for intended, sent, _ in inputs.log], stats["updates"])
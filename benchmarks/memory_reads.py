@@ -0,0 +1,71 @@
+"""
+Compares the memory reads of one DS3Env step using the Entity properties (the old way)
+against a single DS3Reader.snapshot(), on a FakeDS3 with simulated cross-process latency.
+Also measures DS3Reader.initialize() with a cold and a warm pointer chain cache.
+
+Usage: python -m benchmarks.memory_reads [--latency-us 20] [--steps 2000]
+"""
+import argparse
+import math
+import time
+
+from memory import DS3Reader, BOSSES, FakeDS3
+
+
+def property_step(player, boss):
+    # Mirrors the reads DS3Env.step used to make: prev HP, observation, reward, terminated, info
+    prev_player, prev_boss = player.norm_hp, boss.norm_hp
+    math.dist(player.pos, boss.pos)
+    player.animation
+    player.norm_hp, player.norm_sp, boss.norm_hp
+    prev_boss - boss.norm_hp
+    prev_player - player.norm_hp
+    math.dist(player.pos, boss.pos)
+    boss.hp, player.hp, player.sp
+    player.hp <= 0 or boss.hp <= 0
+    player.hp, boss.hp, boss.hp, player.hp
+
+
+def snapshot_step(reader):
+    snap = reader.snapshot()
+    player, boss = snap.player, snap.boss
+    math.dist(player.pos, boss.pos)
+    player.norm_hp, player.norm_sp, boss.norm_hp, player.animation, player.hp, boss.hp
+
+
+def run(name, fn, memory, steps):
+    memory.reset_counters()
+    start = time.perf_counter()
+    for _ in range(steps):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(f'{name:<10} reads/step: {memory.reads / steps:5.1f}   '
+          f'bytes/step: {memory.bytes_read / steps:6.1f}   us/step: {elapsed / steps * 1e6:8.1f}')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency-us", type=float, default=20.0)
+    parser.add_argument("--steps", type=int, default=2000)
+    args = parser.parse_args()
+
+    game = FakeDS3()
+    game.add_player()
+    game.add_enemy(hp=BOSSES.IUDEX_GUNDYR)
+    game.memory.latency = args.latency_us * 1e-6
+
+    reader = DS3Reader(BOSSES.IUDEX_GUNDYR, backend=game.memory)
+    reader.initialize()
+
+    print(f'Simulated latency per read: {args.latency_us} us')
+    run("properties", lambda: property_step(reader.player, reader.boss), game.memory, args.steps)
+    run("snapshot", lambda: snapshot_step(reader), game.memory, args.steps)
+
+    def cold_initialize():
+        reader.chains.invalidate()
+        reader.initialize()
+
+    print()
+    run("init cold", cold_initialize, game.memory, args.steps // 10)
+    run("init warm", reader.initialize, game.memory, args.steps)
+    print(f'cache: {reader.cache_stats()}')
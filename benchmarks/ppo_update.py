@@ -0,0 +1,57 @@
+"""
+PPOAgent.update on a synthetic rollout: full batch against shuffled minibatches, with and
+without CPU bfloat16 autocast. Each configuration runs in its own process so the peak RSS
+it reports belongs to that update alone.
+
+Usage: python -m benchmarks.ppo_update [--steps 2048] [--epochs 4] [--minibatch 256]
+"""
+import argparse
+import resource
+import subprocess
+import sys
+
+import numpy as np
+
+from ppo_agent import PPOAgent
+
+CONFIGS = {
+    "full batch": {},
+    "minibatch": {"minibatch": True},
+    "minibatch bf16": {"minibatch": True, "bf16": True},
+}
+
+
+def run(name, steps, epochs, minibatch, frame_shape):
+    config = CONFIGS[name]
+    agent = PPOAgent(
+        state_dim=5, action_dim=9, k_epochs=epochs, rollout_size=steps, device="cpu", frame_shape=frame_shape,
+        minibatch_size=minibatch if config.get("minibatch") else None, bf16=config.get("bf16", False)
+    )
+    rng = np.random.default_rng(0)
+    frames = rng.integers(0, 256, (16, *frame_shape), dtype=np.uint8)
+    for i in range(steps):
+        obs = {"frame": frames[i % 16], "stats": rng.random(5, dtype=np.float32)}
+        agent.store_transition(obs, agent.select_action(obs), rng.normal(), i == steps - 1)
+
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    stats = agent.update()
+    print(f'{name:16s} update: {stats["update_time"]:7.2f} s   grad steps: {stats["grad_steps"]:4d}   '
+          f'peak RSS during update: +{stats["peak_memory_mb"] - before:7.1f} MiB')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", type=int, default=2048)
+    parser.add_argument("--epochs", type=int, default=4)
+    parser.add_argument("--minibatch", type=int, default=256)
+    parser.add_argument("--frame", type=int, nargs=3, default=[128, 128, 1])
+    parser.add_argument("--config", choices=list(CONFIGS))
+    args = parser.parse_args()
+
+    if args.config:
+        run(args.config, args.steps, args.epochs, args.minibatch, tuple(args.frame))
+    else:
+        for name in CONFIGS:
+            cmd = [sys.executable, "-m", "benchmarks.ppo_update", "--config", name, "--steps", str(args.steps),
+                   "--epochs", str(args.epochs), "--minibatch", str(args.minibatch), "--frame", *map(str, args.frame)]
+            subprocess.run(cmd, check=True, stdout=None, stderr=subprocess.DEVNULL)
@@ -0,0 +1,58 @@
+"""
+Step overhead of recorder.TrajectoryRecorder and random access cost of recorder.Recording,
+using replay.ReplayEnv on a synthetic trace as the environment.
+
+Usage: python -m benchmarks.recorder_overhead [--steps 20000] [--compress]
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.replay_throughput import synthetic_trace
+from recorder import Recording, TrajectoryRecorder
+from replay import ReplayEnv
+
+
+def run(env, steps):
+    env.reset()
+    start = time.perf_counter()
+    for _ in range(steps):
+        _, _, terminated, truncated, _ = env.step(0)
+        if terminated or truncated:
+            env.reset()
+    return (time.perf_counter() - start) / steps
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", type=int, default=20000)
+    parser.add_argument("--compress", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        synthetic_trace(5000).save(f'{tmp}/trace')
+
+        base = run(ReplayEnv(f'{tmp}/trace'), args.steps)
+        env = TrajectoryRecorder(ReplayEnv(f'{tmp}/trace'), f'{tmp}/rec', compress=args.compress)
+        recorded = run(env, args.steps)
+        start = time.perf_counter()
+        env.close()
+        drain = time.perf_counter() - start
+
+        print(f'step:           {base * 1e6:8.1f} us')
+        print(f'recorded step:  {recorded * 1e6:8.1f} us  (+{(recorded - base) * 1e6:.1f} us)')
+        print(f'close (drain):  {drain * 1e3:8.1f} ms')
+
+        rec = Recording(f'{tmp}/rec')
+        rng = np.random.default_rng(0)
+        idx = rng.integers(0, len(rec) - 64, 1000)
+        start = time.perf_counter()
+        for i in idx:
+            rec.steps(int(i), int(i) + 64)
+        print(f'64-step range:  {(time.perf_counter() - start) / len(idx) * 1e6:8.1f} us')
+        start = time.perf_counter()
+        for e in range(len(rec.episodes)):
+            rec.episode(e)
+        print(f'episode:        {(time.perf_counter() - start) / len(rec.episodes) * 1e6:8.1f} us')
@@ -0,0 +1,73 @@
+"""
+Throughput of the training stack on a recorded trace (replay.ReplayEnv), no game needed.
+Generates a synthetic trace unless --trace points at a recorded one.
+
+Usage: python -m benchmarks.replay_throughput [--trace PATH] [--steps 5000] [--ppo-steps 2048]
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from replay import ReplayEnv, Trace, SNAPSHOT_DTYPE
+
+
+def synthetic_trace(steps, episode_len=500, seed=0):
+    rng = np.random.default_rng(seed)
+    snapshots = np.zeros(steps, dtype=SNAPSHOT_DTYPE)
+    snapshots["time"] = np.arange(steps) * 0.1
+
+    t = np.arange(steps) % episode_len
+    for name, max_hp in (("player", 454), ("boss", 1037)):
+        entity = snapshots[name]
+        entity["max_hp"] = max_hp
+        entity["hp"] = np.maximum(max_hp - t * (max_hp // episode_len + 1), 0)
+        entity["max_sp"] = 95
+        entity["sp"] = rng.integers(0, 96, steps)
+        entity["x"], entity["z"], entity["y"] = rng.normal(0, 3, (3, steps))
+        snapshots[name] = entity
+
+    frames = rng.integers(0, 256, (steps, 128, 128, 1), dtype=np.uint8)
+    actions = rng.integers(0, 9, steps)
+    episodes = np.arange(0, steps, episode_len)
+    return Trace(snapshots, frames, actions, episodes)
+
+
+def env_throughput(env, steps):
+    env.reset()
+    start = time.perf_counter()
+    for _ in range(steps):
+        _, _, terminated, truncated, _ = env.step(env.action_space.sample())
+        if terminated or truncated:
+            env.reset()
+    return steps / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trace", type=str)
+    parser.add_argument("--steps", type=int, default=5000)
+    parser.add_argument("--ppo-steps", type=int, default=0, help="also time SB3 PPO.learn like train.py")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.trace
+        if path is None:
+            path = tmp
+            synthetic_trace(max(args.steps, 2000)).save(path)
+
+        env = ReplayEnv(path)
+        print(f'env.step: {env_throughput(env, args.steps):10.1f} steps/s')
+
+        if args.ppo_steps:
+            import torch
+            from stable_baselines3 import PPO
+            from stable_baselines3.common.vec_env import DummyVecEnv, VecFrameStack, VecTransposeImage
+
+            vec = VecTransposeImage(VecFrameStack(DummyVecEnv([lambda: ReplayEnv(path)]), n_stack=4, channels_order="last"))
+            model = PPO("MultiInputPolicy", vec, n_steps=1024, device="cpu", verbose=0,
+                        policy_kwargs={"net_arch": {"pi": [128, 128], "vf": [128, 128]}, "activation_fn": torch.nn.ReLU})
+            start = time.perf_counter()
+            model.learn(args.ppo_steps)
+            print(f'PPO.learn: {args.ppo_steps / (time.perf_counter() - start):10.1f} steps/s')
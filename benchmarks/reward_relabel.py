@@ -0,0 +1,71 @@
+"""
+Relabeling stored trajectories with a different reward shaping: the per-step reward DS3Env computes
+(rewards.reward on GameSnapshots, one step at a time) against rewards.reward + heal_counts +
+discounted_returns over whole arrays, for 10k to 1M steps.
+
+Usage: python -m benchmarks.reward_relabel [--sizes 10000 100000 1000000] [--loop-max 100000]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from advantages import discounted_returns
+from benchmarks.replay_throughput import synthetic_trace
+from memory import GameSnapshot
+from rewards import RewardConfig, heal_counts, reward, state
+
+
+def loop_rewards(snapshots, actions, episode_starts, config):
+    snaps = [GameSnapshot.from_record(record) for record in snapshots]
+    rewards = np.zeros(len(snaps))
+    heals = 0
+    for t in range(1, len(snaps)):
+        if episode_starts[t]:
+            heals = 0
+        heals += actions[t] == config.heal_action
+        if not episode_starts[t]:
+            rewards[t] = reward(state(snaps[t - 1], snaps[t]), actions[t], heals, config)
+    return rewards
+
+
+def vectorized_rewards(snapshots, actions, episode_starts, config):
+    rewards = np.zeros(len(snapshots))
+    heals = heal_counts(actions, episode_starts, config)
+    rewards[1:] = reward(state(snapshots[:-1], snapshots[1:]), actions[1:], heals[1:], config)
+    rewards[episode_starts] = 0.0
+    return rewards
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--loop-max", type=int, default=100_000, help="skip the per-step loop above this")
+    args = parser.parse_args()
+
+    config = RewardConfig(step_penalty=0.01, heal_limit=2)
+    rng = np.random.default_rng(0)
+    # Only the snapshots are needed, repeated out to each size (the trace's frames would not fit)
+    base = synthetic_trace(10_000, episode_len=500).snapshots
+    print(f'{"steps":>9s} {"per-step ms":>12s} {"vectorized ms":>14s} {"+ returns ms":>13s}')
+    for size in args.sizes:
+        snapshots = np.resize(base, size)
+        actions = rng.integers(0, 9, size)
+        episode_starts = np.arange(size) % 500 == 0
+        ended = np.roll(episode_starts, -1)
+
+        loop = "skipped"
+        start = time.perf_counter()
+        rewards = vectorized_rewards(snapshots, actions, episode_starts, config)
+        vectorized_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        discounted_returns(rewards, ended)
+        returns_ms = (time.perf_counter() - start) * 1000
+
+        if size <= args.loop_max:
+            start = time.perf_counter()
+            expected = loop_rewards(snapshots, actions, episode_starts, config)
+            loop = f'{(time.perf_counter() - start) * 1000:.0f}'
+            assert np.allclose(rewards, expected)
+
+        print(f'{size:9d} {loop:>12s} {vectorized_ms:14.1f} {returns_ms:13.1f}')
@@ -0,0 +1,83 @@
+"""
+Memory and update-prep time of a PPOAgent rollout: the old per-step Python lists
+(np.array + FloatTensor over the whole rollout) against rollout_buffer.RolloutBuffer.
+Each mode runs in its own process so peak RSS is measured separately.
+
+Usage: python -m benchmarks.rollout_buffer [--steps 2048] [--frame 400 400 3]
+"""
+import argparse
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+import torch
+
+from rollout_buffer import RolloutBuffer
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def observations(frame_shape, n=8, seed=0):
+    rng = np.random.default_rng(seed)
+    frames = rng.integers(0, 256, (n, *frame_shape), dtype=np.uint8)
+    stats = rng.random((n, 5), dtype=np.float32)
+    # The env hands out a fresh observation every step
+    return lambda i: {"frame": frames[i % n].copy(), "stats": stats[i % n].copy()}
+
+
+def run_lists(steps, obs):
+    states_stats, states_frames, actions, rewards, is_terminals, log_probs = [], [], [], [], [], []
+    for i in range(steps):
+        o = obs(i)
+        log_probs.append(torch.tensor(-2.0))
+        states_stats.append(o["stats"])
+        states_frames.append(o["frame"])
+        actions.append(i % 9)
+        rewards.append(0.1)
+        is_terminals.append(False)
+
+    start = time.perf_counter()
+    old_states_stats = torch.FloatTensor(np.array(states_stats))
+    old_states_frames = torch.FloatTensor(np.array(states_frames)).permute(0, 3, 1, 2)
+    old_actions = torch.LongTensor(actions)
+    old_log_probs = torch.stack(log_probs)
+    return time.perf_counter() - start
+
+
+def run_buffer(steps, obs, frame_shape):
+    buffer = RolloutBuffer(steps, stats_shape=(5,), frame_shape=frame_shape)
+    for i in range(steps):
+        buffer.add(obs(i), i % 9, 0.1, False, -2.0, 0.0)
+
+    start = time.perf_counter()
+    batch = buffer.batch(None)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", type=int, default=2048)
+    parser.add_argument("--frame", type=int, nargs=3, default=[400, 400, 3])
+    parser.add_argument("--mode", choices=["lists", "buffer"])
+    args = parser.parse_args()
+    frame_shape = tuple(args.frame)
+
+    if args.mode:
+        obs = observations(frame_shape)
+        base = peak_rss_mb()
+        if args.mode == "lists":
+            prep = run_lists(args.steps, obs)
+        else:
+            prep = run_buffer(args.steps, obs, frame_shape)
+        print(f'{args.mode:7s} prep: {prep * 1000:8.1f} ms   peak RSS: +{peak_rss_mb() - base:8.1f} MiB')
+    else:
+        print(f'{args.steps} steps of {frame_shape} frames')
+        for mode in ("lists", "buffer"):
+            cmd = [sys.executable, "-m", "benchmarks.rollout_buffer", "--mode", mode,
+                   "--steps", str(args.steps), "--frame", *map(str, frame_shape)]
+            subprocess.run(cmd, check=True)
@@ -0,0 +1,77 @@
+"""
+Cold and warm cost of finding WORLD_CHR_MAN_PATTERN in a synthetic module image.
+  regex:  one re.search over the whole image, like pymem.pattern.pattern_scan_module
+  cold:   memory.scanner.scan_module (chunked reads + literal prefix prefilter)
+  warm:   memory.scanner.find_signature with a populated on-disk OffsetCache
+
+Usage: python -m benchmarks.signature_scan [--size-mb 96] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import struct
+import tempfile
+import time
+
+from memory import FakeMemory
+from memory.scanner import OffsetCache, find_signature, scan_module
+from memory.utils import WORLD_CHR_MAN_PATTERN
+
+
+def build_image(size, decoy_every=512):
+    image = bytearray(os.urandom(size))
+    image[0:2] = b"MZ"
+    struct.pack_into("<I", image, 0x3C, 0x80)
+    image[0x80:0x84] = b"PE\0\0"
+
+    # "mov rbx, [rip+x]" is everywhere in real code, so the prefix alone is not enough
+    rng = random.Random(0)
+    for off in range(0x1000, size - 64, decoy_every):
+        off += rng.randrange(decoy_every // 2)
+        image[off:off + 3] = b"\x48\x8B\x1D"
+
+    instr = (
+        b"\x48\x8B\x1D\x00\x01\x00\x04\x48\x8B\xF9\x48\x85\xDB\x74\x10"
+        b"\x8B\x11\x85\xD2\x74\x0A\x8D"
+    )
+    target = size - size // 10
+    image[target:target + len(instr)] = instr
+    return image, target
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=96)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    image, target = build_image(args.size_mb << 20)
+    memory = FakeMemory()
+    base = memory.map_module(0x140000000, image)
+    expected = base + target
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = OffsetCache(os.path.join(tmp, "offsets.json"))
+        find_signature(memory, WORLD_CHR_MAN_PATTERN, "world_chr_man", cache)
+
+        rows = [
+            ("regex", lambda: memory.pattern_scan(WORLD_CHR_MAN_PATTERN)),
+            ("cold", lambda: scan_module(memory, WORLD_CHR_MAN_PATTERN)),
+            ("warm", lambda: find_signature(memory, WORLD_CHR_MAN_PATTERN, "world_chr_man", OffsetCache(cache.path))),
+        ]
+
+        print(f'Module image: {args.size_mb} MiB, match at +{hex(target)}')
+        for name, fn in rows:
+            memory.reset_counters()
+            elapsed, addr = timed(fn, args.repeat)
+            assert addr == expected, (name, addr, expected)
+            print(f'{name:<6} {elapsed * 1e3:10.3f} ms   reads: {memory.reads // args.repeat}')
@@ -0,0 +1,48 @@
+"""
+Rollout throughput of instances.launch with N stand-in game instances. Each instance is a
+ReplayEnv on its own fixed-rate clock, so a step takes as long as it would against the game
+and the speedup comes from the workers stepping in parallel, like N games would.
+
+Usage: python -m benchmarks.vec_env_scaling [--instances 1 2 4] [--step-hz 20] [--steps 200]
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.replay_throughput import synthetic_trace
+from instances import launch
+from replay import ReplayEnv
+
+
+def make_stand_in(instance, rank, path, step_hz):
+    return ReplayEnv(path, step_hz=step_hz)
+
+
+def vec_throughput(env, steps):
+    env.reset()
+    actions = np.zeros(env.num_envs, dtype=np.int64)
+    start = time.perf_counter()
+    for _ in range(steps):
+        env.step(actions)
+    return steps * env.num_envs / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--instances", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--step-hz", type=float, default=20)
+    parser.add_argument("--steps", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        synthetic_trace(2000).save(tmp)
+
+        base = None
+        for n in args.instances:
+            env = launch([None] * n, lambda instance, rank: make_stand_in(instance, rank, tmp, args.step_hz))
+            rate = vec_throughput(env, args.steps)
+            env.close()
+            base = base or rate / n
+            print(f'{n:2d} instances ({type(env).__name__:13s}): {rate:8.1f} steps/s  ({rate / base:4.2f}x one instance)')
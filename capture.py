@@ -0,0 +1,239 @@
+import threading
+import time
+
+import numpy as np
+
+from preprocess import FramePreprocessor
+from profiler import NULL_PROFILER
+
+try:
+    import ctypes
+    import mss
+    import win32gui
+except ImportError:
+    # Window capture only works on Windows. SyntheticSource works anywhere.
+    mss = None
+    win32gui = None
+
+
+class WindowSource:
+    '''
+    Grabs the client area of the game window with one long-lived mss instance.
+    The window geometry is cached and only recomputed when the window rect changes
+    (checked every refresh_interval seconds) or the window goes away.
+    '''
+
+    def __init__(self, title="DARK SOULS III", refresh_interval=0.5, region=None, hwnd=None):
+        if mss is None or win32gui is None:
+            raise RuntimeError("Window capture needs mss and pywin32 (Windows only).")
+
+        ctypes.windll.user32.SetProcessDPIAware()
+        self.title = title
+        self.refresh_interval = refresh_interval
+        # Fixed capture region {"left", "top", "width", "height"}, skips the window lookup entirely
+        self.region = region
+        # Binds to one window when several games share the title. It is never looked up again.
+        self.hwnd = hwnd
+
+        self._sct = None
+        self._hwnd = hwnd
+        self._rect = None
+        self._monitor = region
+        self._checked = 0.0
+
+
+    def _geometry(self):
+        if self.region is not None:
+            return self.region
+
+        now = time.monotonic()
+        if self._monitor is not None and now - self._checked < self.refresh_interval:
+            return self._monitor
+
+        self._checked = now
+        if not self._hwnd or not win32gui.IsWindow(self._hwnd):
+            self._hwnd = win32gui.FindWindow(None, self.title) if self.hwnd is None else None
+            self._rect = None
+            if not self._hwnd:
+                self._monitor = None
+                return None
+
+        rect = win32gui.GetWindowRect(self._hwnd)
+        if rect != self._rect:
+            # Moved or resized
+            self._rect = rect
+            left, top, right, bottom = win32gui.GetClientRect(self._hwnd)
+            screen_left, screen_top = win32gui.ClientToScreen(self._hwnd, (left, top))
+            screen_right, screen_bottom = win32gui.ClientToScreen(self._hwnd, (right, bottom))
+            self._monitor = {
+                "left": screen_left,
+                "top": screen_top,
+                "width": screen_right - screen_left,
+                "height": screen_bottom - screen_top
+            }
+
+        return self._monitor
+
+
+    def grab(self):
+        '''BGRA frame of the window, or None if it is not found'''
+        # mss handles are per thread, so it is created by whichever thread grabs first
+        if self._sct is None:
+            self._sct = mss.mss()
+
+        monitor = self._geometry()
+        if monitor is None or monitor["width"] <= 0 or monitor["height"] <= 0:
+            return None
+
+        return self._sct.grab(monitor)
+
+
+    def close(self):
+        if self._sct is not None:
+            self._sct.close()
+            self._sct = None
+
+
+class SyntheticSource:
+    '''
+    Stand-in for WindowSource that cycles through generated BGRA frames.
+    grab_latency simulates the cost of a real screen grab.
+    '''
+
+    def __init__(self, width=1920, height=1080, n_frames=8, grab_latency=0.0, seed=0):
+        rng = np.random.default_rng(seed)
+        self.frames = rng.integers(0, 256, size=(n_frames, height, width, 4), dtype=np.uint8)
+        self.grab_latency = grab_latency
+        self.grabs = 0
+
+
+    def grab(self):
+        if self.grab_latency:
+            time.sleep(self.grab_latency)
+        frame = self.frames[self.grabs % len(self.frames)]
+        self.grabs += 1
+        return frame
+
+
+    def close(self):
+        pass
+
+
+class FrameCapture:
+    '''
+    Captures and preprocesses frames on a background thread into a preallocated ring buffer,
+    so the step only has to pick up the most recent frame.
+
+    Ex:
+        capture = FrameCapture(WindowSource()).start()
+        frame, timestamp = capture.latest()
+    '''
+
+    def __init__(self, source, shape=(128, 128, 1), preprocess=None, ring_size=4, fps=60, profiler=None):
+        '''
+        preprocess(grab, out) writes the observation frame into out. Defaults to a FramePreprocessor for shape.
+        profiler (profiler.Profiler) times every grab and preprocess on the capture thread.
+        '''
+        self.source = source
+        self.shape = shape
+        self.preprocess = preprocess if preprocess is not None else FramePreprocessor(shape)
+        self.fps = fps
+        self.profiler = profiler if profiler is not None else NULL_PROFILER
+
+        self._ring = np.zeros((ring_size, *shape), dtype=np.uint8)
+        self._stamps = np.zeros(ring_size, dtype=np.float64)
+        self._seq = -1
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+        self.dropped = 0
+        self.error = None
+
+
+    def start(self):
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="FrameCapture", daemon=True)
+            self._thread.start()
+        return self
+
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.source.close()
+
+
+    def __enter__(self):
+        return self.start()
+
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+    def _run(self):
+        period = 1.0 / self.fps if self.fps else 0.0
+        next_grab = time.perf_counter()
+        try:
+            while self._running:
+                with self.profiler.span("capture.grab"):
+                    frame = self.source.grab()
+                stamp = time.monotonic()
+                if frame is None:
+                    self.dropped += 1
+                    time.sleep(0.05)
+                    continue
+
+                slot = (self._seq + 1) % len(self._ring)
+                with self.profiler.span("capture.preprocess"):
+                    self.preprocess(frame, self._ring[slot])
+                self._stamps[slot] = stamp
+                with self._cond:
+                    self._seq += 1
+                    self._cond.notify_all()
+
+                if period:
+                    next_grab += period
+                    delay = next_grab - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    else:
+                        next_grab = time.perf_counter()
+        except Exception as e:
+            self.error = e
+            with self._cond:
+                self._cond.notify_all()
+            raise
+
+
+    @property
+    def frame_count(self):
+        return self._seq + 1
+
+
+    def latest(self, timeout=5.0):
+        '''
+        Most recent preprocessed frame (a copy) and its time.monotonic() capture time.
+        Only waits if no frame has been captured yet.
+        '''
+
+        if self._seq < 0:
+            self.wait_for_frame(0, timeout)
+
+        with self._cond:
+            slot = self._seq % len(self._ring)
+            return self._ring[slot].copy(), float(self._stamps[slot])
+
+
+    def wait_for_frame(self, count, timeout=5.0):
+        '''Blocks until frame_count is above count, i.e. a frame newer than the count-th one exists'''
+        with self._cond:
+            ready = self._cond.wait_for(lambda: self._seq + 1 > count or self.error is not None, timeout)
+
+        if self.error is not None:
+            raise RuntimeError("Frame capture thread failed.") from self.error
+        if not ready:
+            raise TimeoutError("No frame was captured in time. Is the game window open?")
@@ -0,0 +1,77 @@
+import time
+from contextlib import contextmanager
+
+
+def wait_for(condition, timeout, poll=0.005, max_poll=0.1, backoff=1.5, hold=0.0):
+    '''
+    Polls condition() until it is true and has stayed true for hold seconds. The sleep between
+    polls starts at poll and grows by backoff up to max_poll, so short waits react quickly and long
+    ones (loading screens) cost a few polls a second. An exception from condition counts as false,
+    memory reads fail while the game is loading. True once met, False when timeout runs out.
+    '''
+
+    start = time.monotonic()
+    deadline = start + timeout
+    delay = poll
+    since = None
+    while True:
+        try:
+            met = bool(condition())
+        except Exception:
+            met = False
+
+        now = time.monotonic()
+        if met:
+            since = now if since is None else since
+            if now - since >= hold:
+                return True
+        else:
+            since = None
+        if now >= deadline:
+            return False
+
+        # Check back soon while holding, otherwise back off
+        pause = min(poll, hold) if met else delay
+        time.sleep(max(min(pause, deadline - now), 0.0))
+        if not met:
+            delay = min(delay * backoff, max_poll)
+
+
+class PhaseTimer:
+    '''
+    Wall-clock time spent in each named phase of a procedure, plus the waits that timed out.
+
+    Ex:
+        timer = PhaseTimer()
+        with timer.phase("release"):
+            release()
+        timer.wait("load", loaded, timeout=60)
+        timer.breakdown()  # {"release": 0.01, "load": 3.2, "total": 3.21}
+    '''
+
+    def __init__(self):
+        self.times = {}
+        self.timeouts = []
+        self._start = time.monotonic()
+
+
+    @contextmanager
+    def phase(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.times[name] = self.times.get(name, 0.0) + time.monotonic() - start
+
+
+    def wait(self, name, condition, timeout, **kwargs):
+        '''wait_for(condition, timeout, **kwargs) timed as phase name'''
+        with self.phase(name):
+            met = wait_for(condition, timeout, **kwargs)
+        if not met:
+            self.timeouts.append(name)
+        return met
+
+
+    def breakdown(self):
+        return {**self.times, "total": time.monotonic() - self._start}
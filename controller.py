@@ -1,30 +1,117 @@
-import vgamepad as vg
 import time
-import win32gui
-import win32con
+
+from input_scheduler import InputScheduler, tap, PRESS, STICK, RESET, NOOP
+
+try:
+    import vgamepad as vg
+except ImportError:
+    # No virtual gamepad driver (Linux, replay). Only the event timelines are usable.
+    vg = None
+
+try:
+    import win32gui
+    import win32con
+except ImportError:
+    win32gui = None
+
+class XUSB:
+    """XInput button bits, same values as vg.XUSB_BUTTON. Usable without the driver installed."""
+    A = 0x1000
+    B = 0x2000
+    X = 0x4000
+    RIGHT_SHOULDER = 0x0200
+    RIGHT_THUMB = 0x0080
+
 def heal():
+    gamepad = gamepad_for()
     gamepad.press_button(button=vg.XUSB_BUTTON.XUSB_GAMEPAD_X)
     gamepad.update()
     time.sleep(0.08)
     gamepad.release_button(button=vg.XUSB_BUTTON.XUSB_GAMEPAD_X)
     gamepad.update()
     
-def keep_ds3_alive():
-    hwnd = win32gui.FindWindow(None, "DARK SOULS III")
+def keep_ds3_alive(hwnd=None):
+    if win32gui is None:
+        raise RuntimeError("pywin32 is not installed, the game window cannot be kept shown.")
+    hwnd = hwnd or win32gui.FindWindow(None, "DARK SOULS III")
     if hwnd:
         # SW_SHOWNOACTIVATE displays the window in its current size and position 
         # but does NOT take focus away from your current typing/work.
         win32gui.ShowWindow(hwnd, win32con.SW_SHOWNOACTIVATE)
 
-# Initialize the virtual gamepad
-gamepad = vg.VX360Gamepad()
+# Event timelines for the InputScheduler. Same timings as the blocking functions below.
+LIGHT_ATTACK = tap(XUSB.RIGHT_SHOULDER, 0.1)
+DODGE = tap(XUSB.B, 0.05)
+FORWARD_ROLL = [(0.0, STICK, (0.0, 1.0))] + tap(XUSB.B, 0.05)
+HEAL = tap(XUSB.X, 0.08)
+INTERACT = tap(XUSB.A, 0.1)
+LOCK_ON = tap(XUSB.RIGHT_THUMB, 0.1)
+
+def run_start_events(x, y):
+    # Stick direction + hold B until something resets the pad
+    return [(0.0, STICK, (x, y)), (0.0, PRESS, XUSB.B)]
+
+def run_events(x, y, sec):
+    # Stick direction + hold B, then back to neutral
+    return run_start_events(x, y) + [(sec, RESET, None)]
+
+def idle_events(sec):
+    return [(sec, NOOP, None)]
+
+# Shortest press the game is sure to see: the scheduler's coalesce window plus a frame at 60 fps.
+# Anything shorter and the press and release can go out in the same gamepad update.
+MIN_HOLD = 0.0005 + 1 / 60
+
+def clamped(events, end):
+    # Same inputs with nothing later than end, e.g. a tap released early to fit a short step.
+    # Never cut below MIN_HOLD, a tap that short would not register at all.
+    end = max(end, MIN_HOLD)
+    if all(offset <= end for offset, _, _ in events):
+        return events
+    return [(min(offset, end), kind, arg) for offset, kind, arg in events]
+
+def scaled(events, time_scale):
+    # Same inputs for a game running time_scale times faster: every offset (press/hold time) divided by it
+    if time_scale == 1.0:
+        return events
+    return [(offset / time_scale, kind, arg) for offset, kind, arg in events]
+
+_gamepads = {}
+_schedulers = {}
 
-def release_all_keys():
+def gamepad_for(index=None):
+    """
+    Virtual gamepad of one game instance, plugged in the first time it is asked for (one per
+    instance in this process, none at import). None and 0 are the same default gamepad.
+    """
+    if vg is None:
+        raise RuntimeError("vgamepad is not installed, there is no gamepad to schedule inputs for.")
+    index = index or 0
+    if index not in _gamepads:
+        _gamepads[index] = vg.VX360Gamepad()
+    return _gamepads[index]
+
+def __getattr__(name):
+    # controller.gamepad is the default gamepad, created on first use
+    if name == "gamepad":
+        return gamepad_for()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def scheduler(index=None):
+    """InputScheduler driving gamepad_for(index), started on first use"""
+    pad = gamepad_for(index)
+    if id(pad) not in _schedulers:
+        _schedulers[id(pad)] = InputScheduler(pad).start()
+    return _schedulers[id(pad)]
+
+def release_all_keys(pad=None):
     """Reset gamepad state to neutral"""
-    gamepad.reset()
-    gamepad.update()
+    pad = pad or gamepad_for()
+    pad.reset()
+    pad.update()
 
 def right_hand_light_attack():
+    gamepad = gamepad_for()
     # RB on Xbox
     gamepad.press_button(button=vg.XUSB_BUTTON.XUSB_GAMEPAD_RIGHT_SHOULDER)
     gamepad.update()
@@ -33,6 +120,7 @@ def right_hand_light_attack():
     gamepad.update()
 
 def forward_run_attack():
+    gamepad = gamepad_for()
     # Tilt stick forward + RB
     gamepad.left_joystick_float(x_value_float=0.0, y_value_float=1.0)
     gamepad.update()
@@ -43,6 +131,7 @@ def forward_run_attack():
     gamepad.update()
 
 def dodge():
+    gamepad = gamepad_for()
     # Tap B
     gamepad.press_button(button=vg.XUSB_BUTTON.XUSB_GAMEPAD_B)
     gamepad.update()
@@ -51,6 +140,7 @@ def dodge():
     gamepad.update()
 
 def forward_roll_dodge():
+    gamepad = gamepad_for()
     # Forward + B
     gamepad.left_joystick_float(x_value_float=0.0, y_value_float=1.0)
     gamepad.press_button(button=vg.XUSB_BUTTON.XUSB_GAMEPAD_B)
@@ -59,16 +149,18 @@ def forward_roll_dodge():
     gamepad.release_button(button=vg.XUSB_BUTTON.XUSB_GAMEPAD_B)
     gamepad.update()
 
-def run_forward(sec):
+def run_forward(sec, pad=None):
     # Forward + Hold B
-    gamepad.left_joystick_float(x_value_float=0.0, y_value_float=1.0)
-    gamepad.press_button(button=vg.XUSB_BUTTON.XUSB_GAMEPAD_B)
-    gamepad.update()
+    pad = pad or gamepad_for()
+    pad.left_joystick_float(x_value_float=0.0, y_value_float=1.0)
+    pad.press_button(button=vg.XUSB_BUTTON.XUSB_GAMEPAD_B)
+    pad.update()
     time.sleep(sec)
-    gamepad.reset()
-    gamepad.update()
+    pad.reset()
+    pad.update()
 
 def run_back(sec):
+    gamepad = gamepad_for()
     # Forward + Hold B
     gamepad.left_joystick_float(x_value_float=0.0, y_value_float=-1.0)
     gamepad.press_button(button=vg.XUSB_BUTTON.XUSB_GAMEPAD_B)
@@ -78,6 +170,7 @@ def run_back(sec):
     gamepad.update()
 
 def run_right(sec):
+    gamepad = gamepad_for()
     # Forward + Hold B
     gamepad.left_joystick_float(x_value_float=1.0, y_value_float=0.0)
     gamepad.press_button(button=vg.XUSB_BUTTON.XUSB_GAMEPAD_B)
@@ -87,6 +180,7 @@ def run_right(sec):
     gamepad.update()
 
 def run_left(sec):
+    gamepad = gamepad_for()
     # Forward + Hold B
     gamepad.left_joystick_float(x_value_float=-1.0, y_value_float=0.0)
     gamepad.press_button(button=vg.XUSB_BUTTON.XUSB_GAMEPAD_B)
@@ -95,33 +189,35 @@ def run_left(sec):
     gamepad.reset()
     gamepad.update()
 
-def walk_to_boss():
-    release_all_keys()
+def walk_to_boss(pad=None):
+    pad = pad or gamepad_for()
+    release_all_keys(pad)
     # Run forward
-    run_forward(1.0)
+    run_forward(1.0, pad)
     # Interact (A Button)
     for _ in range(2):
-        gamepad.press_button(button=vg.XUSB_BUTTON.XUSB_GAMEPAD_A)
-        gamepad.update()
+        pad.press_button(button=vg.XUSB_BUTTON.XUSB_GAMEPAD_A)
+        pad.update()
         time.sleep(0.1)
-        gamepad.release_button(button=vg.XUSB_BUTTON.XUSB_GAMEPAD_A)
-        gamepad.update()
+        pad.release_button(button=vg.XUSB_BUTTON.XUSB_GAMEPAD_A)
+        pad.update()
         time.sleep(1.0)
     
-    run_forward(5.0)
+    run_forward(5.0, pad)
     # Lock on (RS Click)
-    gamepad.press_button(button=vg.XUSB_BUTTON.XUSB_GAMEPAD_RIGHT_THUMB)
-    gamepad.update()
+    pad.press_button(button=vg.XUSB_BUTTON.XUSB_GAMEPAD_RIGHT_THUMB)
+    pad.update()
     time.sleep(0.1)
-    gamepad.release_button(button=vg.XUSB_BUTTON.XUSB_GAMEPAD_RIGHT_THUMB)
-    gamepad.update()
+    pad.release_button(button=vg.XUSB_BUTTON.XUSB_GAMEPAD_RIGHT_THUMB)
+    pad.update()
 
-def boss_died_reset():
-    release_all_keys()
+def boss_died_reset(pad=None):
+    pad = pad or gamepad_for()
+    release_all_keys(pad)
     for _ in range(4):
-        gamepad.press_button(button=vg.XUSB_BUTTON.XUSB_GAMEPAD_A)
-        gamepad.update()
+        pad.press_button(button=vg.XUSB_BUTTON.XUSB_GAMEPAD_A)
+        pad.update()
         time.sleep(0.1)
-        gamepad.release_button(button=vg.XUSB_BUTTON.XUSB_GAMEPAD_A)
-        gamepad.update()
+        pad.release_button(button=vg.XUSB_BUTTON.XUSB_GAMEPAD_A)
+        pad.update()
         time.sleep(1.0)
@@ -0,0 +1,313 @@
+"""
+Distills a trained policy (SB3 .zip or PPOAgent checkpoint) into a small ActorCritic for play and evaluation.
+
+The student learns the teacher's action distribution (KL divergence) and value (MSE) on observations from
+recordings (recorder.Recording), or collected by running the teacher in the env and recording them first.
+It sees the same stacked inputs as the teacher and is saved as a PPOAgent checkpoint, so
+InferenceEngine.from_checkpoint and PPOAgent.load both take it.
+
+Usage:
+    python distill.py --teacher models/best_eval/best_model.zip --recording recordings/gundyr --out models/student.pth
+    python distill.py --teacher models/best_eval/best_model.zip --collect recordings/distill --collect-steps 20000 --eval-episodes 10
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from inference import InferenceEngine
+from ppo_agent import ActorCritic, PPOAgent
+from recorder import Recording
+
+
+class Teacher:
+    '''
+    Action logits and values of a trained policy for batches of stacked, channel-last observations
+    (what VecFrameStack(channels_order="last") emits, without VecTransposeImage).
+    '''
+
+    def __init__(self, path, device="cpu"):
+        self.path = path
+        self.device = torch.device(device)
+
+        if str(path).endswith(".zip"):
+            from stable_baselines3 import PPO
+
+            self.policy = PPO.load(path, device=self.device).policy.eval()
+            space = self.policy.observation_space
+            self.action_dim = int(self.policy.action_space.n)
+            self.state_dim = space["stats"].shape[0]
+            self.channels = space["frame"].shape[0]
+            self.sb3 = True
+        else:
+            checkpoint = torch.load(path, map_location=self.device)
+            kwargs = checkpoint["policy_kwargs"]
+            self.policy = ActorCritic(**kwargs).to(self.device).eval()
+            self.policy.load_state_dict(checkpoint["policy_state_dict"])
+            self.action_dim = kwargs["action_dim"]
+            self.state_dim = kwargs["state_dim"]
+            self.channels = self.policy.frame_shape[0]
+            self.sb3 = False
+
+
+    def __call__(self, stats, frame):
+        '''(logits, values) for float stats (N, S) and uint8 frames (N, H, W, C)'''
+        frame = frame.permute(0, 3, 1, 2)
+        with torch.no_grad():
+            if self.sb3:
+                obs = {"stats": stats, "frame": frame}
+                logits = self.policy.get_distribution(obs).distribution.logits
+                values = self.policy.predict_values(obs)
+            else:
+                probs, values = self.policy(stats, frame)
+                logits = torch.log(probs.clamp_min(1e-8))
+        return logits, values.squeeze(-1)
+
+
+    def act(self, obs):
+        stats = torch.as_tensor(obs["stats"], dtype=torch.float32, device=self.device).unsqueeze(0)
+        frame = torch.as_tensor(obs["frame"], device=self.device).unsqueeze(0)
+        logits, _ = self(stats, frame)
+        return int(logits.argmax())
+
+
+    def params(self):
+        return sum(p.numel() for p in self.policy.parameters())
+
+
+class StackedObservations:
+    '''
+    Observations of one or more recordings, stacked n deep the way VecFrameStack stacks them:
+    oldest first along the last axis, zero padded at the start of each episode.
+    Only the unstacked columns are held in memory, stacks are gathered per batch.
+    '''
+
+    def __init__(self, recordings, n_stack=1):
+        stats, frames, starts = [], [], []
+        offset = 0
+        for recording in recordings:
+            data = recording.steps(0, len(recording), columns=["stats", "frame"])
+            stats.append(np.asarray(data["stats"], dtype=np.float32))
+            frames.append(np.asarray(data["frame"]))
+            # First step of the episode each step belongs to
+            episode = np.searchsorted(recording.episodes, np.arange(len(recording)), side="right") - 1
+            starts.append(recording.episodes[episode] + offset)
+            offset += len(recording)
+
+        self.stats = np.concatenate(stats)
+        self.frames = np.concatenate(frames)
+        self.starts = np.concatenate(starts)
+        self.n_stack = n_stack
+
+
+    def __len__(self):
+        return len(self.stats)
+
+
+    def _stack(self, column, indices):
+        # (B, n) source steps, oldest first, masked where they fall before the episode start
+        steps = indices[:, None] - np.arange(self.n_stack - 1, -1, -1)
+        valid = steps >= self.starts[indices][:, None]
+        stacked = column[np.maximum(steps, 0)]
+        stacked *= valid.reshape(valid.shape + (1,) * (stacked.ndim - 2)).astype(stacked.dtype)
+        # (B, n, ..., C) -> (B, ..., n * C)
+        stacked = np.moveaxis(stacked, 1, -2)
+        return stacked.reshape(*stacked.shape[:-2], -1)
+
+
+    def batch(self, indices, device="cpu"):
+        indices = np.asarray(indices)
+        return (
+            torch.from_numpy(self._stack(self.stats, indices)).to(device),
+            torch.from_numpy(self._stack(self.frames, indices)).to(device)
+        )
+
+
+def distill_loss(student_probs, student_values, teacher_logits, teacher_values, temperature=1.0, value_coef=0.5):
+    '''KL(teacher || student) on temperature-softened distributions, plus value regression'''
+    student_log_probs = F.log_softmax(torch.log(student_probs.clamp_min(1e-8)) / temperature, dim=-1)
+    teacher_log_probs = F.log_softmax(teacher_logits / temperature, dim=-1)
+    kl = F.kl_div(student_log_probs, teacher_log_probs, log_target=True, reduction="batchmean") * temperature ** 2
+    value = F.mse_loss(student_values.squeeze(-1), teacher_values)
+    return kl + value_coef * value, kl, value
+
+
+def distill(teacher, data, train_indices, epochs=10, batch_size=256, lr=1e-3, temperature=1.0,
+            value_coef=0.5, hidden_dim=64, channels=(8, 16, 16), device="cpu", seed=0):
+    '''Trains a compact student on data[train_indices] and returns it as a PPOAgent'''
+
+    frame_shape = data.frames.shape[1:]
+    student = PPOAgent(
+        state_dim=teacher.state_dim, action_dim=teacher.action_dim, lr=lr, hidden_dim=hidden_dim, device=device,
+        frame_shape=frame_shape, frame_stack=data.n_stack, compact=True, channels=channels
+    )
+    generator = np.random.default_rng(seed)
+
+    for epoch in range(epochs):
+        start = time.perf_counter()
+        totals = np.zeros(3)
+        order = generator.permutation(train_indices)
+        batches = range(0, len(order), batch_size)
+        for i in batches:
+            stats, frame = data.batch(order[i:i + batch_size], student.device)
+            teacher_logits, teacher_values = teacher(stats.to(teacher.device), frame.to(teacher.device))
+            probs, values = student.policy(stats, frame.permute(0, 3, 1, 2))
+            loss, kl, value = distill_loss(
+                probs, values, teacher_logits.to(student.device), teacher_values.to(student.device),
+                temperature, value_coef
+            )
+            student.optimizer.zero_grad()
+            loss.backward()
+            student.optimizer.step()
+            totals += [loss.item(), kl.item(), value.item()]
+
+        loss, kl, value = totals / len(batches)
+        print(f'epoch {epoch + 1}/{epochs}  loss {loss:.4f}  kl {kl:.4f}  value mse {value:.4f}  '
+              f'({time.perf_counter() - start:.1f} s)')
+
+    return student
+
+
+def agreement(teacher, student, data, indices, batch_size=1024):
+    '''Fraction of observations where the student's greedy action is the teacher's'''
+    matches = 0
+    for i in range(0, len(indices), batch_size):
+        stats, frame = data.batch(indices[i:i + batch_size], student.device)
+        teacher_logits, _ = teacher(stats.to(teacher.device), frame.to(teacher.device))
+        with torch.no_grad():
+            probs, _ = student.policy(stats, frame.permute(0, 3, 1, 2))
+        matches += (probs.argmax(-1).cpu() == teacher_logits.argmax(-1).cpu()).sum().item()
+    return matches / max(len(indices), 1)
+
+
+def stacked_env(channels, record=None, replay=None, step_hz=None):
+    '''
+    train.py's env chain without VecTransposeImage, so frames stay channel-last, stacked deep enough
+    to give the teacher's channels. Returns (env, stack depth).
+    '''
+    from stable_baselines3.common.vec_env import DummyVecEnv, VecFrameStack
+    from train import make_env
+
+    env = DummyVecEnv([lambda: make_env(replay=replay, step_hz=step_hz, record=record)])
+    n_stack = channels // env.observation_space["frame"].shape[-1]
+    return VecFrameStack(env, n_stack=n_stack, channels_order="last"), n_stack
+
+
+def collect(teacher, path, steps, **env_kwargs):
+    '''Records steps of the teacher playing (sampling its actions for broader coverage) to path'''
+    env, _ = stacked_env(teacher.channels, record=path, **env_kwargs)
+    obs = env.reset()
+    for _ in range(steps):
+        stats = torch.as_tensor(obs["stats"], dtype=torch.float32, device=teacher.device)
+        logits, _ = teacher(stats, torch.as_tensor(obs["frame"], device=teacher.device))
+        action = torch.distributions.Categorical(logits=logits).sample().cpu().numpy()
+        obs, _, _, _ = env.step(action)
+    env.close()
+    return Recording(path)
+
+
+def win_rate(act, episodes, channels, **env_kwargs):
+    '''Fraction of episodes won (info["is_success"]) acting greedily with act(obs)'''
+    env, _ = stacked_env(channels, **env_kwargs)
+    wins = 0
+    obs = env.reset()
+    for _ in range(episodes):
+        done = False
+        while not done:
+            obs, _, dones, infos = env.step(np.array([act({key: value[0] for key, value in obs.items()})]))
+            done = dones[0]
+        wins += bool(infos[0].get("is_success", False))
+    env.close()
+    return wins / episodes
+
+
+def latency_ms(engine, obs, calls=300):
+    '''p50 and p99 of one InferenceEngine.act call'''
+    for _ in range(20):
+        engine.act(obs)
+    times = np.empty(calls)
+    for i in range(calls):
+        start = time.perf_counter()
+        engine.act(obs)
+        times[i] = time.perf_counter() - start
+    return np.percentile(times, 50) * 1000, np.percentile(times, 99) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distill a trained policy into a small student")
+    parser.add_argument("--teacher", required=True, help="SB3 .zip or PPOAgent checkpoint")
+    parser.add_argument("--recording", nargs="*", default=[], help="Recording directories to train on")
+    parser.add_argument("--collect", type=str, help="Record the teacher playing to this directory first")
+    parser.add_argument("--collect-steps", type=int, default=20_000)
+    parser.add_argument("--replay", type=str, help="Collect and evaluate on a recorded trace instead of the game")
+    parser.add_argument("--step-hz", type=float)
+    parser.add_argument("--out", type=str, default="models/student.pth")
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--lr", type=float, default=1e-3)
+    parser.add_argument("--temperature", type=float, default=1.0)
+    parser.add_argument("--value-coef", type=float, default=0.5)
+    parser.add_argument("--hidden-dim", type=int, default=64)
+    parser.add_argument("--channels", type=int, nargs=3, default=[8, 16, 16])
+    parser.add_argument("--holdout", type=float, default=0.1, help="Fraction of steps (the last ones) kept for agreement")
+    parser.add_argument("--eval-episodes", type=int, default=0, help="Episodes to measure each policy's win rate on")
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    teacher = Teacher(args.teacher, args.device)
+    env_kwargs = {"replay": args.replay, "step_hz": args.step_hz}
+
+    recordings = [Recording(path) for path in args.recording]
+    if args.collect:
+        recordings.append(collect(teacher, args.collect, args.collect_steps, **env_kwargs))
+    if not recordings:
+        parser.error("Give --recording and/or --collect.")
+
+    # The teacher's inputs decide how deep recorded steps are stacked
+    n_stack = teacher.channels // recordings[0]["frame"].shape[-1]
+    if teacher.state_dim != recordings[0]["stats"].shape[-1] * n_stack:
+        raise ValueError(f'Teacher expects {teacher.state_dim} stats, the recordings stacked {n_stack} deep give '
+                         f'{recordings[0]["stats"].shape[-1] * n_stack}.')
+
+    data = StackedObservations(recordings, n_stack)
+    split = int(len(data) * (1 - args.holdout))
+    train_indices, test_indices = np.arange(split), np.arange(split, len(data))
+    print(f'Distilling on {split} steps, holding out {len(test_indices)} (stack {n_stack})')
+
+    student = distill(
+        teacher, data, train_indices, epochs=args.epochs, batch_size=args.batch_size, lr=args.lr,
+        temperature=args.temperature, value_coef=args.value_coef, hidden_dim=args.hidden_dim,
+        channels=args.channels, device=args.device
+    )
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    student.save(args.out)
+
+    # Report
+    print(f'Agreement (held out): {agreement(teacher, student, data, test_indices):.3f}')
+
+    teacher_params, student_params = teacher.params(), sum(p.numel() for p in student.policy.parameters())
+    print(f'Params: teacher {teacher_params:,}  student {student_params:,}  ({teacher_params / student_params:.1f}x smaller)')
+    print(f'Checkpoint: teacher {os.path.getsize(args.teacher) / 2**20:.2f} MiB  '
+          f'student {os.path.getsize(args.out) / 2**20:.2f} MiB')
+
+    stats, frame = data.batch([len(data) - 1])
+    obs = {"stats": stats[0].numpy(), "frame": frame[0].numpy()}
+    teacher_engine = InferenceEngine.from_checkpoint(args.teacher, threads=1)
+    if teacher.sb3:
+        # SB3 policies take the frame channel-first
+        obs_teacher = {"stats": obs["stats"], "frame": np.moveaxis(obs["frame"], -1, 0)}
+    else:
+        obs_teacher = obs
+    teacher_p50, teacher_p99 = latency_ms(teacher_engine, obs_teacher)
+    student_p50, student_p99 = latency_ms(InferenceEngine.from_checkpoint(args.out, threads=1), obs)
+    print(f'Latency (1 thread): teacher p50 {teacher_p50:.2f} ms p99 {teacher_p99:.2f} ms  '
+          f'student p50 {student_p50:.2f} ms p99 {student_p99:.2f} ms')
+
+    if args.eval_episodes:
+        student_engine = InferenceEngine.from_checkpoint(args.out)
+        print(f'Win rate over {args.eval_episodes} episodes: '
+              f'teacher {win_rate(teacher.act, args.eval_episodes, teacher.channels, **env_kwargs):.2f}  '
+              f'student {win_rate(student_engine.act, args.eval_episodes, teacher.channels, **env_kwargs):.2f}')
@@ -0,0 +1,93 @@
+import numpy as np
+import gymnasium as gym
+from gymnasium import spaces
+
+
+class FrameStack(gym.Wrapper):
+    '''
+    Stacks the last n_stack observations of a DS3Env, frames channel-first, in place of
+    VecFrameStack(n_stack, channels_order="last") + VecTransposeImage. The stacked observation is
+    the same, channel j * C + c is channel c of the j-th oldest frame, so models trained with
+    either can be loaded with the other.
+
+    Frames are written (transposed on the way in) once each into a buffer of capacity + 2 * n_stack
+    slots, and the observation is a view of the last n_stack of them. When the buffer runs out the
+    newest n_stack - 1 frames are moved to the front, so that copy is paid once every ~capacity steps.
+    Returned views are overwritten once the buffer wraps around, capacity or more writes later
+    (SB3's vec envs copy them anyway).
+    A reset zero-fills the stack like VecFrameStack, without touching the views already returned.
+    stack_stats stacks 'stats' the same way (VecFrameStack stacks every key).
+
+    Ex:
+        env = FrameStack(DS3Env(), n_stack=4)
+        obs, info = env.reset()  # obs['frame'].shape == (4, 128, 128)
+    '''
+
+    def __init__(self, env, n_stack=4, stack_stats=True, capacity=64):
+        super().__init__(env)
+        self.n_stack = n_stack
+        self.stack_stats = stack_stats
+
+        frame_space = env.observation_space['frame']
+        stats_space = env.observation_space['stats']
+        height, width, channels = frame_space.shape
+        slots = capacity + 2 * n_stack
+        self._frames = np.zeros((slots, channels, height, width), dtype=frame_space.dtype)
+        self._stats = np.zeros((slots, *stats_space.shape), dtype=stats_space.dtype)
+        # One past the newest frame
+        self._end = n_stack
+
+        spaces_ = dict(env.observation_space.spaces)
+        spaces_['frame'] = spaces.Box(
+            low=np.moveaxis(np.tile(frame_space.low, n_stack), -1, 0),
+            high=np.moveaxis(np.tile(frame_space.high, n_stack), -1, 0),
+            dtype=frame_space.dtype
+        )
+        if stack_stats:
+            spaces_['stats'] = spaces.Box(
+                low=np.tile(stats_space.low, n_stack), high=np.tile(stats_space.high, n_stack),
+                dtype=stats_space.dtype
+            )
+        self.observation_space = spaces.Dict(spaces_)
+
+
+    def _compact(self, keep):
+        '''Moves the newest keep slots to the front of the buffer'''
+        if keep:
+            self._frames[:keep] = self._frames[self._end - keep:self._end]
+            self._stats[:keep] = self._stats[self._end - keep:self._end]
+        self._end = keep
+
+
+    def _push(self, obs):
+        if self._end == len(self._frames):
+            self._compact(self.n_stack - 1)
+
+        np.copyto(self._frames[self._end], np.moveaxis(obs['frame'], -1, 0))
+        self._stats[self._end] = obs['stats']
+        self._end += 1
+
+        start = self._end - self.n_stack
+        stacked = dict(obs)
+        stacked['frame'] = self._frames[start:self._end].reshape(-1, *self._frames.shape[2:])
+        if self.stack_stats:
+            stacked['stats'] = self._stats[start:self._end].reshape(-1)
+        return stacked
+
+
+    def reset(self, **kwargs):
+        obs, info = self.env.reset(**kwargs)
+
+        # Fresh zeroed slots for the new episode, after the ones already handed out
+        if self._end + self.n_stack > len(self._frames):
+            self._compact(0)
+        pad = slice(self._end, self._end + self.n_stack - 1)
+        self._frames[pad] = 0
+        self._stats[pad] = 0
+        self._end = pad.stop
+        return self._push(obs), info
+
+
+    def step(self, action):
+        obs, reward, terminated, truncated, info = self.env.step(action)
+        return self._push(obs), reward, terminated, truncated, info
@@ -0,0 +1,168 @@
+import json
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from ppo_agent import ActorCritic
+
+
+# Stored next to the TorchScript graph, load() needs the input shapes to preallocate
+_SHAPES_FILE = "input_shapes.json"
+
+
+class AgentActor(nn.Module):
+    '''Action probabilities of a PPOAgent ActorCritic, taking frames as the env emits them (N, H, W, C)'''
+
+    def __init__(self, policy):
+        super().__init__()
+        self.policy = policy
+
+
+    def forward(self, stats, frame):
+        action_probs, _ = self.policy(stats, frame.permute(0, 3, 1, 2))
+        return action_probs
+
+
+class SB3Actor(nn.Module):
+    '''
+    Action probabilities of an SB3 MultiInputPolicy with only the actor half of the network.
+    Frames come in the way the policy sees them (after VecFrameStack and VecTransposeImage).
+    '''
+
+    def __init__(self, policy):
+        super().__init__()
+        from stable_baselines3.common.preprocessing import preprocess_obs
+
+        self._preprocess = preprocess_obs
+        self.observation_space = policy.observation_space
+        self.normalize_images = policy.normalize_images
+        self.features_extractor = policy.pi_features_extractor
+        self.mlp_extractor = policy.mlp_extractor
+        self.action_net = policy.action_net
+
+
+    def forward(self, stats, frame):
+        obs = self._preprocess({"stats": stats, "frame": frame}, self.observation_space, self.normalize_images)
+        latent = self.mlp_extractor.forward_actor(self.features_extractor(obs))
+        return F.softmax(self.action_net(latent), dim=-1)
+
+
+def load_actor(path):
+    '''
+    (actor module, stats shape, frame shape) from a PPOAgent.save checkpoint or an SB3 .zip.
+    Checkpoints from before the network kwargs were saved are rebuilt as the old 400x400x3 network.
+    '''
+
+    if str(path).endswith(".zip"):
+        from stable_baselines3 import PPO
+
+        policy = PPO.load(path, device="cpu").policy
+        space = policy.observation_space
+        return SB3Actor(policy), space["stats"].shape, space["frame"].shape
+
+    checkpoint = torch.load(path, map_location="cpu")
+    state = checkpoint["policy_state_dict"]
+    kwargs = checkpoint.get("policy_kwargs")
+    if kwargs is None:
+        action_dim, hidden_dim = state["actor.weight"].shape
+        kwargs = {
+            "state_dim": state["fc1.weight"].shape[1] - 64 * 46 * 46,
+            "action_dim": action_dim,
+            "hidden_dim": hidden_dim
+        }
+
+    policy = ActorCritic(**kwargs)
+    policy.load_state_dict(state)
+    channels, height, width = policy.frame_shape
+    return AgentActor(policy), (kwargs["state_dim"],), (height, width, channels)
+
+
+class InferenceEngine:
+    '''
+    Fast action selection for play and evaluation.
+
+    The actor is (optionally) quantized, traced to TorchScript, frozen and then called under
+    inference_mode on input tensors that are allocated once and filled in place each call.
+    quantize=True converts the Linear layers to dynamic int8. threads sets torch's intra-op threads
+    for the engine's own calls only (one or two is usually fastest for a single observation): the
+    process-wide setting is switched around each call and put back, so training in the same process
+    keeps its threads. None leaves the setting alone.
+
+    Ex:
+        engine = InferenceEngine.from_checkpoint("models/best_model.zip", threads=1)
+        action = engine.act(obs)
+        engine.save("models/policy.ts")
+    '''
+
+    def __init__(self, actor, stats_shape, frame_shape, threads=None, quantize=False):
+        self.threads = threads
+        actor = actor.eval()
+        if quantize:
+            actor = torch.ao.quantization.quantize_dynamic(actor, {nn.Linear}, dtype=torch.qint8)
+
+        self.stats_shape = tuple(stats_shape)
+        self.frame_shape = tuple(frame_shape)
+        self._stats = torch.zeros((1, *self.stats_shape), dtype=torch.float32)
+        self._frame = torch.zeros((1, *self.frame_shape), dtype=torch.uint8)
+
+        if isinstance(actor, torch.jit.ScriptModule):
+            self.traced = actor
+        else:
+            with torch.no_grad():
+                self.traced = torch.jit.trace(actor, (self._stats, self._frame))
+        self.module = torch.jit.optimize_for_inference(torch.jit.freeze(self.traced.eval()))
+        self.actor = actor
+        self._generator = torch.Generator()
+
+
+    @classmethod
+    def from_checkpoint(cls, path, **kwargs):
+        actor, stats_shape, frame_shape = load_actor(path)
+        return cls(actor, stats_shape, frame_shape, **kwargs)
+
+
+    @classmethod
+    def load(cls, path, threads=None):
+        '''Engine for a TorchScript file written by save()'''
+        extra = {_SHAPES_FILE: ""}
+        module = torch.jit.load(path, map_location="cpu", _extra_files=extra)
+        shapes = json.loads(extra[_SHAPES_FILE])
+        return cls(module, shapes["stats"], shapes["frame"], threads=threads)
+
+
+    def save(self, path):
+        '''TorchScript file loadable with InferenceEngine.load (or torch.jit.load) without this repo'''
+        shapes = json.dumps({"stats": self.stats_shape, "frame": self.frame_shape})
+        torch.jit.save(self.traced, path, _extra_files={_SHAPES_FILE: shapes})
+
+
+    def export_onnx(self, path):
+        '''ONNX graph with inputs "stats" and "frame" and output "action_probs", batch size 1. Needs onnx installed.'''
+        torch.onnx.export(
+            self.actor, (self._stats, self._frame), path,
+            input_names=["stats", "frame"], output_names=["action_probs"]
+        )
+
+
+    def probs(self, obs):
+        previous = torch.get_num_threads()
+        if self.threads and self.threads != previous:
+            torch.set_num_threads(self.threads)
+        try:
+            with torch.inference_mode():
+                self._stats[0].copy_(torch.from_numpy(np.asarray(obs["stats"], dtype=np.float32)))
+                self._frame[0].copy_(torch.from_numpy(np.asarray(obs["frame"], dtype=np.uint8)))
+                return self.module(self._stats, self._frame)[0]
+        finally:
+            if self.threads and self.threads != previous:
+                torch.set_num_threads(previous)
+
+
+    def act(self, obs, deterministic=True):
+        probs = self.probs(obs)
+        if deterministic:
+            return int(probs.argmax())
+        return int(torch.multinomial(probs, 1, generator=self._generator))
+
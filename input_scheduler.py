@@ -0,0 +1,226 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# Event kinds. An event is (offset in seconds from submission, kind, arg).
+PRESS = "press"
+RELEASE = "release"
+STICK = "stick"
+RESET = "reset"
+NOOP = "noop"
+
+
+def tap(button, hold, at=0.0):
+    '''Press button at `at`, release it hold seconds later'''
+    return [(at, PRESS, button), (at + hold, RELEASE, button)]
+
+
+def precise_sleep_until(deadline, spin=0.002):
+    '''
+    Sleeps until deadline (time.perf_counter) with sub-millisecond accuracy:
+    time.sleep for most of the wait, then spins for the last `spin` seconds.
+    '''
+
+    remaining = deadline - time.perf_counter()
+    if remaining > spin:
+        time.sleep(remaining - spin)
+    while time.perf_counter() < deadline:
+        pass
+
+
+class ActionHandle:
+    '''Returned by InputScheduler.submit. Done once the action's last event was sent.'''
+
+    def __init__(self, end):
+        self.end = end
+        self._event = threading.Event()
+        self._remaining = 0
+
+
+    @property
+    def done(self):
+        return self._event.is_set()
+
+
+    def wait(self, timeout=None):
+        return self._event.wait(timeout)
+
+
+class FakeGamepad:
+    '''Stand-in for vgamepad.VX360Gamepad that records every update and the state it sent'''
+
+    def __init__(self):
+        self.buttons = set()
+        self.stick = (0.0, 0.0)
+        self.updates = []
+
+
+    def press_button(self, button):
+        self.buttons.add(button)
+
+
+    def release_button(self, button):
+        self.buttons.discard(button)
+
+
+    def left_joystick_float(self, x_value_float, y_value_float):
+        self.stick = (x_value_float, y_value_float)
+
+
+    def reset(self):
+        self.buttons.clear()
+        self.stick = (0.0, 0.0)
+
+
+    def update(self):
+        self.updates.append((time.perf_counter(), frozenset(self.buttons), self.stick))
+
+
+class InputScheduler:
+    '''
+    Sends timed gamepad events from a background thread so actions do not block the caller.
+    Events that are due together are applied with a single gamepad.update().
+    Intended and actual send times are recorded to measure jitter.
+
+    Ex:
+        inputs = InputScheduler(gamepad).start()
+        handle = inputs.submit(tap(vg.XUSB_BUTTON.XUSB_GAMEPAD_B, 0.05))
+        ...
+        handle.wait()
+    '''
+
+    def __init__(self, gamepad, spin=0.002, coalesce=0.0005, log_size=10000):
+        self.gamepad = gamepad
+        self.spin = spin
+        # Events due within this window of each other go out in the same update
+        self.coalesce = coalesce
+        self.log = deque(maxlen=log_size)
+        self.updates = 0
+
+        self._queue = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+
+    def start(self):
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="InputScheduler", daemon=True)
+            self._thread.start()
+        return self
+
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+    def submit(self, events, start=None):
+        '''
+        Queues events [(offset, kind, arg), ...] relative to start (time.perf_counter, default now)
+        and returns an ActionHandle right away.
+        '''
+
+        start = time.perf_counter() if start is None else start
+        end = start + max((offset for offset, _, _ in events), default=0.0)
+        handle = ActionHandle(end)
+        handle._remaining = len(events)
+        if not events:
+            handle._event.set()
+            return handle
+
+        with self._cond:
+            for offset, kind, arg in events:
+                heapq.heappush(self._queue, (start + offset, next(self._seq), kind, arg, handle))
+            self._cond.notify()
+
+        return handle
+
+
+    def release_all(self):
+        '''Neutral gamepad state as soon as possible, dropping anything still queued'''
+        with self._cond:
+            for *_, handle in self._queue:
+                handle._event.set()
+            self._queue.clear()
+        return self.submit([(0.0, RESET, None)])
+
+
+    @property
+    def pending(self):
+        return len(self._queue)
+
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._queue:
+                    self._cond.wait()
+                if not self._running:
+                    return
+
+                due = self._queue[0][0]
+                wait = due - time.perf_counter() - self.spin
+                if wait > 0:
+                    # A new, earlier event can arrive while waiting
+                    self._cond.wait(wait)
+                    continue
+
+            precise_sleep_until(due, self.spin)
+
+            with self._cond:
+                batch = []
+                limit = time.perf_counter() + self.coalesce
+                while self._queue and self._queue[0][0] <= limit:
+                    batch.append(heapq.heappop(self._queue))
+
+            self._send(batch)
+
+
+    def _send(self, batch):
+        for _, _, kind, arg, _ in batch:
+            if kind == PRESS:
+                self.gamepad.press_button(button=arg)
+            elif kind == RELEASE:
+                self.gamepad.release_button(button=arg)
+            elif kind == STICK:
+                self.gamepad.left_joystick_float(x_value_float=arg[0], y_value_float=arg[1])
+            elif kind == RESET:
+                self.gamepad.reset()
+
+        if any(kind != NOOP for _, _, kind, _, _ in batch):
+            self.gamepad.update()
+            self.updates += 1
+
+        sent = time.perf_counter()
+        for intended, _, kind, _, handle in batch:
+            self.log.append((intended, sent, kind))
+            handle._remaining -= 1
+            if handle._remaining <= 0:
+                handle._event.set()
+
+
+    def jitter(self):
+        '''Lateness (actual - intended send time) over the recorded events, in seconds'''
+        if not self.log:
+            return {}
+
+        late = np.array([sent - intended for intended, sent, _ in self.log])
+        return {
+            "events": len(late),
+            "updates": self.updates,
+            "mean": float(late.mean()),
+            "p50": float(np.percentile(late, 50)),
+            "p99": float(np.percentile(late, 99)),
+            "max": float(late.max())
+        }
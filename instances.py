@@ -0,0 +1,71 @@
+import functools
+
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv
+
+try:
+    import win32gui
+    import win32process
+except ImportError:
+    # Instances can only be discovered on Windows. Descriptors can still be built by hand.
+    win32gui = None
+
+
+class GameInstance:
+    '''
+    Which running game a DS3Env drives.
+        pid             process to read memory from (None: the first DarkSoulsIII.exe)
+        hwnd            window to capture (None: looked up by title)
+        gamepad_index   virtual gamepad to send inputs with, see controller.gamepad_for
+        capture_region  fixed {"left", "top", "width", "height"} to grab instead of the window
+    Plain data so it can be sent to worker processes.
+    '''
+
+    __slots__ = ("pid", "hwnd", "gamepad_index", "capture_region")
+
+
+    def __init__(self, pid=None, hwnd=None, gamepad_index=None, capture_region=None):
+        self.pid = pid
+        self.hwnd = hwnd
+        self.gamepad_index = gamepad_index
+        self.capture_region = capture_region
+
+
+    def __repr__(self):
+        fields = ", ".join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)
+        return f'{type(self).__name__}({fields})'
+
+
+def find_instances(title="DARK SOULS III"):
+    '''One GameInstance per visible game window, ordered by pid, each with its own gamepad index'''
+    if win32gui is None:
+        raise RuntimeError("Finding game instances needs pywin32 (Windows only).")
+
+    windows = []
+    def collect(hwnd, _):
+        if win32gui.IsWindowVisible(hwnd) and win32gui.GetWindowText(hwnd) == title:
+            _, pid = win32process.GetWindowThreadProcessId(hwnd)
+            windows.append((pid, hwnd))
+        return True
+
+    win32gui.EnumWindows(collect, None)
+    return [GameInstance(pid=pid, hwnd=hwnd, gamepad_index=i) for i, (pid, hwnd) in enumerate(sorted(windows))]
+
+
+def launch(instances, make_env, start_method=None):
+    '''
+    Vectorized env with one worker process per instance. make_env(instance, rank) is called
+    inside the worker, so every instance gets its own memory handle, capture thread and gamepad,
+    and steps of different games run in parallel. A single instance stays in-process.
+
+    Instances can be anything make_env understands, e.g. None for stand-in ReplayEnvs.
+
+    Ex:
+        env = launch(find_instances(), lambda instance, rank: Monitor(DS3Env(instance=instance)))
+    '''
+
+    env_fns = [functools.partial(make_env, instance, rank) for rank, instance in enumerate(instances)]
+    if not env_fns:
+        raise ValueError("No game instances to launch.")
+    if len(env_fns) == 1:
+        return DummyVecEnv(env_fns)
+    return SubprocVecEnv(env_fns, start_method=start_method)
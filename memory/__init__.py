@@ -1,5 +1,18 @@
 from .utils import BOSSES, ANIMATIONS
 from .entity import Entity
 from .ds3_reader import DS3Reader
+from .snapshot import EntitySnapshot, GameSnapshot, SNAPSHOT_DTYPE
+from .backend import MemoryBackend, PymemBackend, FakeMemory, MemoryAccessError
+from .attach import AttachManager, ProcessDetached, ATTACHED, DETACHED
+from .chain_cache import ChainCache
+from .entity_index import EntityIndex
+from .fake import FakeDS3
+from .restore import StateRestorer, RestoreFailed
+from .game_clock import GameClock
+from .sampler import MemorySampler
 
-__all__ = [BOSSES, ANIMATIONS, Entity, DS3Reader]
\ No newline at end of file
+__all__ = [
+    "BOSSES", "ANIMATIONS", "Entity", "DS3Reader", "EntitySnapshot", "GameSnapshot", "SNAPSHOT_DTYPE",
+    "MemoryBackend", "PymemBackend", "FakeMemory", "MemoryAccessError", "AttachManager", "ProcessDetached",
+    "ATTACHED", "DETACHED", "ChainCache", "EntityIndex", "FakeDS3", "StateRestorer", "RestoreFailed", "GameClock", "MemorySampler"
+]
@@ -0,0 +1,158 @@
+from .backend import MemoryBackend, MemoryAccessError, PymemBackend
+
+import threading
+import time
+
+# Events passed to AttachManager subscribers
+ATTACHED = "attached"
+DETACHED = "detached"
+
+
+class ProcessDetached(MemoryAccessError):
+    """The game process is gone, or not there yet. Raised until a reattach succeeds."""
+
+
+class AttachManager(MemoryBackend):
+    """
+    Backend that attaches to the game on first use instead of at construction, and survives
+    the game crashing or being restarted.
+
+    When a read fails, the process handle is checked. If the process exited, the manager detaches,
+    notifies its subscribers and raises ProcessDetached. Later accesses try to attach again
+    (connect()), waiting backoff seconds between failed attempts, doubling up to max_backoff.
+    Every successful attach bumps generation, so addresses cached for an older one can be dropped.
+
+    Ex:
+        backend = AttachManager(lambda: PymemBackend(pid=1234))
+        backend.subscribe(lambda event, manager: print(event, manager.generation))
+    """
+
+    def __init__(self, connect=PymemBackend, backoff=0.5, max_backoff=30.0):
+        self.connect = connect
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.backend = None
+        self.generation = 0
+        self.detaches = 0
+        self.failed_attempts = 0
+
+        self._delay = backoff
+        self._next_attempt = 0.0
+        self._listeners = []
+        self._lock = threading.Lock()
+
+
+    def subscribe(self, callback):
+        """callback(event, manager) on ATTACHED and DETACHED. Called from whichever thread noticed."""
+        self._listeners.append(callback)
+
+
+    @property
+    def attached(self):
+        return self.backend is not None
+
+
+    def attach(self):
+        """The backend of the current process, attaching first if the backoff allows it."""
+        backend = self.backend
+        if backend is not None:
+            return backend
+
+        with self._lock:
+            if self.backend is not None:
+                return self.backend
+
+            now = time.monotonic()
+            if now < self._next_attempt:
+                raise ProcessDetached(f'Not attached to the game, next attempt in {self._next_attempt - now:.1f}s.')
+
+            try:
+                backend = self.connect()
+            except Exception as e:
+                self.failed_attempts += 1
+                self._next_attempt = now + self._delay
+                self._delay = min(self._delay * 2, self.max_backoff)
+                raise ProcessDetached("Could not attach to the game process.") from e
+
+            self.backend = backend
+            self.generation += 1
+            self._delay = self.backoff
+
+        self._emit(ATTACHED)
+        return backend
+
+
+    def check(self):
+        """True if attached to a live process. Detaches if the process exited."""
+        backend = self.backend
+        if backend is None:
+            return False
+        if backend.is_alive():
+            return True
+
+        self._detach(backend)
+        return False
+
+
+    def _detach(self, backend):
+        with self._lock:
+            if self.backend is not backend:
+                # Someone else already noticed
+                return
+            self.backend = None
+            self.detaches += 1
+            # The first attempt is right away, a restarted game may already be up
+            self._next_attempt = 0.0
+
+        self._emit(DETACHED)
+
+
+    def _emit(self, event):
+        for callback in self._listeners:
+            callback(event, self)
+
+
+    def _failed(self, backend, error):
+        # Failed accesses are where a dead process shows up, the handle tells which it is
+        if not backend.is_alive():
+            self._detach(backend)
+            raise ProcessDetached("The game process exited.") from error
+        raise error
+
+
+    @property
+    def module_base(self):
+        return self.attach().module_base
+
+
+    @property
+    def module_size(self):
+        return self.attach().module_size
+
+
+    def is_alive(self):
+        return self.check()
+
+
+    def read_bytes(self, addr, length):
+        backend = self.attach()
+        try:
+            return backend.read_bytes(addr, length)
+        except MemoryAccessError as e:
+            self._failed(backend, e)
+
+
+    def write_bytes(self, addr, data):
+        backend = self.attach()
+        try:
+            backend.write_bytes(addr, data)
+        except MemoryAccessError as e:
+            self._failed(backend, e)
+
+
+    def pattern_scan(self, pattern):
+        backend = self.attach()
+        try:
+            return backend.pattern_scan(pattern)
+        except MemoryAccessError as e:
+            self._failed(backend, e)
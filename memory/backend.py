@@ -0,0 +1,233 @@
+import bisect
+import re
+import struct
+import time
+
+try:
+    import ctypes
+    import pymem
+except ImportError:
+    # Only available on Windows. The fake backend works without it.
+    pymem = None
+
+
+# GetExitCodeProcess result of a process that is still running
+STILL_ACTIVE = 259
+
+
+class MemoryAccessError(Exception):
+    pass
+
+
+class MemoryBackend:
+    """
+    Minimal interface the readers need from a process' address space.
+    Subclasses only have to implement read_bytes/write_bytes and pattern_scan,
+    the typed helpers below are built on top of them.
+    """
+
+    module_base = 0
+    module_size = 0
+
+
+    def read_bytes(self, addr, length):
+        raise NotImplementedError
+
+
+    def write_bytes(self, addr, data):
+        raise NotImplementedError
+
+
+    def pattern_scan(self, pattern):
+        """Returns the address of the first match of pattern in the main module, or None."""
+        raise NotImplementedError
+
+
+    def is_alive(self):
+        """False once the process behind this backend has exited."""
+        return True
+
+
+    def read_int(self, addr):
+        return struct.unpack("<i", self.read_bytes(addr, 4))[0]
+
+
+    def read_float(self, addr):
+        return struct.unpack("<f", self.read_bytes(addr, 4))[0]
+
+
+    def read_longlong(self, addr):
+        return struct.unpack("<q", self.read_bytes(addr, 8))[0]
+
+
+    def write_int(self, addr, value):
+        self.write_bytes(addr, struct.pack("<i", value))
+
+
+    def write_float(self, addr, value):
+        self.write_bytes(addr, struct.pack("<f", value))
+
+
+    def write_longlong(self, addr, value):
+        self.write_bytes(addr, struct.pack("<q", value))
+
+
+class PymemBackend(MemoryBackend):
+    """
+    Reads and writes the memory of a live process through pymem.
+    Attaches to the first process called process_name, or to a specific one by pid
+    when several instances of the game are running.
+    """
+
+    def __init__(self, process_name="DarkSoulsIII.exe", pid=None):
+        if pymem is None:
+            raise MemoryAccessError("pymem is not installed, cannot attach to a live process.")
+
+        if pid is None:
+            self.pm = pymem.Pymem(process_name)
+        else:
+            self.pm = pymem.Pymem()
+            self.pm.open_process_from_id(pid)
+        self.pid = self.pm.process_id
+        self.module = pymem.process.module_from_name(self.pm.process_handle, process_name)
+        self.module_base = self.module.lpBaseOfDll
+        self.module_size = self.module.SizeOfImage
+
+
+    @property
+    def process_handle(self):
+        return self.pm.process_handle
+
+
+    def is_alive(self):
+        # The handle keeps pointing at the exited process, a restarted game is a new process
+        code = ctypes.c_ulong()
+        if not ctypes.windll.kernel32.GetExitCodeProcess(self.pm.process_handle, ctypes.byref(code)):
+            return False
+        return code.value == STILL_ACTIVE
+
+
+    def read_bytes(self, addr, length):
+        try:
+            return self.pm.read_bytes(addr, length)
+        except Exception as e:
+            raise MemoryAccessError(f'Could not read {length} bytes at {hex(addr)}.') from e
+
+
+    def write_bytes(self, addr, data):
+        try:
+            self.pm.write_bytes(addr, data, len(data))
+        except Exception as e:
+            raise MemoryAccessError(f'Could not write {len(data)} bytes at {hex(addr)}.') from e
+
+
+    def pattern_scan(self, pattern):
+        return pymem.pattern.pattern_scan_module(
+            self.pm.process_handle,
+            self.module,
+            pattern,
+            return_multiple=False
+        )
+
+
+class FakeMemory(MemoryBackend):
+    """
+    In-process stand-in for a game's address space, made of sparse mapped regions.
+    Counts every read/write and can simulate the latency of a cross-process read,
+    so the cost of the memory layer can be measured without the game.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.alive = True
+        self._bases = []
+        self._regions = {}
+        self.reset_counters()
+
+
+    def reset_counters(self):
+        self.reads = 0
+        self.bytes_read = 0
+        self.writes = 0
+        self.bytes_written = 0
+
+
+    def map(self, addr, size):
+        """Maps a zeroed region of size bytes at addr."""
+        return self._map(addr, bytearray(size))
+
+
+    def map_module(self, addr, image):
+        """Maps image at addr and makes it the module pattern_scan searches."""
+        self._map(addr, bytearray(image))
+        self.module_base = addr
+        self.module_size = len(image)
+        return addr
+
+
+    def kill(self):
+        """Simulates the process exiting: every access fails from now on."""
+        self.alive = False
+
+
+    def is_alive(self):
+        return self.alive
+
+
+    def unmap(self, addr):
+        del self._regions[addr]
+        self._bases.remove(addr)
+
+
+    def _map(self, addr, buf):
+        if addr not in self._regions:
+            bisect.insort(self._bases, addr)
+        self._regions[addr] = buf
+        return addr
+
+
+    def _region(self, addr, length):
+        if not self.alive:
+            raise MemoryAccessError("The process has exited.")
+
+        i = bisect.bisect_right(self._bases, addr) - 1
+        if i >= 0:
+            base = self._bases[i]
+            buf = self._regions[base]
+            if addr + length <= base + len(buf):
+                return buf, addr - base
+
+        raise MemoryAccessError(f'Address {hex(addr)} (+{length}) is not mapped.')
+
+
+    def read_bytes(self, addr, length):
+        self.reads += 1
+        self.bytes_read += length
+        if self.latency:
+            _busy_wait(self.latency)
+
+        buf, off = self._region(addr, length)
+        return bytes(buf[off:off + length])
+
+
+    def write_bytes(self, addr, data):
+        self.writes += 1
+        self.bytes_written += len(data)
+        if self.latency:
+            _busy_wait(self.latency)
+
+        buf, off = self._region(addr, len(data))
+        buf[off:off + len(data)] = data
+
+
+    def pattern_scan(self, pattern):
+        buf, _ = self._region(self.module_base, self.module_size)
+        match = re.search(pattern, bytes(buf), re.DOTALL)
+        return self.module_base + match.start() if match else None
+
+
+def _busy_wait(seconds):
+    # time.sleep is far too coarse for microsecond latencies
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
@@ -0,0 +1,66 @@
+from .backend import MemoryAccessError
+
+
+class ChainCache:
+    """
+    Remembers resolved pointer chains (or anything built from them) so they are not walked again.
+    Each entry is guarded by sentinels: (address, expected bytes) pairs that are re-read on lookup.
+    If any sentinel changed, e.g. after a load screen, the entry is dropped and has to be re-resolved.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+
+    def lookup(self, key):
+        """Returns the cached value for key if all its sentinels still hold, otherwise None."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, sentinels = entry
+        if self._validate(sentinels):
+            self.hits += 1
+            return value
+
+        # An invalidate() from another thread may have dropped it already
+        self._entries.pop(key, None)
+        self.invalidations += 1
+        self.misses += 1
+        return None
+
+
+    def store(self, key, value, sentinels):
+        self._entries[key] = (value, tuple(sentinels))
+        return value
+
+
+    def invalidate(self):
+        """Drops every entry. Use when the process itself went away."""
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries)
+        }
+
+
+    def _validate(self, sentinels):
+        try:
+            for addr, expected in sentinels:
+                if self.backend.read_bytes(addr, len(expected)) != expected:
+                    return False
+        except MemoryAccessError:
+            return False
+
+        return True
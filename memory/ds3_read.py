@@ -1,45 +1,57 @@
-from .utils import *
-import pymem
+from .utils import BOSSES
+from .ds3_reader import DS3Reader
+from .backend import MemoryAccessError
+
 import os
+import time
 
-ds3 = pymem.Pymem("DarkSoulsIII.exe")
-module = pymem.process.module_from_name(ds3.process_handle, "DarkSoulsIII.exe")
+# Live view of player and boss stats: python -m memory.ds3_read
+# Attaches on first read and keeps going through load screens and game restarts.
 
-# These are all pointers. Saved in memory to reduce recomputing.
-world_chr_man = get_world_chr_man(ds3, module)
-player_stats = follow_chain(ds3, world_chr_man, [0x80, 0x1F90, 0x18])
-player_curr_hp = player_stats + 0xD8
-player_max_hp = player_stats + 0xDC
-player_curr_sp = player_stats + 0xF0
-player_max_sp = player_stats + 0xF4
 
-iudex_gundyr = get_entity(ds3, world_chr_man, IUDEX_GUNDYR)
-iudex_curr_hp = iudex_gundyr + 0xD8
-iudex_max_hp = iudex_gundyr + 0xDC
+def show(reader):
+    snapshot = reader.snapshot()
+    player, boss = snapshot.player, snapshot.boss
 
-os.system("cls" if os.name == "nt" else "clear")
-print("\033[?25l", end="")
-while True:
     print("\033[H", end="")
-    
     print("----- Game Info ------")
     print("\033[K", end="")
-    print(f'Player Current HP: {ds3.read_int(player_curr_hp)}')
+    print(f'Player Current HP: {player.hp}')
     print("\033[K", end="")
-    print(f'Player Max HP: {ds3.read_int(player_max_hp)}')
-    
+    print(f'Player Max HP: {player.max_hp}')
+
     # Neccessary to avoid weird visual bug when SP becomes negative
     print("\033[K", end="")
-    print(f'Player Current SP: {ds3.read_int(player_curr_sp)}')
+    print(f'Player Current SP: {player.sp}')
 
     print("\033[K", end="")
-    print(f'Player Max SP: {ds3.read_int(player_max_sp)}')
+    print(f'Player Max SP: {player.max_sp}')
     print()
     print("\033[K", end="")
-    print(f'Boss Current HP: {ds3.read_int(iudex_curr_hp)}')
+    print(f'Boss Current HP: {boss.hp}')
     print("\033[K", end="")
-    print(f'Boss Max HP: {ds3.read_int(iudex_max_hp)}')
+    print(f'Boss Max HP: {boss.max_hp}')
     print("\033[K", end="")
-    print(f'Boss Current HP: {ds3.read_int(iudex_gundyr + 0xF0)}')
+    print(f'Boss Current SP: {boss.sp}')
     print("\033[K", end="")
-    print(f'Boss Max SP: {ds3.read_int(iudex_gundyr + 0xF4)}')
+    print(f'Boss Max SP: {boss.max_sp}')
+
+
+def main(interval=0.05):
+    reader = DS3Reader(BOSSES.IUDEX_GUNDYR)
+
+    os.system("cls" if os.name == "nt" else "clear")
+    print("\033[?25l", end="")
+    while True:
+        try:
+            reader.initialize()
+            show(reader)
+        except (MemoryAccessError, ValueError) as e:
+            # Not attached yet, the game restarted or a load screen is up
+            print("\033[H\033[J", end="")
+            print(f'Waiting for the game... ({e})')
+        time.sleep(interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,86 @@
-from .utils import WORLD_CHR_MAN_PATTERN
+from .utils import WORLD_CHR_MAN_PATTERN, GAME_FLIPPER_PATTERN, GAME_SPEED_OFFSET
 from .entity import Entity
+from .attach import AttachManager
+from .snapshot import GameSnapshot
+from .chain_cache import ChainCache
+from .scanner import OffsetCache, find_signature
+from .entity_index import EntityIndex
+from .game_clock import GameClock
 
-import pymem
+import math
+import struct
+import threading
 
 
 class DS3Reader:
+    # Speeds set_time_scale accepts, and expects to find before writing
+    MAX_TIME_SCALE = 10.0
 
-    ds3 = pymem.Pymem("DarkSoulsIII.exe");
-    module = pymem.process.module_from_name(ds3.process_handle, "DarkSoulsIII.exe")
+    def __init__(self, enemy, debug=False, backend=None, offset_cache=None):
+        """
+        enemy is an identifier from BOSSES, or a list of them to track several enemies at once.
+        The first one is exposed as boss, all of them through enemies.
+
+        backend is anything implementing memory.backend.MemoryBackend.
+        Defaults to an AttachManager, which attaches to the game through pymem on first use
+        and reattaches if it is restarted. Cached addresses are dropped whenever that happens.
 
+        offset_cache is where pattern scan results are persisted between runs
+        (memory.scanner.OffsetCache, defaults to ~/.cache/darksouls-ai/offsets.json).
+        Pass False to always scan.
+        """
 
-    def __init__(self, enemy, debug=False):
         self.debug = debug
-        self.enemy = enemy
+        self.enemy_ids = tuple(enemy) if isinstance(enemy, (list, tuple)) else (enemy,)
+        self.enemy = self.enemy_ids[0]
+        self.ds3 = backend if backend is not None else AttachManager()
+        self.offset_cache = OffsetCache() if offset_cache is None else (offset_cache or None)
+        self.chains = ChainCache(self.ds3)
+        # Held across initialize, snapshot, speed changes and attach events, a MemorySampler reads from its own thread
+        self._lock = threading.RLock()
+        self._world_chr_man_slot = None
+        self._game_flipper_slot = None
+        self._index = None
+        self._enemies = {}
+        # Snapshots are stamped in game time, which follows the speed set through set_time_scale
+        self.game_clock = GameClock()
+        self.subscribe(self._on_attach_event)
+
+
+    def subscribe(self, callback):
+        """callback(event, backend) when the backend attaches or detaches, see AttachManager. No-op for other backends."""
+        subscribe = getattr(self.ds3, "subscribe", None)
+        if subscribe is not None:
+            subscribe(callback)
+
+
+    def _on_attach_event(self, event, backend):
+        # Nothing resolved for another process is valid, start over on the next initialize()
+        with self._lock:
+            self.chains.invalidate()
+            self._world_chr_man_slot = None
+            self._game_flipper_slot = None
+            self._index = None
+            # A new process runs at normal speed
+            self.game_clock.set_scale(1.0)
     
 
     def initialize(self):
-        self.world_chr_man = self._get_world_chr_man()
-        self._player = self._create_player()
-        self._boss = self._create_boss(self.enemy)
+        """
+        Resolves WorldChrMan, the player and the enemies. Results are cached and only validated
+        on later calls (a handful of reads), so this is cheap enough to call in polling loops.
+        """
+
+        with self._lock:
+            self.world_chr_man = self._get_world_chr_man()
+            self._player = self._create_player()
+            self._enemies = {identifier: self._create_boss(identifier) for identifier in self.enemy_ids}
+            self._boss = self._enemies[self.enemy]
+
+
+    def cache_stats(self):
+        """Hit/miss/invalidation counters of the pointer chain cache."""
+        return self.chains.stats()
     
 
     @property 
@@ -31,67 +93,162 @@ class DS3Reader:
         return self._boss
 
 
+    @property
+    def enemies(self):
+        """Tracked enemies by identifier."""
+        return self._enemies
+
+
+    def entity(self, identifier):
+        """Entity for any identifier in the character set, e.g. one not passed to the constructor."""
+        return self._create_boss(identifier)
+
+
+    def entity_index(self):
+        """Index of the character set, rebuilt only if the set changed since the last call."""
+        if self._index is None or not self._index.is_current(self):
+            self._index = EntityIndex.build(self)
+
+        return self._index
+
+
+    def snapshot(self):
+        """Player and boss state in six reads total. Use this once per step instead of the properties."""
+        with self._lock:
+            return GameSnapshot(self._player.snapshot(), self._boss.snapshot(), self.game_clock.now())
+
+
+    def time_scale(self):
+        """Speed multiplier the game runs at, 1.0 is normal speed."""
+        with self._lock:
+            return self.ds3.read_float(self._game_speed_addr())
+
+
+    def set_time_scale(self, scale):
+        """
+        Makes the game run scale times faster (or slower). The value found at the address has to be
+        a plausible multiplier before anything is written, and has to read back as written after,
+        otherwise ValueError. Returns the previous scale.
+        """
+
+        if not 0 < scale <= self.MAX_TIME_SCALE:
+            raise ValueError(f'Time scale has to be in (0, {self.MAX_TIME_SCALE}], got {scale}.')
+
+        with self._lock:
+            addr = self._game_speed_addr()
+            previous = self.ds3.read_float(addr)
+            if not (math.isfinite(previous) and 0 < previous <= self.MAX_TIME_SCALE):
+                raise ValueError(f'Game speed reads {previous}, not a speed multiplier. The offsets may not match this game version.')
+
+            self.ds3.write_float(addr, scale)
+            if not math.isclose(self.ds3.read_float(addr), scale, rel_tol=1e-6):
+                raise ValueError("Game speed did not read back as written.")
+            self.game_clock.set_scale(scale)
+            return previous
+
+
     def _create_boss(self, boss):
-        return Entity(self._get_entity(boss), self)
+        key = ("boss", self.world_chr_man, boss)
+        entity = self.chains.lookup(key)
+        if entity is None:
+            addr, slot, ins = self._get_entity(boss)
+            entity = Entity(addr, self)
+            # Still valid as long as the character set slot points at the same character and it has the same max HP
+            sentinels = [(slot, _pack_ptr(ins)), (entity._max_hp_addr, struct.pack("<i", boss))]
+            self.chains.store(key, entity, sentinels)
+
+        return entity
 
 
     def _create_player(self):
-        player_addr = self.follow_chain(self.world_chr_man, [0x80, 0x1F90])
-        return Entity(player_addr, self);
+        player_addr = self.follow_chain(self.world_chr_man, [0x80, 0x1F90], cached=True)
+        return self._entity(player_addr)
+
+
+    def _entity(self, addr):
+        key = ("entity", addr)
+        entity = self.chains.lookup(key)
+        if entity is None:
+            entity = Entity(addr, self)
+            self.chains.store(key, entity, [(entity._max_hp_addr, struct.pack("<i", entity.max_hp))])
+
+        return entity
 
 
     def _get_entity(self, entity_identifier):
         """
         Currently checks using entity Max HP. 
         Ideally would use NPCParam (ID), but can't figure out the offsets.
+        Returns (chr_data, slot, ins), see EntityIndex.lookup.
         """
 
-        chr_num = self.ds3.read_int(self.ds3.read_longlong(self.world_chr_man + 0x1D0))
-        chr_set = self.follow_chain(self.world_chr_man, [0x1D0, 0x8])
-        
-        entity = None
-        for i in range(chr_num):
-            chr_data = self.follow_chain(chr_set, [i * 0x38, 0x1F90])
-            sprj_chr_data_module = self.follow_chain(chr_data, [0x18])
-            if self.ds3.read_int(sprj_chr_data_module + 0xDC) == entity_identifier:
-                entity = chr_data
-        
-        if entity is None: 
-            raise ValueError(f'Entity with identifier [{entity_identifier}] could not be found.')
-
-        return entity
+        return self.entity_index().lookup(entity_identifier)
 
 
     def _get_world_chr_man(self): 
-        instr = pymem.pattern.pattern_scan_module(
-            self.ds3.process_handle,
-            self.module,
-            WORLD_CHR_MAN_PATTERN,
-            return_multiple=False
-        )
-        offset = self.ds3.read_int(instr + 3)
-        world_chr_man_addr = instr + 7 + offset
+        # The static slot lives in the module image, so it only has to be found once per process
+        if self._world_chr_man_slot is None:
+            instr = find_signature(self.ds3, WORLD_CHR_MAN_PATTERN, "world_chr_man", self.offset_cache)
+            if instr is None:
+                raise ValueError("WorldChrMan pattern could not be found.")
+
+            offset = self.ds3.read_int(instr + 3)
+            self._world_chr_man_slot = instr + 7 + offset
+
+        return self.ds3.read_longlong(self._world_chr_man_slot)
+
+
+    def _game_speed_addr(self):
+        # Same as WorldChrMan: the static slot is found once per process, the pointer in it read every time
+        if self._game_flipper_slot is None:
+            instr = find_signature(self.ds3, GAME_FLIPPER_PATTERN, "game_flipper", self.offset_cache)
+            if instr is None:
+                raise ValueError("GameFlipper pattern could not be found.")
+
+            offset = self.ds3.read_int(instr + 3)
+            self._game_flipper_slot = instr + 7 + offset
 
-        return self.ds3.read_longlong(world_chr_man_addr)
+        return self.ds3.read_longlong(self._game_flipper_slot) + GAME_SPEED_OFFSET
 
 
-    def follow_chain(self, addr, offsets):
+    def follow_chain(self, addr, offsets, cached=False):
         """
         Follows a pointer chain given a list of offsets.
         Ex: *(*(*(addr + offset1) + offset2) + ...) where * is dereferencing.
+
+        With cached=True the result is kept keyed by (addr, offsets) and later calls only
+        re-read the first pointer of the chain to check it still holds.
         """
 
+        key = (addr, tuple(offsets))
+        if cached:
+            ptr = self.chains.lookup(key)
+            if ptr is not None:
+                return ptr
+
         ptr = addr
+        first = None
+        failed = False
         for offset in offsets:
             try:
                 ptr = self.ds3.read_longlong(ptr + offset)
+                if first is None:
+                    first = ptr
 
                 if self.debug:
                     print(hex(ptr))
 
             except Exception as e:
+                failed = True
                 if self.debug:
                     print("Error handling memory offsets. Most likely harmless but a pointer chain did fail.")
                     print(e)
 
+        if cached and offsets and not failed:
+            self.chains.store(key, ptr, [(addr + offsets[0], _pack_ptr(first))])
+
         return ptr
+
+
+def _pack_ptr(ptr):
+    return struct.pack("<q", ptr)
@@ -1,3 +1,6 @@
+from .snapshot import EntitySnapshot, STATS_BLOCK, POS_BLOCK
+
+
 class Entity: 
 
     def __init__(self, addr, reader):
@@ -74,3 +77,28 @@ class Entity:
     @property
     def animation(self):
         return self.reader.ds3.read_int(self._animation_addr)
+
+
+    def write(self, hp=None, sp=None, pos=None):
+        """Writes HP, SP and/or the (x, z, y) position. Max HP and max SP are left alone."""
+        ds3 = self.reader.ds3
+        if hp is not None:
+            ds3.write_int(self._hp_addr, hp)
+        if sp is not None:
+            ds3.write_int(self._sp_addr, sp)
+        if pos is not None:
+            ds3.write_bytes(self._x_addr, POS_BLOCK.pack(*pos))
+
+
+    def snapshot(self):
+        """
+        Reads the whole entity state with three reads (stats block, position block, animation)
+        instead of one read per property.
+        """
+
+        ds3 = self.reader.ds3
+        return EntitySnapshot.decode(
+            ds3.read_bytes(self._hp_addr, STATS_BLOCK.size),
+            ds3.read_bytes(self._x_addr, POS_BLOCK.size),
+            ds3.read_int(self._animation_addr)
+        )
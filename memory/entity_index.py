@@ -0,0 +1,105 @@
+from .backend import MemoryAccessError
+
+import numpy as np
+import struct
+
+
+# One entry of WorldChrMan's character set. Only the ChrIns pointer at the start is used.
+CHR_ENTRY = np.dtype({"names": ["ins"], "formats": ["<u8"], "offsets": [0], "itemsize": 0x38})
+CHR_SET_HEADER = struct.Struct("<i4xq")
+
+
+class EntityIndex:
+    """
+    WorldChrMan's character set read in one go and indexed by identifier (max HP for now).
+    Build it once with EntityIndex.build, then any number of lookups are O(1).
+    The index stays usable until is_current says the table changed.
+    """
+
+    def __init__(self, header, raw, chr_set, table):
+        self.header = header
+        self.raw = raw
+        self.chr_set = chr_set
+        self.table = table
+        self._by_id = {}
+        for i, identifier in enumerate(table["identifier"].tolist()):
+            if identifier >= 0:
+                self._by_id.setdefault(identifier, []).append(i)
+
+
+    @classmethod
+    def build(cls, reader):
+        header, raw = cls._read_table(reader)
+        chr_num, chr_set = CHR_SET_HEADER.unpack(raw[:CHR_SET_HEADER.size])
+        entries = np.frombuffer(raw, CHR_ENTRY, offset=CHR_SET_HEADER.size)
+
+        table = np.zeros(chr_num, dtype=[("ins", "<u8"), ("chr_data", "<u8"), ("identifier", "<i4")])
+        table["ins"] = entries["ins"]
+        table["identifier"] = -1
+
+        ds3 = reader.ds3
+        for i, ins in enumerate(table["ins"].tolist()):
+            if not ins:
+                continue
+
+            try:
+                chr_data = ds3.read_longlong(ins + 0x1F90)
+                stats = ds3.read_longlong(chr_data + 0x18)
+                table[i] = (ins, chr_data, ds3.read_int(stats + 0xDC))
+            except MemoryAccessError:
+                # Slot is being torn down or filled in. Skip it.
+                continue
+
+        return cls(header, raw, chr_set, table)
+
+
+    @staticmethod
+    def _read_table(reader):
+        """Reads the set header and the whole entry table, three reads independent of chr_num."""
+        ds3 = reader.ds3
+        header = ds3.read_longlong(reader.world_chr_man + 0x1D0)
+        chr_num, chr_set = CHR_SET_HEADER.unpack(ds3.read_bytes(header, CHR_SET_HEADER.size))
+        if not 0 <= chr_num <= 0x10000:
+            raise MemoryAccessError(f'Character set has an invalid size ({chr_num}).')
+
+        table = ds3.read_bytes(chr_set, chr_num * CHR_ENTRY.itemsize)
+        return header, CHR_SET_HEADER.pack(chr_num, chr_set) + table
+
+
+    def is_current(self, reader):
+        """True if the character set still holds exactly the characters this index was built from."""
+        try:
+            return self._read_table(reader) == (self.header, self.raw)
+        except MemoryAccessError:
+            return False
+
+
+    def __len__(self):
+        return len(self.table)
+
+
+    def __contains__(self, identifier):
+        return identifier in self._by_id
+
+
+    def find_all(self, identifier):
+        """Every (chr_data, slot, ins) with the identifier, in table order."""
+        return [self._entry(i) for i in self._by_id.get(identifier, [])]
+
+
+    def lookup(self, identifier):
+        """
+        (chr_data, slot, ins) of the first character with the identifier.
+        Slot is the address of its entry in the character set.
+        """
+
+        rows = self._by_id.get(identifier)
+        if not rows:
+            raise ValueError(f'Entity with identifier [{identifier}] could not be found.')
+
+        return self._entry(rows[0])
+
+
+    def _entry(self, i):
+        row = self.table[i]
+        return int(row["chr_data"]), self.chr_set + i * CHR_ENTRY.itemsize, int(row["ins"])
@@ -0,0 +1,196 @@
+from .backend import FakeMemory
+from .snapshot import STATS_BLOCK, POS_BLOCK
+from .utils import GAME_SPEED_OFFSET
+
+import struct
+
+
+class FakeChr:
+    """Addresses of the structures backing one fake character."""
+
+    __slots__ = ("ins", "data", "stats", "pos", "anim", "regions")
+
+
+    def __init__(self, ins, data, stats, pos, anim, regions):
+        self.ins = ins
+        self.data = data
+        self.stats = stats
+        self.pos = pos
+        self.anim = anim
+        self.regions = regions
+
+
+class FakeDS3:
+    """
+    Lays out the WorldChrMan structures DS3Reader walks inside a FakeMemory,
+    using the same offsets as the real game. Lets the memory layer run on Linux.
+
+    Ex:
+        game = FakeDS3()
+        game.add_player(hp=454, max_hp=454)
+        game.add_enemy(hp=1037, max_hp=1037)
+        reader = DS3Reader(BOSSES.IUDEX_GUNDYR, backend=game.memory)
+    """
+
+    MODULE_BASE = 0x140000000
+    HEAP_BASE = 0x7FF000000000
+
+    # Relative offset encoded in the WorldChrMan instruction. Top byte has to be 0x04 to match the pattern.
+    WORLD_CHR_MAN_REL = 0x04000100
+    GAME_FLIPPER_REL = 0x04000200
+
+
+    def __init__(self, memory=None, module_size=0x10000, instr_offset=0x1230, flipper_offset=0x2340, max_chrs=64,
+                 timestamp=0x5F3A1C00):
+        self.memory = memory if memory is not None else FakeMemory()
+        self._next_addr = self.HEAP_BASE
+        self.enemies = []
+        self.player = None
+
+        image = bytearray(module_size)
+        # Just enough of a PE header for memory.scanner.module_key
+        image[0:2] = b"MZ"
+        struct.pack_into("<I", image, 0x3C, 0x80)
+        image[0x80:0x84] = b"PE\0\0"
+        struct.pack_into("<I", image, 0x88, timestamp)
+
+        instr = (
+            b"\x48\x8B\x1D" + struct.pack("<i", self.WORLD_CHR_MAN_REL)
+            + b"\x48\x8B\xF9\x48\x85\xDB\x74\x10\x8B\x11\x85\xD2\x74\x0A\x8D"
+        )
+        image[instr_offset:instr_offset + len(instr)] = instr
+        flipper_instr = (
+            b"\x48\x8B\x0D" + struct.pack("<i", self.GAME_FLIPPER_REL)
+            + b"\x80\xBB\xD7\x00\x00\x00\x00\x0F\x84\xCE\x00\x00\x00\x48\x85\xC9\x75\x2E"
+        )
+        image[flipper_offset:flipper_offset + len(flipper_instr)] = flipper_instr
+        self.memory.map_module(self.MODULE_BASE, image)
+
+        # Static slot holding the WorldChrMan pointer
+        static_addr = self.MODULE_BASE + instr_offset + 7 + self.WORLD_CHR_MAN_REL
+        self.memory.map(static_addr, 8)
+
+        self.world_chr_man = self._alloc(0x200)
+        self.memory.write_longlong(static_addr, self.world_chr_man)
+
+        self._chr_set_header = self._alloc(0x10)
+        self._chr_set = self._alloc(max_chrs * 0x38)
+        self.max_chrs = max_chrs
+        self.memory.write_longlong(self.world_chr_man + 0x1D0, self._chr_set_header)
+        self.memory.write_longlong(self._chr_set_header + 0x8, self._chr_set)
+
+        # GameFlipper and its speed multiplier
+        flipper_slot = self.MODULE_BASE + flipper_offset + 7 + self.GAME_FLIPPER_REL
+        self.memory.map(flipper_slot, 8)
+        self.game_flipper = self._alloc(0x400)
+        self.memory.write_longlong(flipper_slot, self.game_flipper)
+        self.memory.write_float(self.game_flipper + GAME_SPEED_OFFSET, 1.0)
+
+        self.memory.reset_counters()
+
+
+    def _alloc(self, size):
+        addr = self._next_addr
+        self.memory.map(addr, size)
+        # Leave a gap so stray reads past the end fail like they would in the game
+        self._next_addr += (size + 0x10FF) & ~0xFFF
+        return addr
+
+
+    def _create_chr(self, hp, max_hp, sp, max_sp, pos, animation):
+        ins = self._alloc(0x1F98)
+        data = self._alloc(0x88)
+        stats = self._alloc(0x100)
+        pos_a = self._alloc(0xB0)
+        pos_b = self._alloc(0x48)
+        pos_block = self._alloc(0x80)
+        anim = self._alloc(0xD0)
+
+        write = self.memory.write_longlong
+        write(ins + 0x1F90, data)
+        write(data + 0x18, stats)
+        write(data + 0x68, pos_a)
+        write(pos_a + 0xA8, pos_b)
+        write(pos_b + 0x40, pos_block)
+        write(data + 0x80, anim)
+
+        chr = FakeChr(ins, data, stats, pos_block, anim, [ins, data, stats, pos_a, pos_b, pos_block, anim])
+        self.set_stats(chr, hp=hp, max_hp=max_hp, sp=sp, max_sp=max_sp)
+        self.set_pos(chr, *pos)
+        self.set_animation(chr, animation)
+        return chr
+
+
+    def add_player(self, hp=454, max_hp=454, sp=95, max_sp=95, pos=(0.0, 0.0, 0.0), animation=0):
+        self.player = self._create_chr(hp, max_hp, sp, max_sp, pos, animation)
+        self.memory.write_longlong(self.world_chr_man + 0x80, self.player.ins)
+        self._write_chr_set()
+        self.memory.reset_counters()
+        return self.player
+
+
+    def add_enemy(self, hp, max_hp=None, sp=100, max_sp=100, pos=(0.0, 3.0, 0.0), animation=0):
+        if len(self.enemies) + 1 >= self.max_chrs:
+            raise ValueError(f'FakeDS3 was built for at most {self.max_chrs} characters.')
+
+        max_hp = hp if max_hp is None else max_hp
+        enemy = self._create_chr(hp, max_hp, sp, max_sp, pos, animation)
+        self.enemies.append(enemy)
+        self._write_chr_set()
+        self.memory.reset_counters()
+        return enemy
+
+
+    def reload(self):
+        """
+        Simulates a load screen: every character is reallocated at a new address with the same state,
+        and the old structures are freed so stale pointers fault like they would in the game.
+        """
+
+        def move(old):
+            hp, max_hp, sp, max_sp = STATS_BLOCK.unpack(self.memory.read_bytes(old.stats + 0xD8, STATS_BLOCK.size))
+            pos = POS_BLOCK.unpack(self.memory.read_bytes(old.pos + 0x70, POS_BLOCK.size))
+            animation = self.memory.read_int(old.anim + 0xC8)
+            new = self._create_chr(hp, max_hp, sp, max_sp, pos, animation)
+            for addr in old.regions:
+                self.memory.unmap(addr)
+            return new
+
+        if self.player:
+            self.player = move(self.player)
+            self.memory.write_longlong(self.world_chr_man + 0x80, self.player.ins)
+        self.enemies = [move(enemy) for enemy in self.enemies]
+        self._write_chr_set()
+        self.memory.reset_counters()
+
+
+    def _write_chr_set(self):
+        # The player is part of the character set, like in the game
+        chrs = ([self.player] if self.player else []) + self.enemies
+        for i, chr in enumerate(chrs):
+            self.memory.write_longlong(self._chr_set + i * 0x38, chr.ins)
+        self.memory.write_int(self._chr_set_header, len(chrs))
+
+
+    def set_stats(self, chr, hp=None, max_hp=None, sp=None, max_sp=None):
+        block = self.memory.read_bytes(chr.stats + 0xD8, STATS_BLOCK.size)
+        cur = STATS_BLOCK.unpack(block)
+        new = [v if v is not None else c for v, c in zip((hp, max_hp, sp, max_sp), cur)]
+        self.memory.write_int(chr.stats + 0xD8, new[0])
+        self.memory.write_int(chr.stats + 0xDC, new[1])
+        self.memory.write_int(chr.stats + 0xF0, new[2])
+        self.memory.write_int(chr.stats + 0xF4, new[3])
+
+
+    def set_pos(self, chr, x, z, y):
+        self.memory.write_bytes(chr.pos + 0x70, POS_BLOCK.pack(x, z, y))
+
+
+    def set_animation(self, chr, animation):
+        self.memory.write_int(chr.anim + 0xC8, animation)
+
+
+    @property
+    def speed(self):
+        """Speed multiplier the fake game is set to"""
+        return self.memory.read_float(self.game_flipper + GAME_SPEED_OFFSET)
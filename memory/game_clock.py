@@ -0,0 +1,48 @@
+import bisect
+import time
+
+
+class GameClock:
+    """
+    Game time for time.monotonic() stamps, given the speeds the game ran at. Game time equals
+    time.monotonic() until the speed is first changed and from there on advances scale game seconds
+    per wall second, so stamps taken at different speeds stay comparable (an attack lasts as long).
+
+    Ex:
+        clock = GameClock()
+        clock.set_scale(3.0)
+        clock.game_time(stamp)  # seconds as the game experienced them
+    """
+
+    def __init__(self):
+        # Speed segments: wall start, game time at the start, scale. The first one makes game time = monotonic.
+        self._starts = [float("-inf")]
+        self._offsets = [0.0]
+        self._scales = [1.0]
+
+
+    @property
+    def scale(self):
+        return self._scales[-1]
+
+
+    def set_scale(self, scale, at=None):
+        """The game runs at scale from at (time.monotonic(), default now) on."""
+        at = time.monotonic() if at is None else max(at, self._starts[-1])
+        if scale == self._scales[-1]:
+            return
+        self._offsets.append(self.game_time(at))
+        self._starts.append(at)
+        self._scales.append(scale)
+
+
+    def game_time(self, stamp):
+        """Game time of a time.monotonic() stamp"""
+        i = bisect.bisect_right(self._starts, stamp) - 1
+        if i == 0:
+            return stamp
+        return self._offsets[i] + (stamp - self._starts[i]) * self._scales[i]
+
+
+    def now(self):
+        return self.game_time(time.monotonic())
@@ -0,0 +1,79 @@
+import math
+import time
+
+from .backend import MemoryAccessError
+
+
+class RestoreFailed(Exception):
+    """A soft reset could not be applied or did not hold. The caller should fall back to a full reset."""
+
+
+class StateRestorer:
+    """
+    Puts the player and the boss back to the state captured at the start of a fight (HP, SP, position)
+    with direct memory writes, instead of dying and walking back.
+
+    Writes are validated on both sides. Before: the characters are the ones captured (same max HP)
+    and both still alive, as HP writes do not undo a death or a kill. After: settle seconds later,
+    so the game had a few frames to overwrite them, every value reads back as written (positions
+    within pos_tolerance). Anything else raises RestoreFailed.
+    The flask count is not restored, its address is not known.
+
+    Ex:
+        restorer = StateRestorer(reader)
+        restorer.capture()   # right after the fight starts
+        ...
+        restorer.restore()   # next episode, same fight
+    """
+
+    def __init__(self, reader, settle=0.05, pos_tolerance=0.1):
+        self.reader = reader
+        self.settle = settle
+        self.pos_tolerance = pos_tolerance
+        self.start = None
+
+
+    def capture(self):
+        """Remembers the current state as the one to restore."""
+        self.reader.initialize()
+        self.start = self.reader.snapshot()
+        return self.start
+
+
+    def restore(self):
+        """Writes the captured state back and returns the snapshot read after settling."""
+        start = self.start
+        if start is None:
+            raise RestoreFailed("No state was captured.")
+
+        reader = self.reader
+        try:
+            reader.initialize()
+            current = reader.snapshot()
+        except (MemoryAccessError, ValueError) as e:
+            raise RestoreFailed(f'The characters could not be resolved: {e}') from e
+
+        for name in ("player", "boss"):
+            now, then = getattr(current, name), getattr(start, name)
+            if now.max_hp != then.max_hp:
+                raise RestoreFailed(f'The {name} is not the one captured (max HP {now.max_hp}, was {then.max_hp}).')
+            if now.hp <= 0:
+                raise RestoreFailed(f'The {name} is dead, writing its HP back does not revive it.')
+
+        try:
+            reader.player.write(hp=start.player.hp, sp=start.player.sp, pos=start.player.pos)
+            reader.boss.write(hp=start.boss.hp, sp=start.boss.sp, pos=start.boss.pos)
+            if self.settle:
+                time.sleep(self.settle)
+            after = reader.snapshot()
+        except MemoryAccessError as e:
+            raise RestoreFailed(f'Writing the captured state failed: {e}') from e
+
+        for name in ("player", "boss"):
+            got, want = getattr(after, name), getattr(start, name)
+            if (got.hp, got.sp) != (want.hp, want.sp):
+                raise RestoreFailed(f'The {name} reads HP {got.hp} SP {got.sp} after the write, expected {want.hp} {want.sp}.')
+            if math.dist(got.pos, want.pos) > self.pos_tolerance:
+                raise RestoreFailed(f'The {name} is at {got.pos} after the write, expected {want.pos}.')
+
+        return after
@@ -0,0 +1,187 @@
+import threading
+import time
+
+import numpy as np
+
+from .snapshot import SNAPSHOT_DTYPE
+
+
+class MemorySampler:
+    """
+    Samples the reader's player and boss state on a background thread at hz into a preallocated ring
+    of SNAPSHOT_DTYPE records, so steps can pick up the latest state without reading memory and see
+    what happened between steps (hits landing mid-action, animation changes, stamina dips).
+
+    Samples are stamped like DS3Reader.snapshot, in game time. A failed sample (the game is loading,
+    the characters are not resolved yet) is counted in failed, its exception kept in last_error, and
+    skipped. The sampler never calls DS3Reader.initialize() itself, it picks up whatever the owner of
+    the reader resolved last (the reader's lock keeps the two threads apart). pause() it while the
+    game is reloading rather than have it fail at hz, latest() ignores samples from before resume().
+
+    Ex:
+        sampler = MemorySampler(reader, hz=120).start()
+        snapshot = sampler.latest()
+        samples = sampler.window(snapshot.time - 1.0)  # the last second, oldest first
+    """
+
+    def __init__(self, reader, hz=120, capacity=4096):
+        self.reader = reader
+        self.period = 1.0 / hz
+
+        self._ring = np.zeros(capacity, dtype=SNAPSHOT_DTYPE)
+        # Decoded snapshots of the same slots for latest(), and when each was taken (time.monotonic())
+        self._snapshots = [None] * capacity
+        self._taken = np.zeros(capacity, dtype=np.float64)
+        self._seq = -1
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+        self._active = threading.Event()
+        self._active.set()
+        self._resumed = 0.0
+        self.failed = 0
+        self.last_error = None
+        self.late = 0
+
+
+    def start(self):
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="MemorySampler", daemon=True)
+            self._thread.start()
+        return self
+
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+    def pause(self):
+        """Stops sampling after the current sample until resume()"""
+        self._active.clear()
+
+
+    def resume(self):
+        with self._cond:
+            self._resumed = time.monotonic()
+        self._active.set()
+
+
+    def __enter__(self):
+        return self.start()
+
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+    def _run(self):
+        capacity = len(self._ring)
+        next_sample = time.perf_counter()
+        while self._running:
+            if not self._active.is_set():
+                self._active.wait(0.1)
+                next_sample = time.perf_counter()
+                continue
+
+            try:
+                snapshot = self.reader.snapshot()
+            except Exception as e:
+                snapshot = None
+                self.failed += 1
+                self.last_error = e
+
+            if snapshot is not None:
+                player, boss = snapshot.player, snapshot.boss
+                record = (
+                    snapshot.time,
+                    (player.hp, player.max_hp, player.sp, player.max_sp, player.x, player.z, player.y, player.animation),
+                    (boss.hp, boss.max_hp, boss.sp, boss.max_sp, boss.x, boss.z, boss.y, boss.animation)
+                )
+                with self._cond:
+                    slot = (self._seq + 1) % capacity
+                    self._ring[slot] = record
+                    self._snapshots[slot] = snapshot
+                    self._taken[slot] = time.monotonic()
+                    self._seq += 1
+                    self._cond.notify_all()
+
+            next_sample += self.period
+            delay = next_sample - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                self.late += 1
+                next_sample = time.perf_counter()
+
+
+    @property
+    def sample_count(self):
+        return self._seq + 1
+
+
+    def latest(self, max_age=None):
+        """
+        Most recent sample as a GameSnapshot, None if there is none yet, it was taken before the last
+        resume() or more than max_age seconds ago (the sampler is failing, e.g. during a load).
+        """
+
+        with self._cond:
+            if self._seq < 0:
+                return None
+            slot = self._seq % len(self._ring)
+            taken = self._taken[slot]
+            if taken < self._resumed or (max_age is not None and time.monotonic() - taken > max_age):
+                return None
+            return self._snapshots[slot]
+
+
+    def wait_for_sample(self, count, timeout=1.0):
+        """Blocks until sample_count is above count. False if that did not happen within timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._seq + 1 > count, timeout)
+
+
+    def window(self, since):
+        """
+        Copy of the samples stamped at or after since (game time, like GameSnapshot.time), oldest first.
+        The start is found by bisecting the ring, the cost is the copy of the samples returned.
+        Only the last capacity samples are kept.
+        """
+
+        with self._cond:
+            capacity = len(self._ring)
+            end = self._seq + 1
+            lo, hi = max(end - capacity, 0), end
+            times = self._ring["time"]
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if times[mid % capacity] >= since:
+                    hi = mid
+                else:
+                    lo = mid + 1
+
+            if lo == end:
+                return self._ring[:0].copy()
+            start, stop = lo % capacity, end % capacity
+            if start < stop or stop == 0:
+                return self._ring[start:stop or capacity].copy()
+            return np.concatenate((self._ring[start:], self._ring[:stop]))
+
+
+def max_damage(samples, who="player"):
+    """Largest normalized HP lost between two consecutive samples (heals do not offset it), 0 without any"""
+    hp = samples[who]["hp"] / samples[who]["max_hp"]
+    return float(np.max(hp[:-1] - hp[1:], initial=0.0))
+
+
+def animation_history(samples, who="boss"):
+    """Animations in the samples in the order they played, repeats collapsed"""
+    animations = samples[who]["animation"]
+    if len(animations) == 0:
+        return []
+    changes = np.flatnonzero(animations[1:] != animations[:-1]) + 1
+    return animations[np.concatenate(([0], changes))].tolist()
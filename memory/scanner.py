@@ -0,0 +1,161 @@
+from .backend import MemoryAccessError
+
+import hashlib
+import json
+import os
+import re
+import struct
+
+
+# Regex metacharacters. Signatures are literal bytes with "." wildcards, anything fancier is left to re.
+_SPECIAL = set(b"^$*+?{}[]\\|()")
+_WILDCARD = ord(".")
+
+
+def literal_anchor(pattern):
+    """
+    Longest run of literal bytes in a signature and its offset, e.g. (6, b"\\x04\\x48\\x8B\\xF9\\x48\\x85\\xDB")
+    for WORLD_CHR_MAN_PATTERN. None if the pattern uses more than "." wildcards.
+    """
+
+    if any(byte in _SPECIAL for byte in pattern):
+        return None
+
+    best = (0, b"")
+    start = 0
+    for i in range(len(pattern) + 1):
+        if i == len(pattern) or pattern[i] == _WILDCARD:
+            if i - start > len(best[1]):
+                best = (start, pattern[start:i])
+            start = i + 1
+
+    return best if best[1] else None
+
+
+def scan_module(backend, pattern, chunk_size=1 << 22):
+    """
+    Finds the first match of pattern in the backend's main module and returns its address, or None.
+
+    The image is pulled in chunk_size reads, overlapping by the pattern length so matches
+    crossing a boundary are not lost. Candidates are found with bytes.find on the rarest
+    literal run of the pattern and only those are checked against the full wildcard pattern.
+    """
+
+    regex = re.compile(pattern, re.DOTALL)
+    anchor = literal_anchor(pattern)
+    overlap = len(pattern)
+    base, size = backend.module_base, backend.module_size
+
+    start = 0
+    while start < size:
+        length = min(chunk_size + overlap, size - start)
+        try:
+            chunk = backend.read_bytes(base + start, length)
+        except MemoryAccessError:
+            # Unreadable section. Let the backend scan page by page instead.
+            return backend.pattern_scan(pattern)
+
+        # Matches starting in the overlap are found by the next chunk
+        limit = min(chunk_size, length)
+        if anchor:
+            offset, literal = anchor
+            i = chunk.find(literal, offset)
+            while i != -1 and i - offset < limit:
+                if regex.match(chunk, i - offset):
+                    return base + start + i - offset
+                i = chunk.find(literal, i + 1)
+        else:
+            match = regex.search(chunk, 0, limit + overlap)
+            if match and match.start() < limit:
+                return base + start + match.start()
+
+        start += chunk_size
+
+    return None
+
+
+def module_key(backend):
+    """
+    Identifies the exact build of the main module: image size, PE timestamp and a hash of the headers.
+    Costs one read of the header page.
+    """
+
+    header = backend.read_bytes(backend.module_base, min(0x1000, backend.module_size))
+    timestamp = 0
+    if header[:2] == b"MZ":
+        pe = struct.unpack_from("<I", header, 0x3C)[0]
+        if header[pe:pe + 4] == b"PE\0\0":
+            timestamp = struct.unpack_from("<I", header, pe + 8)[0]
+
+    digest = hashlib.sha1(header).hexdigest()[:16]
+    return f'{backend.module_size:x}-{timestamp:x}-{digest}'
+
+
+class OffsetCache:
+    """
+    Pattern scan results persisted to disk as module relative addresses (RVAs),
+    keyed by module_key so a patched executable never reuses stale offsets.
+    """
+
+    def __init__(self, path=None):
+        self.path = path if path is not None else self.default_path()
+        self._data = None
+
+
+    @staticmethod
+    def default_path():
+        return os.path.join(os.path.expanduser("~"), ".cache", "darksouls-ai", "offsets.json")
+
+
+    def _load(self):
+        if self._data is None:
+            try:
+                with open(self.path) as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError):
+                self._data = {}
+        return self._data
+
+
+    def get(self, module, name):
+        return self._load().get(module, {}).get(name)
+
+
+    def put(self, module, name, rva):
+        data = self._load()
+        data.setdefault(module, {})[name] = rva
+
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp, self.path)
+        except OSError:
+            # A read-only cache only costs a rescan next start
+            pass
+
+
+def find_signature(backend, pattern, name, cache=None):
+    """
+    Address of pattern in the main module. Checks the on-disk cache first and verifies the
+    cached hit with a single small read, falling back to scan_module if it does not match.
+    """
+
+    module = None
+    if cache is not None:
+        module = module_key(backend)
+        rva = cache.get(module, name)
+        if rva is not None:
+            addr = backend.module_base + rva
+            try:
+                if re.match(pattern, backend.read_bytes(addr, len(pattern)), re.DOTALL):
+                    return addr
+            except MemoryAccessError:
+                pass
+
+    addr = scan_module(backend, pattern)
+    if addr is not None and cache is not None:
+        cache.put(module, name, addr - backend.module_base)
+
+    return addr
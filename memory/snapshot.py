@@ -0,0 +1,102 @@
+import numpy as np
+import struct
+
+# Layout of the blocks Entity.snapshot reads in one go.
+# Stats block starts at current HP (stats + 0xD8) and ends after max SP (stats + 0xF8).
+STATS_BLOCK = struct.Struct("<ii16xii")
+# Position block is x, z, y starting at pos + 0x70.
+POS_BLOCK = struct.Struct("<fff")
+
+# Fixed-size record of a GameSnapshot, for storing snapshots in NumPy arrays and on disk
+ENTITY_DTYPE = np.dtype([
+    ("hp", "<i4"), ("max_hp", "<i4"), ("sp", "<i4"), ("max_sp", "<i4"),
+    ("x", "<f4"), ("z", "<f4"), ("y", "<f4"), ("animation", "<i4")
+])
+SNAPSHOT_DTYPE = np.dtype([("time", "<f8"), ("player", ENTITY_DTYPE), ("boss", ENTITY_DTYPE)])
+
+
+class EntitySnapshot:
+    """Immutable view of an entity's state decoded from a single set of block reads."""
+
+    __slots__ = ("hp", "max_hp", "sp", "max_sp", "x", "z", "y", "animation")
+
+
+    def __init__(self, hp, max_hp, sp, max_sp, x, z, y, animation):
+        set_ = object.__setattr__
+        set_(self, "hp", hp)
+        set_(self, "max_hp", max_hp)
+        set_(self, "sp", sp)
+        set_(self, "max_sp", max_sp)
+        set_(self, "x", x)
+        set_(self, "z", z)
+        set_(self, "y", y)
+        set_(self, "animation", animation)
+
+
+    @classmethod
+    def decode(cls, stats_block, pos_block, animation):
+        hp, max_hp, sp, max_sp = STATS_BLOCK.unpack(stats_block)
+        x, z, y = POS_BLOCK.unpack(pos_block)
+        return cls(hp, max_hp, sp, max_sp, x, z, y, animation)
+
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is immutable.')
+
+
+    def __repr__(self):
+        fields = ", ".join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)
+        return f'{type(self).__name__}({fields})'
+
+
+    @property
+    def norm_hp(self):
+        return self.hp / self.max_hp
+
+
+    @property
+    def norm_sp(self):
+        return self.sp / self.max_sp
+
+
+    @property
+    def pos(self):
+        return (self.x, self.z, self.y)
+
+
+class GameSnapshot:
+    """Player and boss state sampled together, stamped in game time (DS3Reader.game_clock, time.monotonic() at normal speed)."""
+
+    __slots__ = ("player", "boss", "time")
+
+
+    def __init__(self, player, boss, time):
+        object.__setattr__(self, "player", player)
+        object.__setattr__(self, "boss", boss)
+        object.__setattr__(self, "time", time)
+
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is immutable.')
+
+
+    def __repr__(self):
+        return f'{type(self).__name__}(player={self.player!r}, boss={self.boss!r}, time={self.time!r})'
+
+
+    def to_record(self):
+        """This snapshot as a SNAPSHOT_DTYPE record."""
+        record = np.zeros((), dtype=SNAPSHOT_DTYPE)
+        record["time"] = self.time
+        record["player"] = tuple(getattr(self.player, field) for field in EntitySnapshot.__slots__)
+        record["boss"] = tuple(getattr(self.boss, field) for field in EntitySnapshot.__slots__)
+        return record
+
+
+    @classmethod
+    def from_record(cls, record):
+        return cls(
+            EntitySnapshot(*record["player"].tolist()),
+            EntitySnapshot(*record["boss"].tolist()),
+            float(record["time"])
+        )
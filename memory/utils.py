@@ -9,4 +9,10 @@ class ANIMATIONS:
     HEAL = [50110, 50111, 50112],
     IDLE = [0, 10000000]
 
-WORLD_CHR_MAN_PATTERN = b"\x48\x8B\x1D...\x04\x48\x8B\xF9\x48\x85\xDB..\x8B\x11\x85\xD2..\x8D"
\ No newline at end of file
+WORLD_CHR_MAN_PATTERN = b"\x48\x8B\x1D...\x04\x48\x8B\xF9\x48\x85\xDB..\x8B\x11\x85\xD2..\x8D"
+
+# Loads the static GameFlipper pointer (frame pacing), RIP-relative like WorldChrMan. The global speed
+# multiplier is a float at GAME_SPEED_OFFSET in it. Taken from the community tables for 1.15,
+# DS3Reader.set_time_scale checks the value there looks like a multiplier before writing.
+GAME_FLIPPER_PATTERN = b"\x48\x8B\x0D....\x80\xBB\xD7\x00\x00\x00\x00\x0F\x84\xCE\x00\x00\x00\x48\x85\xC9"
+GAME_SPEED_OFFSET = 0x2D4
@@ -5,22 +5,47 @@ import torch.nn.functional as F
 import numpy as np
 from collections import deque
 import random
+import time
+
+try:
+    import resource
+except ImportError:
+    # Not on Windows, CPU peak memory is not reported there
+    resource = None
+
+from rollout_buffer import RolloutBuffer
+from advantages import gae, discounted_returns
 
 class ActorCritic(nn.Module):
-    """Actor-Critic network for PPO"""
-    def __init__(self, state_dim, action_dim, hidden_dim=256):
+    """
+    Actor-Critic network for PPO
+
+    frame_shape is (height, width, channels) as the env emits it, frame_stack multiplies the
+    channels for stacked frames. The conv output size is found with a dry run, so any frame size works.
+    compact uses fewer conv channels and average-pools the conv output to pool x pool before the
+    MLP, which keeps fc1 small no matter the frame size.
+    """
+    def __init__(self, state_dim, action_dim, hidden_dim=256, frame_shape=(400, 400, 3), frame_stack=1,
+                 channels=None, compact=False, pool=4):
         super(ActorCritic, self).__init__()
+        height, width, frame_channels = frame_shape
+        in_channels = frame_channels * frame_stack
+        if channels is None:
+            channels = (16, 32, 32) if compact else (32, 64, 64)
+        self.frame_shape = (in_channels, height, width)
         
         # CNN for processing frames
-        self.conv1 = nn.Conv2d(3, 32, kernel_size=8, stride=4)
-        self.conv2 = nn.Conv2d(32, 64, kernel_size=4, stride=2)
-        self.conv3 = nn.Conv2d(64, 64, kernel_size=3, stride=1)
+        self.conv1 = nn.Conv2d(in_channels, channels[0], kernel_size=8, stride=4)
+        self.conv2 = nn.Conv2d(channels[0], channels[1], kernel_size=4, stride=2)
+        self.conv3 = nn.Conv2d(channels[1], channels[2], kernel_size=3, stride=1)
+        self.pool = nn.AdaptiveAvgPool2d(pool) if compact else None
         
-        # Calculate conv output size (for 400x400 input)
-        # After conv1: (400-8)/4+1 = 99
-        # After conv2: (99-4)/2+1 = 48
-        # After conv3: (48-3)/1+1 = 46
-        conv_out_size = 64 * 46 * 46
+        # Conv output size for this frame shape (64 * 46 * 46 for the old 400x400 input)
+        with torch.no_grad():
+            conv_out_size = self._encode(torch.zeros(1, *self.frame_shape)).shape[1]
+        
+        self.state_dim = state_dim
+        self.conv_out_size = conv_out_size
         
         # Combine stats and frame features
         combined_size = conv_out_size + state_dim
@@ -34,15 +59,26 @@ class ActorCritic(nn.Module):
         
         # Critic head (value)
         self.critic = nn.Linear(hidden_dim, 1)
-        
-    def forward(self, stats, frame):
-        # Process frame through CNN
-        frame = frame.float() / 255.0  # Normalize to [0, 1]
+
+    @classmethod
+    def from_space(cls, observation_space, action_dim, **kwargs):
+        """Sized for a DS3Env style Dict space with 'stats' and channel-last 'frame'"""
+        state_dim = observation_space['stats'].shape[0]
+        return cls(state_dim, action_dim, frame_shape=observation_space['frame'].shape, **kwargs)
+
+    def _encode(self, frame):
         x = F.relu(self.conv1(frame))
         x = F.relu(self.conv2(x))
         x = F.relu(self.conv3(x))
+        if self.pool is not None:
+            x = self.pool(x)
         #x = x.view(x.size(0), -1)  # Flatten #i changed this
-        x = x.reshape(x.size(0), -1)
+        return x.reshape(x.size(0), -1)
+        
+    def forward(self, stats, frame):
+        # Process frame through CNN
+        frame = frame.float() / 255.0  # Normalize to [0, 1]
+        x = self._encode(frame)
         
         # Combine with stats
         combined = torch.cat([x, stats], dim=1)
@@ -57,6 +93,33 @@ class ActorCritic(nn.Module):
         
         return action_probs, value
 
+    def complexity(self):
+        """Parameter count and FLOPs (2 per multiply-add) of one forward pass for a single observation"""
+        flops = 0
+
+        def count(module, inputs, output):
+            nonlocal flops
+            if isinstance(module, nn.Conv2d):
+                kh, kw = module.kernel_size
+                flops += 2 * output.numel() * (module.in_channels // module.groups) * kh * kw
+            elif isinstance(module, nn.Linear):
+                flops += 2 * output.numel() * module.in_features
+
+        hooks = [m.register_forward_hook(count) for m in self.modules() if isinstance(m, (nn.Conv2d, nn.Linear))]
+        try:
+            device = self.fc1.weight.device
+            with torch.no_grad():
+                self(torch.zeros(1, self.state_dim, device=device), torch.zeros(1, *self.frame_shape, device=device))
+        finally:
+            for hook in hooks:
+                hook.remove()
+
+        params = sum(p.numel() for p in self.parameters())
+        return {
+            'params': params,
+            'flops': flops,
+            'size_mb': sum(p.numel() * p.element_size() for p in self.parameters()) / 2**20
+        }
 class PPOAgent:
     """PPO Agent implementation"""
     def __init__(
@@ -68,37 +131,67 @@ class PPOAgent:
         eps_clip=0.2,
         k_epochs=10,
         hidden_dim=256,
-        device=None
+        device=None,
+        rollout_size=2048,
+        pin_memory=False,
+        minibatch_size=None,
+        grad_accum=1,
+        bf16=False,
+        gae_lambda=None,
+        observation_space=None,
+        frame_shape=(400, 400, 3),
+        frame_stack=1,
+        compact=False,
+        channels=None
     ):
+        # The observation space, when given, decides the stats size and frame shape
+        if observation_space is not None:
+            state_dim = observation_space['stats'].shape[0]
+            frame_shape = observation_space['frame'].shape
         self.state_dim = state_dim
         self.action_dim = action_dim
         self.lr = lr
         self.gamma = gamma
         self.eps_clip = eps_clip
         self.k_epochs = k_epochs
+        self.rollout_size = rollout_size
+        self.pin_memory = pin_memory
+        self.minibatch_size = minibatch_size
+        self.grad_accum = grad_accum
+        self.bf16 = bf16
+        self.gae_lambda = gae_lambda
         
         if device is None:
             self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         else:
-            self.device = device
+            self.device = torch.device(device)
         
         print(f"Using device: {self.device}")
         
-        # Initialize network
-        self.policy = ActorCritic(state_dim, action_dim, hidden_dim).to(self.device)
+        # Initialize network. Saved with the weights so checkpoints can be rebuilt without the env.
+        self.policy_kwargs = {
+            'state_dim': state_dim,
+            'action_dim': action_dim,
+            'hidden_dim': hidden_dim,
+            'frame_shape': tuple(frame_shape),
+            'frame_stack': frame_stack,
+            'compact': compact,
+            'channels': tuple(channels) if channels is not None else None
+        }
+        self.policy = ActorCritic(**self.policy_kwargs).to(self.device)
         self.optimizer = optim.Adam(self.policy.parameters(), lr=lr)
         
-        # Experience buffer
+        # Experience buffer, allocated on the first transition once the observation shapes are known
+        self.buffer = None
         self.reset_buffer()
         
     def reset_buffer(self):
         """Reset experience buffer"""
-        self.states_stats = []
-        self.states_frames = []
-        self.actions = []
-        self.rewards = []
-        self.is_terminals = []
-        self.log_probs = []
+        if self.buffer is not None:
+            self.buffer.reset()
+        # Filled in by select_action, stored with the next transition
+        self._log_prob = 0.0
+        self._value = 0.0
         
     def select_action(self, obs, deterministic=False):
         """Select action from observation"""
@@ -113,126 +206,134 @@ class PPOAgent:
         else:
             dist = torch.distributions.Categorical(action_probs)
             action = dist.sample().item()
-            log_prob = dist.log_prob(torch.tensor(action))
-            self.log_probs.append(log_prob)
+            self._log_prob = dist.log_prob(torch.tensor(action, device=self.device)).item()
+            self._value = value.item()
         
         return action
     
-    def store_transition(self, obs, action, reward, is_terminal):
-        """Store transition in buffer"""
-        self.states_stats.append(obs['stats'])
-        self.states_frames.append(obs['frame'])
-        self.actions.append(action)
-        self.rewards.append(reward)
-        self.is_terminals.append(is_terminal)
+    def store_transition(self, obs, action, reward, is_terminal, truncated=False):
+        """
+        Store transition in buffer
+        is_terminal is the env's terminated, truncated its truncated (time limit). A truncated episode
+        is bootstrapped from its value instead of being treated like a death.
+        """
+        if self.buffer is None:
+            self.buffer = RolloutBuffer(
+                self.rollout_size,
+                stats_shape=np.shape(obs['stats']),
+                frame_shape=np.shape(obs['frame']),
+                pin_memory=self.pin_memory
+            )
+        self.buffer.add(obs, action, reward, is_terminal, self._log_prob, self._value, truncated)
     
-    def compute_returns(self, rewards, is_terminals, next_value=0):
-        """Compute discounted returns"""
-        returns = []
-        G = next_value
-        for reward, is_terminal in zip(reversed(rewards), reversed(is_terminals)):
-            if is_terminal:
-                G = 0
-            G = reward + self.gamma * G
-            returns.insert(0, G)
-        return returns
+    def compute_returns(self, rewards, is_terminals, next_value=0, truncateds=None, values=None):
+        """Compute discounted returns, see advantages.discounted_returns"""
+        rewards = np.asarray(rewards, dtype=np.float32)
+        return discounted_returns(rewards, np.asarray(is_terminals), truncateds, next_value, self.gamma, values)
     
     def update(self):
-        """Update policy using PPO"""
-        if len(self.states_stats) == 0:
-            return {
-                'actor_loss': 0.0,
-                'critic_loss': 0.0,
-                'entropy': 0.0,
-                'mean_return': 0.0
-            }
+        """
+        Update policy using PPO
+
+        Every epoch goes over the rollout in shuffled minibatches of minibatch_size (None: the whole
+        rollout at once), stepping the optimizer every grad_accum minibatches. Only one minibatch of
+        frames is on the device and through the network at a time.
+        """
+        if self.buffer is None or len(self.buffer) == 0:
+            return self._empty_update()
         
-        # Convert to tensors
-        old_states_stats = torch.FloatTensor(np.array(self.states_stats)).to(self.device)
-        old_states_frames = torch.FloatTensor(np.array(self.states_frames)).permute(0, 3, 1, 2).to(self.device)
-        old_actions = torch.LongTensor(self.actions).to(self.device)
-        old_log_probs = torch.stack(self.log_probs).to(self.device)
+        update_start = time.perf_counter()
+        if self.device.type == "cuda":
+            torch.cuda.reset_peak_memory_stats(self.device)
+        n = len(self.buffer)
         
         # Compute returns
-        rewards = self.rewards
-        is_terminals = self.is_terminals
+        rewards = self.buffer.rewards[:n].numpy()
+        is_terminals = self.buffer.dones[:n].numpy()
+        truncateds = self.buffer.truncated[:n].numpy()
+        # Values were stored by select_action, no second pass over the rollout.
+        # The last state's value stands in for the next one (non-terminal last state).
+        values = self.buffer.values[:n].numpy()
+        next_value = values[-1]
         
-        # Get next value estimate (for non-terminal last state)
-        with torch.no_grad():
-            if not is_terminals[-1]:
-                _, next_value = self.policy(
-                    old_states_stats[-1:],
-                    old_states_frames[-1:]
-                )
-                next_value = next_value.item()
-            else:
-                next_value = 0
-        
-        returns = self.compute_returns(rewards, is_terminals, next_value)
-        returns = torch.FloatTensor(returns).to(self.device)
-        
-        # Normalize returns with more stability
-        returns_mean = returns.mean()
-        returns_std = returns.std()
-        if returns_std < 1e-8:
-            returns_std = 1e-8
-        returns = (returns - returns_mean) / returns_std
-        
-        # Get old values
-        with torch.no_grad():
-            _, old_values = self.policy(old_states_stats, old_states_frames)
-            old_values = old_values.squeeze()
-            # Ensure old_values has same shape as returns
-            if old_values.dim() == 0:
-                old_values = old_values.unsqueeze(0)
+        if self.gae_lambda is not None:
+            advantages, returns = gae(rewards, values, is_terminals, truncateds, next_value, self.gamma, self.gae_lambda)
+            advantages = torch.as_tensor(advantages, device=self.device)
+            returns = torch.as_tensor(returns, device=self.device)
+            advantages = (advantages - advantages.mean()) / (advantages.std() + 1e-8) if n > 1 else advantages
+        else:
+            returns = self.compute_returns(rewards, is_terminals, next_value, truncateds, values)
+            returns = torch.as_tensor(returns, device=self.device)
+            
+            # Normalize returns with more stability
+            returns_mean = returns.mean()
+            returns_std = returns.std() if n > 1 else torch.tensor(0.0)
+            if returns_std < 1e-8:
+                returns_std = 1e-8
+            returns = (returns - returns_mean) / returns_std
+            
+            advantages = returns - torch.as_tensor(values, device=self.device)
+        prep_time = time.perf_counter() - update_start
         
-        advantages = returns - old_values
+        minibatch_size = self.minibatch_size or n
+        # Each minibatch's loss is weighted by its share of the samples in its accumulation group, so every
+        # optimizer step is on the per-sample mean of its group, short last minibatch or short last group included
+        sizes = [min(minibatch_size, n - start) for start in range(0, n, minibatch_size)]
+        group_samples = [sum(sizes[i - i % self.grad_accum:i - i % self.grad_accum + self.grad_accum]) for i in range(len(sizes))]
+        grad_steps = 0
+        minibatches = 0
+        # bf16 autocast only exists for the CPU path here, CUDA keeps float32
+        use_bf16 = self.bf16 and self.device.type == "cpu"
         
         # PPO update
         for _ in range(self.k_epochs):
-            # Get current policy
-            action_probs, values = self.policy(old_states_stats, old_states_frames)
-            values = values.squeeze()
-            # Ensure values has same shape as returns
-            if values.dim() == 0:
-                values = values.unsqueeze(0)
-            
-            # Ensure action_probs are valid (no NaN)
-            if torch.isnan(action_probs).any():
-                print("Warning: NaN detected in action_probs, skipping update")
-                self.reset_buffer()
-                return {
-                    'actor_loss': 0.0,
-                    'critic_loss': 0.0,
-                    'entropy': 0.0,
-                    'mean_return': 0.0
-                }
-            
-            dist = torch.distributions.Categorical(action_probs)
-            new_log_probs = dist.log_prob(old_actions)
-            entropy = dist.entropy().mean()
-            
-            # Compute ratio
-            ratio = torch.exp(new_log_probs - old_log_probs)
-            
-            # Compute surrogate losses
-            surr1 = ratio * advantages
-            surr2 = torch.clamp(ratio, 1 - self.eps_clip, 1 + self.eps_clip) * advantages
-            
-            # Actor loss
-            actor_loss = -torch.min(surr1, surr2).mean()
-            
-            # Critic loss
-            critic_loss = F.mse_loss(values, returns)
-            
-            # Total loss
-            loss = actor_loss + 0.5 * critic_loss - 0.01 * entropy
-            
-            # Update
             self.optimizer.zero_grad()
-            loss.backward()
-            torch.nn.utils.clip_grad_norm_(self.policy.parameters(), 0.5)
-            self.optimizer.step()
+            pending = 0
+            for i, batch in enumerate(self.buffer.minibatches(minibatch_size, self.device, shuffle=self.minibatch_size is not None)):
+                idx = batch['indices']
+                with torch.autocast("cpu", dtype=torch.bfloat16, enabled=use_bf16):
+                    action_probs, values = self.policy(batch['stats'], batch['frames'])
+                action_probs = action_probs.float()
+                values = values.float().view(-1)
+                
+                # Ensure action_probs are valid (no NaN)
+                if torch.isnan(action_probs).any():
+                    print("Warning: NaN detected in action_probs, skipping update")
+                    self.reset_buffer()
+                    return self._empty_update()
+                
+                dist = torch.distributions.Categorical(action_probs)
+                new_log_probs = dist.log_prob(batch['actions'])
+                entropy = dist.entropy().mean()
+                
+                # Compute ratio
+                ratio = torch.exp(new_log_probs - batch['log_probs'])
+                
+                # Compute surrogate losses
+                surr1 = ratio * advantages[idx]
+                surr2 = torch.clamp(ratio, 1 - self.eps_clip, 1 + self.eps_clip) * advantages[idx]
+                
+                # Actor loss
+                actor_loss = -torch.min(surr1, surr2).mean()
+                
+                # Critic loss
+                critic_loss = F.mse_loss(values, returns[idx])
+                
+                # Total loss
+                loss = actor_loss + 0.5 * critic_loss - 0.01 * entropy
+                
+                # Accumulate, the optimizer steps on the mean over its group
+                (loss * (sizes[i] / group_samples[i])).backward()
+                minibatches += 1
+                pending += 1
+                if pending == self.grad_accum:
+                    self._optimizer_step()
+                    grad_steps += 1
+                    pending = 0
+            
+            if pending:
+                self._optimizer_step()
+                grad_steps += 1
         
         # Reset buffer
         self.reset_buffer()
@@ -241,7 +342,25 @@ class PPOAgent:
             'actor_loss': actor_loss.item(),
             'critic_loss': critic_loss.item(),
             'entropy': entropy.item(),
-            'mean_return': returns.mean().item()
+            'mean_return': returns.mean().item(),
+            'update_time': time.perf_counter() - update_start,
+            'prep_time': prep_time,
+            'minibatches': minibatches,
+            'grad_steps': grad_steps,
+            'peak_memory_mb': _peak_memory_mb(self.device)
+        }
+
+    def _optimizer_step(self):
+        torch.nn.utils.clip_grad_norm_(self.policy.parameters(), 0.5)
+        self.optimizer.step()
+        self.optimizer.zero_grad()
+
+    def _empty_update(self):
+        return {
+            'actor_loss': 0.0,
+            'critic_loss': 0.0,
+            'entropy': 0.0,
+            'mean_return': 0.0
         }
     
     def save(self, filepath):
@@ -249,6 +368,7 @@ class PPOAgent:
         torch.save({
             'policy_state_dict': self.policy.state_dict(),
             'optimizer_state_dict': self.optimizer.state_dict(),
+            'policy_kwargs': self.policy_kwargs,
         }, filepath)
         print(f"Model saved to {filepath}")
     
@@ -258,3 +378,13 @@ class PPOAgent:
         self.policy.load_state_dict(checkpoint['policy_state_dict'])
         self.optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
         print(f"Model loaded from {filepath}")
+
+
+def _peak_memory_mb(device):
+    """Peak CUDA memory since the update started, or the process' peak RSS on CPU"""
+    if device.type == "cuda":
+        return torch.cuda.max_memory_allocated(device) / 2**20
+    if resource is not None:
+        # KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return None
@@ -2,16 +2,30 @@ import gymnasium as gym
 from gymnasium import spaces
 
 import numpy as np
-import time
 import math
-
-from get_frame import get_one_frame
-from memory import DS3Reader, BOSSES, ANIMATIONS
+import functools
+
+from capture import FrameCapture, WindowSource
+from preprocess import FramePreprocessor
+from step_clock import StepClock
+import rewards
+from conditions import PhaseTimer, wait_for
+from memory import DS3Reader, PymemBackend, AttachManager, ProcessDetached, DETACHED, BOSSES, ANIMATIONS, MemoryAccessError
+from memory import StateRestorer, RestoreFailed, MemorySampler
+from memory.sampler import max_damage
 import controller
+from profiler import NULL_PROFILER
 
 class DS3Env(gym.Env):
     MAX_DIST = 12
 
+    # Reset: per-phase timeouts in seconds, how long the player has to stay idle to count as loaded,
+    # distance to the boss to stop running at, and the height the player is at after the kill teleport
+    RESET_TIMEOUTS = {"teleport": 30, "load": 120, "respawn": 20, "boss": 30, "stop": 3, "fog_gate": 6, "engage": 8}
+    SETTLE_TIME = 0.5
+    ENGAGE_DIST = 6.0
+    TELEPORT_Y = 600
+
     # Animation codes for actions. Used to see if an action actually went through.
     ACT_TO_ANI = {
         1: ANIMATIONS.LIGHT_ATTACK,
@@ -26,13 +40,52 @@ class DS3Env(gym.Env):
     }
 
 
-    def __init__(self):
+    def __init__(self, reader=None, capture=None, frame_roi=None, inputs=None, step_hz=None, obs_budget=0.02,
+                 instance=None, reward_config=None, soft_reset=False, full_reset_every=None, time_scale=1.0,
+                 sample_hz=None, profiler=None):
+        """
+        instance is an instances.GameInstance when several games run on this machine.
+        It picks the process, window and gamepad the defaults below bind to.
+        reader defaults to a DS3Reader attached to the running game.
+        capture defaults to a FrameCapture of the game window, started here.
+        frame_roi crops the default capture, see FramePreprocessor.
+        inputs defaults to the InputScheduler of controller's gamepad.
+        step_hz runs steps on a fixed-rate clock (see StepClock), obs_budget is the time
+        reserved at the end of each period for the observation. None keeps the old timing.
+        reward_config is a rewards.RewardConfig, the default is the reward the agent was trained with.
+        soft_reset restores the state captured at the start of the fight with memory writes
+        (memory.StateRestorer) instead of going through a death and the walk back, whenever that
+        validates. full_reset_every forces a full reset after that many soft ones, which refills the flasks.
+        time_scale runs the game that many times faster (DS3Reader.set_time_scale). Input timings,
+        do_action durations and step_hz are game time and rescaled to match, and so are the
+        snapshot and frame_time stamps, so an episode means the same at any speed.
+        sample_hz reads the game state on a background thread at that rate (memory.MemorySampler):
+        steps use the latest sample instead of reading memory, and info['samples'] has every sample
+        since the previous step, info['max_damage_taken'] the largest single hit among them and
+        info['sampler_failed'] how many samples have failed so far. The sampler is paused during reset.
+        profiler is a profiler.Profiler timing the phases of step and reset (and the default
+        capture's grabs), see profile(). The default records nothing.
+        """
         super().__init__()
-        
+        self.instance = instance
+        self.profiler = profiler if profiler is not None else NULL_PROFILER
+        pid = instance.pid if instance else None
+        hwnd = instance.hwnd if instance else None
+        gamepad_index = instance.gamepad_index if instance else None
+
         try:
-            self.ds3 = DS3Reader(BOSSES.IUDEX_GUNDYR)
+            if reader is None:
+                backend = AttachManager(functools.partial(PymemBackend, pid=pid)) if pid is not None else None
+                reader = DS3Reader(BOSSES.IUDEX_GUNDYR, backend=backend)
+            self.ds3 = reader
             self.player = None
             self.boss = None
+            self.snapshot = None
+            # Set from the reader's attach events, the episode is cut short at the next step
+            self.process_lost = False
+            subscribe = getattr(self.ds3, "subscribe", None)
+            if subscribe is not None:
+                subscribe(self._on_attach_event)
         except Exception as e:
             raise RuntimeError("Memory reader could not be initialized. Dark Souls III Is probably not open. Error: ", e)
 
@@ -45,105 +98,338 @@ class DS3Env(gym.Env):
         })
 
         self.heal_count = 0
+        self.reward_config = reward_config if reward_config is not None else rewards.RewardConfig()
+        if capture is None:
+            frame_space = self.observation_space['frame']
+            preprocess = FramePreprocessor.from_space(frame_space, roi=frame_roi)
+            region = instance.capture_region if instance else None
+            capture = FrameCapture(WindowSource(region=region, hwnd=hwnd), shape=frame_space.shape, preprocess=preprocess,
+                                   profiler=self.profiler)
+        self.capture = capture
+        self.capture.start()
+        self.inputs = inputs if inputs is not None else controller.scheduler(gamepad_index)
+        self.hwnd = hwnd
+        self.frame_time = None
+        self.time_scale = time_scale
+        self.game_clock = getattr(self.ds3, "game_clock", None)
+        if time_scale != 1.0 and self.game_clock is None:
+            raise ValueError("time_scale needs a reader with a GameClock (a DS3Reader).")
+        self._apply_time_scale()
+        # The grid runs on the wall clock, step_hz steps per game second
+        self.clock = StepClock(step_hz * time_scale, obs_budget) if step_hz else None
+        if self.clock and self.clock.hold_time < controller.MIN_HOLD:
+            raise ValueError(
+                f'A step at {step_hz} Hz (time scale {time_scale}, obs_budget {obs_budget}) leaves '
+                f'{self.clock.hold_time * 1000:.1f} ms for inputs, a tap needs {controller.MIN_HOLD * 1000:.1f} ms.'
+            )
+        self.restorer = StateRestorer(self.ds3) if soft_reset else None
+        self.sampler = MemorySampler(self.ds3, sample_hz).start() if sample_hz else None
+        self.full_reset_every = full_reset_every
+        self._soft_resets = 0
 
     def step(self, action):
-        prev_player_norm_hp = self.player.norm_hp
-        prev_boss_norm_hp = self.boss.norm_hp
+        with self.profiler.span("step"):
+            return self._step(action)
+
+
+    def _step(self, action):
+        # One snapshot per step; everything below works off of it instead of reading memory again.
+        prev = self.snapshot
+        profiler = self.profiler
         
-        self.do_action(action)
-        obs = self._get_observation(action)
-        reward = self._calculate_reward(prev_player_norm_hp, prev_boss_norm_hp, action)
-        terminated = self.player.hp <= 0 or self.boss.hp <= 0
+        with profiler.span("step.action"):
+            if self.clock:
+                # Action goes out on the tick, held actions end right before the observation
+                self.clock.tick()
+                handle = self.do_action(action, duration=self.clock.hold_time * self.time_scale)
+                self.clock.wait_observe()
+                # The last release is due right at the observation point, give the scheduler a moment of the budget
+                handle.wait(self.clock.obs_budget / 2)
+            else:
+                self.do_action(action).wait()
+
+        try:
+            with profiler.span("step.read"):
+                curr = self._read_state()
+        except ProcessDetached:
+            self.process_lost = True
+        if self.process_lost:
+            return self._lost_step(prev, action)
+        self.snapshot = curr
+        with profiler.span("step.observation"):
+            obs = self._get_observation(curr, action)
+        with profiler.span("step.reward"):
+            reward = self._calculate_reward(prev, curr, action)
+        terminated = curr.player.hp <= 0 or curr.boss.hp <= 0
         truncated = self.step_count >= self.max_steps
 
         self.step_count += 1
         
         info = {
-            'player_hp': self.player.hp,
-            'boss_hp': self.boss.hp,
-            'is_success': bool(self.boss.hp <= 0 and self.player.hp > 0)
+            'player_hp': curr.player.hp,
+            'boss_hp': curr.boss.hp,
+            'is_success': bool(curr.boss.hp <= 0 and curr.player.hp > 0),
+            'frame_time': self.frame_time
         }
+        if self.clock:
+            info.update(self.clock.stats())
+        if self.sampler:
+            samples = self.sampler.window(prev.time)
+            info['samples'] = samples
+            info['max_damage_taken'] = max_damage(samples, "player")
+            info['sampler_failed'] = self.sampler.failed
         
         #self.ds3.ds3.write_int(self.boss._hp_addr, 0)
         return obs, reward, terminated, truncated, info
     
 
+    def profile(self):
+        """Phase histograms recorded since the last call (profiler.Profiler.take), for the training callback"""
+        return self.profiler.take()
+
+
+    def _read_state(self):
+        """The sampler's latest state, or a read when there is no sampler or its last sample is stale"""
+        if self.sampler:
+            # A few missed samples mean the sampler is failing (loading, process gone), read directly to find out
+            snapshot = self.sampler.latest(max_age=3 * self.sampler.period)
+            if snapshot is not None:
+                return snapshot
+        return self.ds3.snapshot()
+
+
+    def _on_attach_event(self, event, backend):
+        if event == DETACHED:
+            self.process_lost = True
+
+
+    def _lost_step(self, prev, action):
+        """The game went away mid-episode: truncate on the last good observation, reset reattaches"""
+        self.step_count += 1
+        obs = self._get_observation(prev, action)
+        info = {
+            'player_hp': prev.player.hp,
+            'boss_hp': prev.boss.hp,
+            'is_success': False,
+            'frame_time': self.frame_time,
+            'process_lost': True
+        }
+        return obs, 0.0, False, True, info
+
+
     def render(self):
         pass
 
 
+    def close(self):
+        self.capture.stop()
+        if self.sampler:
+            self.sampler.stop()
+        # Leave the game at normal speed
+        if self.time_scale != 1.0:
+            try:
+                self.ds3.set_time_scale(1.0)
+            except (MemoryAccessError, ProcessDetached, ValueError) as e:
+                print(f"Game speed could not be set back to normal: {e}")
+
+
+    def _apply_time_scale(self):
+        """Sets the game speed, again after a restart put the game back to normal speed"""
+        if self.time_scale != 1.0 and self.game_clock.scale != self.time_scale:
+            self.ds3.set_time_scale(self.time_scale)
+
+
     def reset(self, seed=None, options=None):
+        """
+        Gets back to the boss fight by waiting on game state rather than fixed sleeps. Every wait polls
+        memory with backoff and has a timeout (RESET_TIMEOUTS); a wait that runs out is listed in
+        info['reset_timeouts'] and the reset carries on. info['reset_time'] has the seconds spent per phase.
+        With soft_reset the fight is restored in place when possible, info['reset_mode'] says which ran.
+        """
+        # Nothing to sample while the game reloads, the step after the reset starts from fresh samples
+        if self.sampler:
+            self.sampler.pause()
+        try:
+            return self._reset(seed)
+        finally:
+            if self.sampler:
+                self.sampler.resume()
+
+
+    def _reset(self, seed):
         super().reset(seed=seed)
+        timer = PhaseTimer()
 
-        controller.keep_ds3_alive()
+        controller.keep_ds3_alive(self.hwnd)
         
         # Release all keys first to ensure clean state
-        controller.release_all_keys()
-        time.sleep(1)
-        
-        if self.boss and self.boss.hp <= 0:
-            self._wait_until_teleported()
-            self._wait_until_loaded()
-            controller.boss_died_reset()
-            time.sleep(10)
-        
-        self._wait_until_loaded()
-        self._reset_mem()
-        
-        print("Walking to boss...")
-        controller.walk_to_boss()
+        with timer.phase("release"):
+            self.inputs.release_all().wait()
+
+        # After a crash there is no boss to check, just wait for the game to be back
+        lost, self.process_lost = self.process_lost, False
+        if lost:
+            self.boss = None
+
+        soft = not lost and self._soft_reset(timer)
+        if not soft:
+            self._full_reset(timer, boss_died=not lost and self.snapshot is not None and self.snapshot.boss.hp <= 0)
         
         self.step_count = 0
         self.boss_defeated = False
-        
-        print(f"Reset complete")
+        if self.clock:
+            self.clock.reset()
 
-        obs = self._get_observation(action=0)
+        self.snapshot = self.ds3.snapshot()
+        obs = self._get_observation(self.snapshot, action=0)
         info = {
-            "player_hp": self.player.hp,
-            "boss_hp": self.boss.hp
+            "player_hp": self.snapshot.player.hp,
+            "boss_hp": self.snapshot.boss.hp,
+            "reset_time": timer.breakdown(),
+            "reset_timeouts": timer.timeouts,
+            "reset_mode": "soft" if soft else "full"
         }
 
+        for phase, seconds in info["reset_time"].items():
+            self.profiler.add("reset" if phase == "total" else f'reset.{phase}', seconds)
+
+        timed_out = f' (timed out: {", ".join(timer.timeouts)})' if timer.timeouts else ""
+        print(f"{info['reset_mode'].capitalize()} reset complete in {info['reset_time']['total']:.2f} s{timed_out}")
         return obs, info
 
 
+    def _soft_reset(self, timer):
+        """Restores the fight's starting state in place, False if a full reset is needed"""
+        if self.restorer is None or self.restorer.start is None:
+            return False
+        if self.full_reset_every and self._soft_resets >= self.full_reset_every:
+            return False
+
+        try:
+            with timer.phase("soft_reset"):
+                self.restorer.restore()
+        except RestoreFailed as e:
+            print(f"Soft reset failed, doing a full reset: {e}")
+            return False
+
+        self._soft_resets += 1
+        self._reset_mem()
+        return True
+
+
+    def _full_reset(self, timer, boss_died):
+        """Back to the fight through the game: respawn (after a kill), load, walk to the boss"""
+        if boss_died:
+            timer.wait("teleport", self._teleported, self.RESET_TIMEOUTS["teleport"])
+            timer.wait("load", self._loaded, self.RESET_TIMEOUTS["load"], hold=self.SETTLE_TIME)
+            self._respawn_boss(timer)
+        
+        timer.wait("load", self._loaded, self.RESET_TIMEOUTS["load"], hold=self.SETTLE_TIME)
+        timer.wait("boss", self._boss_present, self.RESET_TIMEOUTS["boss"])
+        self._reset_mem()
+        self._apply_time_scale()
+        
+        print("Walking to boss...")
+        self._walk_to_boss(timer)
+
+        # The state soft resets go back to
+        if self.restorer is not None:
+            with timer.phase("capture"):
+                self.restorer.capture()
+            self._soft_resets = 0
+
+
+    def _respawn_boss(self, timer):
+        """After a kill: confirm the prompts until the boss is back at full HP"""
+        with timer.phase("respawn"):
+            for _ in range(4):
+                self._submit(controller.INTERACT).wait()
+                if wait_for(self._boss_restored, 1.0):
+                    return
+        timer.wait("respawn", self._boss_restored, self.RESET_TIMEOUTS["respawn"])
+
+
+    def _walk_to_boss(self, timer):
+        """Through the fog gate and up to the boss, then lock on"""
+        with timer.phase("approach"):
+            self._submit(controller.run_events(0.0, 1.0, 1.0)).wait()
+        timer.wait("stop", self._idle, self.RESET_TIMEOUTS["stop"])
+
+        # Interact until the fog gate animation starts, then wait for it to finish
+        with timer.phase("fog_gate"):
+            for _ in range(2):
+                self._submit(controller.INTERACT).wait()
+                if wait_for(lambda: not self._idle(), 1.0):
+                    break
+        timer.wait("fog_gate", self._idle, self.RESET_TIMEOUTS["fog_gate"])
+
+        # Run at the boss until in range
+        self._submit(controller.run_start_events(0.0, 1.0))
+        timer.wait("engage", lambda: self._boss_dist() <= self.ENGAGE_DIST, self.RESET_TIMEOUTS["engage"])
+        with timer.phase("lock_on"):
+            self.inputs.release_all().wait()
+            self._submit(controller.LOCK_ON).wait()
+
+
     def do_action(self, a, duration=0.1):
-        '''core function for learning optimal actions'''
+        '''
+        core function for learning optimal actions
+        returns right away with an ActionHandle, wait() on it for the inputs to finish
+        duration is in game seconds. No input outlasts it, taps longer than the step's hold time are
+        released early so their release cannot land in the next step and cancel its press.
+        '''
 
         match a:
             case 0:
                 # No acation
-                time.sleep(duration)
+                events = controller.idle_events(duration)
             case 1:
-                controller.right_hand_light_attack()
+                events = controller.LIGHT_ATTACK
             case 2:
-                controller.dodge()
+                events = controller.DODGE
             case 3:
-                controller.forward_roll_dodge()
+                events = controller.FORWARD_ROLL
             case 4:
-                controller.run_forward(duration)
+                events = controller.run_events(0.0, 1.0, duration)
             case 5:
-                controller.run_back(duration)
+                events = controller.run_events(0.0, -1.0, duration)
             case 6:
-                controller.run_right(duration)
+                events = controller.run_events(1.0, 0.0, duration)
             case 7:
-                controller.run_left(duration)
+                events = controller.run_events(-1.0, 0.0, duration)
             case 8:
-                controller.heal()
+                events = controller.HEAL
+
+        return self._submit(events, end=duration)
+
+
+    def _submit(self, events, end=None):
+        """
+        Schedules a timeline written for normal speed at the game's speed. With end (game seconds)
+        nothing is sent later than that, taps are cut short but still held controller.MIN_HOLD.
+        """
+        events = controller.scaled(events, self.time_scale)
+        if end is not None:
+            events = controller.clamped(events, end / self.time_scale)
+        return self.inputs.submit(events)
         
 
-    def _get_observation(self, action):
+    def _get_observation(self, snapshot, action):
         """Get current observation (stats + frame)"""
-        frame = get_one_frame()
-        dist = math.dist(self.player.pos, self.boss.pos)
+        player, boss = snapshot.player, snapshot.boss
+        # Captured in the background, this never waits for a grab
+        frame, self.frame_time = self.capture.latest()
+        if self.game_clock is not None:
+            self.frame_time = self.game_clock.game_time(self.frame_time)
+        dist = math.dist(player.pos, boss.pos)
         norm_dist = min(dist, self.MAX_DIST) / self.MAX_DIST
-        action_success = action == 0 or self.player.animation in self.ACT_TO_ANI[action]
+        action_success = action == 0 or player.animation in self.ACT_TO_ANI[action]
 
         stats = np.array(
             [
-                self.player.norm_hp, 
-                self.player.norm_sp, 
-                self.boss.norm_hp,
+                player.norm_hp, 
+                player.norm_sp, 
+                boss.norm_hp,
                 norm_dist,
                 action_success
             ], 
@@ -154,66 +440,11 @@ class DS3Env(gym.Env):
         return {'stats': stats, 'frame': frame}
     
 
-    def _calculate_reward(self, prev_player_norm_hp, prev_boss_norm_hp, action):
-        """Calculate reward based on state changes"""
-        reward = 0.0
-        
-        # Reward for dealing damage to boss
-        boss_damage = prev_boss_norm_hp - self.boss.norm_hp
-        if boss_damage > 0:
-            reward += boss_damage * 3 #increased
-        
-        # Penalty for taking damage
-        player_damage = prev_player_norm_hp - self.player.norm_hp
-        if player_damage > 0:
-            reward -= player_damage * 2 #increased
-
-        # Add penalty for being too far away; ~3 units is the
-        #  attack range so little more leeway before penalty
-        dist_to_boss = math.dist(self.player.pos, self.boss.pos)
-        norm_dist = min(dist_to_boss, self.MAX_DIST) / self.MAX_DIST
-        if norm_dist > 0.5:
-            reward -= 0.05 * (norm_dist - 0.50) / 0.50 #larger penalty for being farther away vs close
-
-        #add reward for being close to fight
-        if norm_dist < 0.35:
-            reward += 0.002
-        
-        # Large reward for killing boss
-        if self.boss.hp <= 0:
-            reward += 10
-        
-        # Large penalty for dying
-        if self.player.hp <= 0:
-            reward -= 2
-
-        if self.player.sp <= 0:
-            reward -= 0.01
-
-        
-        #pressure to quickly punish boss instead of rewarding random rolling and surviving actions
-        reward -= 0.005
-        
-        if(action == 8):
-            # penalty for wasting flask when hp is high
-            HEAL_AMT = 250 #how much hp you get for healing
-            missing_hp = max(0.0, float(self.player.max_hp)) - float(self.player.hp)
-            wasted_flask = max(0.0, HEAL_AMT - missing_hp)
-            norm_wasted_flask = min(1.0, wasted_flask / HEAL_AMT)
-
-            hp_frac = float(self.player.hp) / float(self.player.max_hp)
-            #penalty for healing with high hp
-            if hp_frac > 0.65 : #since health potion is roughly half of the players hp
-                reward -= 0.5
-            #reward healing at low health
-            if hp_frac <= 0.45: #perfect percent for none wasted ...
-                reward += 0.5 * (1.0 - norm_wasted_flask)
-            
-            # penalty if healed 3+ times in the episode
-            self.heal_count+=1
-            if self.heal_count > 3:
-                reward -= 0.1 * (self.heal_count - 3) #lowered penalty
-        return reward
+    def _calculate_reward(self, prev, curr, action):
+        """Reward for the step between two snapshots, see rewards.reward (the same function relabels recordings)"""
+        if action == self.reward_config.heal_action:
+            self.heal_count += 1
+        return float(rewards.reward(rewards.state(prev, curr), action, self.heal_count, self.reward_config))
 
 
     def _reset_mem(self):
@@ -223,22 +454,34 @@ class DS3Env(gym.Env):
         self.boss = self.ds3.boss
 
 
-    def _wait_until_teleported(self):
-        try:
-            while self.player.y < 600:
-                self.ds3.initialize()
-        except Exception:
-            ...
-        time.sleep(5)
+    # Conditions polled by reset. They re-resolve the entities, which also fails while the game loads.
 
+    def _teleported(self):
+        self.ds3.initialize()
+        return self.ds3.player.y >= self.TELEPORT_Y
+
+
+    def _loaded(self):
+        self.ds3.initialize()
+        player = self.ds3.player
+        return player.hp > 0 and player.animation in ANIMATIONS.IDLE
+
+
+    def _idle(self):
+        return self.ds3.player.animation in ANIMATIONS.IDLE
+
+
+    def _boss_present(self):
+        self.ds3.initialize()
+        return self.ds3.boss.hp > 0
+
+
+    def _boss_restored(self):
+        self.ds3.initialize()
+        boss = self.ds3.boss
+        return boss.hp >= boss.max_hp > 0
 
-    def _wait_until_loaded(self):
-        while True:
-            try:
-                self.ds3.initialize()
-                if self.ds3.player.animation in ANIMATIONS.IDLE:
-                    break
-            except Exception:
-                ...
 
-        time.sleep(1.5)
+    def _boss_dist(self):
+        snapshot = self.ds3.snapshot()
+        return math.dist(snapshot.player.pos, snapshot.boss.pos)
@@ -0,0 +1,104 @@
+import numpy as np
+import cv2
+
+
+class FramePreprocessor:
+    '''
+    Turns a BGRA screen grab into an observation frame without per-frame allocations.
+
+    The grab is wrapped without copying, cropped to roi (a view), converted straight from BGRA
+    and resized into buffers that are reused across calls. With resize_first the full-color
+    crop is downsampled before the conversion, which only pays off for cheap interpolations.
+
+    roi is (left, top, right, bottom) as fractions of the grab, e.g. (0.0, 0.1, 1.0, 0.85)
+    drops the HUD bars at the top and the item slots at the bottom.
+    '''
+
+    def __init__(self, shape=(128, 128, 1), roi=None, resize_first=False, interpolation=cv2.INTER_AREA):
+        self.channels_first = shape[0] in (1, 3) and shape[-1] not in (1, 3)
+        self.channels = shape[0] if self.channels_first else shape[-1]
+        if self.channels not in (1, 3):
+            raise ValueError(f'Frames need 1 (gray) or 3 (RGB) channels, got shape {shape}.')
+
+        self.shape = tuple(shape)
+        self.height, self.width = (shape[1], shape[2]) if self.channels_first else (shape[0], shape[1])
+        self.roi = roi
+        self.resize_first = resize_first
+        self.interpolation = interpolation
+        self.code = cv2.COLOR_BGRA2GRAY if self.channels == 1 else cv2.COLOR_BGRA2RGB
+
+        self._src_size = None
+        self._crop = None
+        self._scratch = None
+        self._out = np.empty(self.shape, dtype=np.uint8)
+
+
+    @classmethod
+    def from_space(cls, space, **kwargs):
+        '''Builds a preprocessor whose output matches a Box observation space, e.g. DS3Env's frame space'''
+        return cls(shape=space.shape, **kwargs)
+
+
+    def _prepare(self, height, width):
+        # Only runs when the grab size changes, e.g. the window was resized
+        self._src_size = (height, width)
+        if self.roi is None:
+            self._crop = (slice(0, height), slice(0, width))
+        else:
+            left, top, right, bottom = self.roi
+            self._crop = (
+                slice(int(top * height), int(bottom * height)),
+                slice(int(left * width), int(right * width))
+            )
+
+        if self.resize_first:
+            self._scratch = np.empty((self.height, self.width, 4), dtype=np.uint8)
+        else:
+            crop_h = self._crop[0].stop - self._crop[0].start
+            crop_w = self._crop[1].stop - self._crop[1].start
+            shape = (crop_h, crop_w) if self.channels == 1 else (crop_h, crop_w, 3)
+            self._scratch = np.empty(shape, dtype=np.uint8)
+
+        # The channel-last staging buffer for channel-first output
+        if self.channels_first and self.channels == 3:
+            self._staging = np.empty((self.height, self.width, 3), dtype=np.uint8)
+
+
+    def __call__(self, src, out=None):
+        '''Preprocesses src into out (or an internal buffer that is overwritten next call) and returns it'''
+        frame = _as_bgra(src)
+        if frame.shape[:2] != self._src_size:
+            self._prepare(*frame.shape[:2])
+
+        if out is None:
+            out = self._out
+
+        frame = frame[self._crop]
+        size = (self.width, self.height)
+
+        if self.channels == 1:
+            dst = out.reshape(self.height, self.width)
+        elif self.channels_first:
+            dst = self._staging
+        else:
+            dst = out
+
+        if self.resize_first:
+            cv2.resize(frame, size, dst=self._scratch, interpolation=self.interpolation)
+            cv2.cvtColor(self._scratch, self.code, dst=dst)
+        else:
+            cv2.cvtColor(frame, self.code, dst=self._scratch)
+            cv2.resize(self._scratch, size, dst=dst, interpolation=self.interpolation)
+
+        if self.channels_first and self.channels == 3:
+            np.copyto(out, dst.transpose(2, 0, 1))
+
+        return out
+
+
+def _as_bgra(src):
+    # mss.ScreenShot exposes its raw BGRA buffer, wrap it instead of copying like np.array would
+    raw = getattr(src, "raw", None)
+    if raw is not None:
+        return np.frombuffer(raw, dtype=np.uint8).reshape(src.height, src.width, 4)
+    return np.asarray(src)
@@ -0,0 +1,183 @@
+"""
+Per-phase timing of the training loop: monotonic-clock spans aggregated into log-bucketed histograms,
+cheap enough to leave on during training and nothing at all when off.
+
+The env times its step and reset phases (DS3Env(profiler=Profiler())), FrameCapture its grabs and
+preprocessing, and train.py's stepProfiler callback the policy forward and the PPO update, merges in the
+envs' histograms and logs p50/p95/p99 per phase and steps per second.
+
+Ex:
+    profiler = Profiler()
+    with profiler.span("step.action"):
+        ...
+    profiler.stats()  # {"step.action": {"count": 1, "mean": 0.1, "p50": 0.1, "p95": 0.1, "p99": 0.1}}
+"""
+import math
+import threading
+import time
+
+
+class Histogram:
+    '''
+    Durations in buckets of constant relative width (BUCKETS_PER_DECADE per factor of 10, from MIN to MAX
+    seconds), so adding is O(1) and percentiles are good to a few percent at any scale.
+    '''
+
+    MIN = 1e-6
+    MAX = 1e4
+    BUCKETS_PER_DECADE = 40
+
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+
+    def __init__(self):
+        self.counts = [0] * (int(math.log10(self.MAX / self.MIN) * self.BUCKETS_PER_DECADE) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+
+    def add(self, seconds):
+        bucket = int(math.log10(max(seconds, self.MIN) / self.MIN) * self.BUCKETS_PER_DECADE)
+        self.counts[min(bucket, len(self.counts) - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+
+    def percentile(self, q):
+        '''Duration below which q percent of the spans fall (middle of its bucket, within min and max)'''
+        if not self.count:
+            return math.nan
+        rank = q / 100 * self.count
+        seen = 0
+        for bucket, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                break
+        middle = self.MIN * 10 ** ((bucket + 0.5) / self.BUCKETS_PER_DECADE)
+        return min(max(middle, self.min), self.max)
+
+
+class _Span:
+    __slots__ = ("profiler", "name", "start")
+
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, time.perf_counter() - self.start)
+
+
+class Profiler:
+    '''
+    Histograms of named phases. span(name) times a with block, add(name, seconds) records a
+    duration measured some other way. take() hands the histograms over and starts new ones, which
+    is how they travel from env workers to the callback. Spans may end on other threads (capture,
+    sampler), a lock keeps every duration in the histograms take() hands over or the ones after.
+    '''
+
+    enabled = True
+
+
+    def __init__(self):
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+
+    def _histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        return histogram
+
+
+    def span(self, name):
+        return _Span(self, name)
+
+
+    def add(self, name, seconds):
+        with self._lock:
+            self._histogram(name).add(seconds)
+
+
+    def take(self):
+        with self._lock:
+            histograms, self.histograms = self.histograms, {}
+        return histograms
+
+
+    def merge(self, histograms):
+        with self._lock:
+            for name, histogram in histograms.items():
+                self._histogram(name).merge(histogram)
+
+
+    def stats(self, percentiles=(50, 95, 99)):
+        '''Per phase: count, mean and the percentiles, in seconds'''
+        with self._lock:
+            return {
+                name: {"count": h.count, "mean": h.total / h.count, **{f'p{q}': h.percentile(q) for q in percentiles}}
+                for name, h in self.histograms.items() if h.count
+            }
+
+
+class _NullSpan:
+    __slots__ = ()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        pass
+
+
+class NullProfiler:
+    '''Profiler that records nothing. The default everywhere a profiler can be passed.'''
+
+    enabled = False
+    _span = _NullSpan()
+
+
+    def span(self, name):
+        return self._span
+
+
+    def add(self, name, seconds):
+        pass
+
+
+    def take(self):
+        return {}
+
+
+    def merge(self, histograms):
+        pass
+
+
+    def stats(self, percentiles=(50, 95, 99)):
+        return {}
+
+
+NULL_PROFILER = NullProfiler()
@@ -0,0 +1,309 @@
+import bisect
+import json
+import os
+import queue
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import gymnasium as gym
+
+from memory import SNAPSHOT_DTYPE
+
+INDEX_FILE = "index.json"
+
+
+def _columns(env):
+    '''(name, dtype, shape) of everything recorded per step, derived from the observation space'''
+    space = env.observation_space
+    columns = [
+        ("frame", np.uint8, space["frame"].shape),
+        ("stats", np.float32, space["stats"].shape),
+        ("action", np.int16, ()),
+        ("reward", np.float32, ()),
+        ("terminated", np.bool_, ()),
+        ("truncated", np.bool_, ()),
+    ]
+    if hasattr(env.unwrapped, "snapshot"):
+        columns.append(("snapshot", SNAPSHOT_DTYPE, ()))
+    return columns
+
+
+class TrajectoryRecorder(gym.Wrapper):
+    '''
+    Records every reset and step of a DS3Env into a chunked on-disk dataset (see Recording).
+
+    Rows are copied into a preallocated in-memory chunk. Full chunks are handed to a background
+    thread that writes them (optionally compressed) and updates the index, so the step only pays
+    for a few small copies. Reset rows have action 0, reward 0 and start a new episode.
+
+    Ex:
+        env = TrajectoryRecorder(DS3Env(), "recordings/gundyr")
+    '''
+
+    def __init__(self, env, path, chunk_size=4096, compress=False, max_pending=2):
+        super().__init__(env)
+        if os.path.exists(os.path.join(path, INDEX_FILE)):
+            raise FileExistsError(f'A recording already exists at [{path}].')
+
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.chunk_size = chunk_size
+        self.compress = compress
+        self.columns = _columns(env)
+
+        self.index = {
+            "chunk_size": chunk_size,
+            "columns": {name: {"dtype": np.lib.format.dtype_to_descr(np.dtype(dtype)), "shape": list(shape)}
+                        for name, dtype, shape in self.columns},
+            "chunks": [],
+            "episodes": [],
+            "steps": 0
+        }
+
+        # Chunk buffers are recycled between the env thread and the writer
+        self._free = queue.Queue()
+        for _ in range(max_pending + 1):
+            self._free.put(self._new_buffer())
+        self._pending = queue.Queue()
+        self._buffer = self._free.get()
+        self._fill = 0
+        self._steps = 0
+        self._episodes = []
+        self._error = None
+
+        # Not a daemon, so the interpreter waits for chunks being written instead of cutting them off
+        self._writer = threading.Thread(target=self._write_loop, name="TrajectoryRecorder")
+        self._writer.start()
+
+
+    def _new_buffer(self):
+        return {name: np.zeros((self.chunk_size, *shape), dtype=dtype) for name, dtype, shape in self.columns}
+
+
+    def reset(self, **kwargs):
+        obs, info = self.env.reset(**kwargs)
+        self._episodes.append(self._steps)
+        self._append(obs, 0, 0.0, False, False)
+        return obs, info
+
+
+    def step(self, action):
+        obs, reward, terminated, truncated, info = self.env.step(action)
+        self._append(obs, action, reward, terminated, truncated)
+        return obs, reward, terminated, truncated, info
+
+
+    def _append(self, obs, action, reward, terminated, truncated):
+        if self._error is not None:
+            raise RuntimeError("Trajectory writer failed.") from self._error
+
+        row = self._fill
+        buf = self._buffer
+        buf["frame"][row] = obs["frame"]
+        buf["stats"][row] = obs["stats"]
+        buf["action"][row] = action
+        buf["reward"][row] = reward
+        buf["terminated"][row] = terminated
+        buf["truncated"][row] = truncated
+        if "snapshot" in buf:
+            buf["snapshot"][row] = self.env.unwrapped.snapshot.to_record()
+
+        self._fill += 1
+        self._steps += 1
+        if self._fill == self.chunk_size:
+            self._flush()
+
+
+    def _flush(self):
+        if self._fill:
+            self._pending.put((self._buffer, self._fill, list(self._episodes)))
+            # Blocks only if the writer is max_pending chunks behind
+            self._buffer = self._free.get()
+            self._fill = 0
+
+
+    def _write_loop(self):
+        while True:
+            try:
+                item = self._pending.get(timeout=0.5)
+            except queue.Empty:
+                # Never closed: stop once the main thread is gone and everything queued is written
+                if not threading.main_thread().is_alive():
+                    return
+                continue
+            if item is None:
+                return
+
+            buffer, rows, episodes = item
+            try:
+                self._write_chunk(buffer, rows, episodes)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._free.put(buffer)
+
+
+    def _write_chunk(self, buffer, rows, episodes):
+        name = f'chunk_{len(self.index["chunks"]):05d}'
+        if self.compress:
+            np.savez_compressed(os.path.join(self.path, name + ".npz"),
+                                **{col: data[:rows] for col, data in buffer.items()})
+        else:
+            os.makedirs(os.path.join(self.path, name), exist_ok=True)
+            for col, data in buffer.items():
+                np.save(os.path.join(self.path, name, col + ".npy"), data[:rows])
+
+        self.index["chunks"].append({"name": name, "start": self.index["steps"], "steps": rows,
+                                     "compressed": self.compress})
+        self.index["steps"] += rows
+        self.index["episodes"] = episodes
+
+        # The index only ever points at complete chunks
+        tmp = os.path.join(self.path, INDEX_FILE + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.index, f)
+        os.replace(tmp, os.path.join(self.path, INDEX_FILE))
+
+
+    def close(self):
+        if self._writer is not None:
+            self._flush()
+            self._pending.put(None)
+            self._writer.join()
+            self._writer = None
+            if self._error is not None:
+                raise RuntimeError("Trajectory writer failed.") from self._error
+        super().close()
+
+
+class Column:
+    '''One recorded field across all chunks. Indexing by step or step range only touches the chunks needed.'''
+
+    def __init__(self, recording, name):
+        self.recording = recording
+        self.name = name
+        meta = recording.index["columns"][name]
+        self.dtype = np.lib.format.descr_to_dtype(_as_descr(meta["dtype"]))
+        self.shape = (len(recording), *meta["shape"])
+
+
+    def __len__(self):
+        return len(self.recording)
+
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            return self.recording.steps(start, stop, columns=[self.name])[self.name][::step]
+
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError(f'Step {key} is out of range.')
+
+        chunk, offset = self.recording._locate(key)
+        return self.recording._chunk(chunk)[self.name][offset]
+
+
+    def __array__(self, dtype=None, copy=None):
+        data = self[:]
+        return data.astype(dtype) if dtype is not None else data
+
+
+def _as_descr(descr):
+    # JSON turns the (name, type[, shape]) tuples of a structured descr into lists
+    if isinstance(descr, list):
+        return [tuple(_as_descr(part) if isinstance(part, list) else part for part in field) for field in descr]
+    return descr
+
+
+class Recording:
+    '''
+    Reads a dataset written by TrajectoryRecorder.
+
+    Layout:
+        index.json          columns, chunk list (with first step of each chunk), episode starts
+        chunk_00000/*.npy   one memory-mapped array per column, or
+        chunk_00000.npz     the same arrays, compressed
+
+    Ex:
+        rec = Recording("recordings/gundyr")
+        frames = rec.episode(3)["frame"]
+        rewards = rec.steps(1000, 3000)["reward"]
+    '''
+
+    def __init__(self, path, cache_chunks=4):
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            self.index = json.load(f)
+
+        self.episodes = np.asarray(self.index["episodes"], dtype=np.int64)
+        self._starts = [chunk["start"] for chunk in self.index["chunks"]]
+        self._cache = OrderedDict()
+        self._cache_chunks = cache_chunks
+        self.columns = {name: Column(self, name) for name in self.index["columns"]}
+
+
+    def __len__(self):
+        return self.index["steps"]
+
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+
+    def _locate(self, step):
+        chunk = bisect.bisect_right(self._starts, step) - 1
+        return chunk, step - self._starts[chunk]
+
+
+    def _chunk(self, i):
+        data = self._cache.get(i)
+        if data is not None:
+            self._cache.move_to_end(i)
+            return data
+
+        meta = self.index["chunks"][i]
+        if meta["compressed"]:
+            with np.load(os.path.join(self.path, meta["name"] + ".npz")) as npz:
+                data = {name: npz[name] for name in npz.files}
+        else:
+            data = {name: np.load(os.path.join(self.path, meta["name"], name + ".npy"), mmap_mode="r")
+                    for name in self.index["columns"]}
+
+        self._cache[i] = data
+        if len(self._cache) > self._cache_chunks:
+            self._cache.popitem(last=False)
+        return data
+
+
+    def steps(self, start, stop, columns=None):
+        '''Columns for steps [start, stop) as arrays. Views into the mapped chunk when the range is inside one.'''
+        columns = columns if columns is not None else list(self.columns)
+        stop = min(stop, len(self))
+        if start >= stop:
+            return {name: np.empty((0, *self.columns[name].shape[1:]), dtype=self.columns[name].dtype)
+                    for name in columns}
+
+        first, offset = self._locate(start)
+        last, _ = self._locate(stop - 1)
+        parts = {name: [] for name in columns}
+        for i in range(first, last + 1):
+            data = self._chunk(i)
+            lo = offset if i == first else 0
+            hi = stop - self._starts[i]
+            for name in columns:
+                parts[name].append(data[name][lo:hi])
+
+        return {name: p[0] if len(p) == 1 else np.concatenate(p) for name, p in parts.items()}
+
+
+    def episode_bounds(self, episode):
+        start = int(self.episodes[episode])
+        end = int(self.episodes[episode + 1]) if episode + 1 < len(self.episodes) else len(self)
+        return start, end
+
+
+    def episode(self, episode, columns=None):
+        return self.steps(*self.episode_bounds(episode), columns=columns)
@@ -0,0 +1,182 @@
+import os
+
+import numpy as np
+import gymnasium as gym
+
+from input_scheduler import InputScheduler, FakeGamepad
+from memory import GameSnapshot, SNAPSHOT_DTYPE
+from ppov2 import DS3Env
+from recorder import INDEX_FILE, Recording
+
+
+class Trace:
+    '''
+    Recorded steps on disk: one .npy file per array so everything can be memory-mapped.
+        snapshots.npy  SNAPSHOT_DTYPE per step
+        frames.npy     (n, h, w, c) uint8 preprocessed frames
+        actions.npy    action taken before each step (0 for the first step of an episode)
+        episodes.npy   index of the first step of every episode
+    A recorder.Recording directory loads as a Trace too.
+    '''
+
+    def __init__(self, snapshots, frames, actions, episodes):
+        self.snapshots = snapshots
+        self.frames = frames
+        self.actions = actions
+        self.episodes = episodes
+
+
+    def __len__(self):
+        return len(self.snapshots)
+
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        if os.path.exists(os.path.join(path, INDEX_FILE)):
+            rec = Recording(path)
+            if "snapshot" not in rec.columns:
+                raise ValueError(f'Recording [{path}] has no snapshots, it cannot be replayed.')
+            return cls(rec["snapshot"], rec["frame"], rec["action"], rec.episodes)
+
+        mode = "r" if mmap else None
+        arrays = [np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mode)
+                  for name in ("snapshots", "frames", "actions", "episodes")]
+        return cls(*arrays)
+
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        for name in ("snapshots", "frames", "actions", "episodes"):
+            np.save(os.path.join(path, f'{name}.npy'), np.asarray(getattr(self, name)))
+
+
+    def episode_bounds(self, episode):
+        start = int(self.episodes[episode])
+        end = int(self.episodes[episode + 1]) if episode + 1 < len(self.episodes) else len(self)
+        return start, end
+
+
+class ReplayCursor:
+    '''Position in a Trace shared by ReplayReader and ReplayCapture'''
+
+    def __init__(self, trace):
+        self.trace = trace
+        self.episode = -1
+        self.index = 0
+        self.end = 0
+
+
+    def next_episode(self):
+        self.episode = (self.episode + 1) % len(self.trace.episodes)
+        self.index, self.end = self.trace.episode_bounds(self.episode)
+
+
+    def advance(self):
+        self.index = min(self.index + 1, self.end - 1)
+
+
+    @property
+    def last(self):
+        return self.index >= self.end - 1
+
+
+class ReplayReader:
+    '''Serves recorded snapshots where DS3Env expects a DS3Reader'''
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+
+    def initialize(self):
+        pass
+
+
+    def snapshot(self):
+        return GameSnapshot.from_record(self.cursor.trace.snapshots[self.cursor.index])
+
+
+    @property
+    def player(self):
+        return self.snapshot().player
+
+
+    @property
+    def boss(self):
+        return self.snapshot().boss
+
+
+class ReplayCapture:
+    '''Serves recorded frames where DS3Env expects a FrameCapture'''
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+
+    def start(self):
+        return self
+
+
+    def stop(self):
+        pass
+
+
+    def latest(self, timeout=None):
+        row = self.cursor.trace.snapshots[self.cursor.index]
+        return np.array(self.cursor.trace.frames[self.cursor.index]), float(row["time"])
+
+
+class ReplayEnv(DS3Env):
+    '''
+    DS3Env running on a recorded Trace instead of the game, as fast as the trace can be read.
+    Lets the training stack be run and profiled on a headless machine.
+
+    action_mode "ignore" computes the reward with the agent's action, "recorded" with the action
+    that was actually taken in the recording. The recorded action is always in info.
+    '''
+
+    def __init__(self, trace, action_mode="ignore", **kwargs):
+        if action_mode not in ("ignore", "recorded"):
+            raise ValueError(f'Unknown action_mode [{action_mode}].')
+
+        self.trace = Trace.load(trace) if isinstance(trace, (str, os.PathLike)) else trace
+        self.cursor = ReplayCursor(self.trace)
+        self.action_mode = action_mode
+        super().__init__(
+            reader=ReplayReader(self.cursor),
+            capture=ReplayCapture(self.cursor),
+            inputs=InputScheduler(FakeGamepad()),
+            **kwargs
+        )
+
+
+    def step(self, action):
+        self.cursor.advance()
+        recorded = int(self.trace.actions[self.cursor.index])
+        if self.action_mode == "recorded":
+            action = recorded
+
+        obs, reward, terminated, truncated, info = super().step(action)
+        info["recorded_action"] = recorded
+        return obs, reward, terminated, truncated or self.cursor.last, info
+
+
+    def reset(self, seed=None, options=None):
+        gym.Env.reset(self, seed=seed)
+        self.cursor.next_episode()
+        self._reset_mem()
+        self.step_count = 0
+        if self.clock:
+            self.clock.reset()
+
+        self.snapshot = self.ds3.snapshot()
+        obs = self._get_observation(self.snapshot, action=0)
+        info = {
+            "player_hp": self.snapshot.player.hp,
+            "boss_hp": self.snapshot.boss.hp
+        }
+        return obs, info
+
+
+    def do_action(self, a, duration=0.1):
+        # Nothing to press, the recording already happened
+        return self.inputs.submit([])
@@ -0,0 +1,204 @@
+"""
+DS3Env's reward as a pure function of state arrays, so it can be recomputed offline.
+
+reward() takes the state of each step (state() builds it from the snapshots before and after:
+GameSnapshots for one step, SNAPSHOT_DTYPE arrays for many), the actions and the heal count, and
+works the same on one step or on a whole trajectory in one NumPy pass. The shaping coefficients live in a RewardConfig. relabel() recomputes the rewards and
+discounted returns of a recorder.Recording, which lets shaping variants be compared without the game.
+
+Ex:
+    variant = RewardConfig(step_penalty=0.01, close_bonus=0.01)
+    labels = relabel(Recording("recordings/gundyr"), variant)
+    labels["returns"][labels["episode_starts"]]  # return of every episode
+"""
+import math
+
+import numpy as np
+
+from advantages import discounted_returns
+from memory import GameSnapshot
+
+
+class RewardConfig:
+    '''
+    Shaping coefficients of DS3Env's reward. The defaults are the reward the agent was trained with.
+        boss_damage, player_damage          per unit of normalized HP lost by the boss / the player
+        max_dist                            distance (game units) that normalizes to 1
+        far_threshold, far_penalty          penalty ramping to far_penalty as norm dist goes from far_threshold to 1
+        close_threshold, close_bonus        bonus while norm dist is below close_threshold
+        kill_bonus, death_penalty           boss HP reached 0 / player HP reached 0
+        no_stamina_penalty, step_penalty    player SP at 0 / every step
+        heal_action, heal_amount            action index of a heal and the HP a flask gives
+        heal_high_hp, heal_high_penalty     penalty for healing above this HP fraction
+        heal_low_hp, heal_low_bonus         bonus (less the wasted part of the flask) for healing at or below it
+        heal_limit, heal_overuse_penalty    penalty per heal past heal_limit in an episode
+    '''
+
+    __slots__ = (
+        "boss_damage", "player_damage", "max_dist", "far_threshold", "far_penalty", "close_threshold",
+        "close_bonus", "kill_bonus", "death_penalty", "no_stamina_penalty", "step_penalty", "heal_action",
+        "heal_amount", "heal_high_hp", "heal_high_penalty", "heal_low_hp", "heal_low_bonus", "heal_limit",
+        "heal_overuse_penalty"
+    )
+
+
+    def __init__(self, boss_damage=3.0, player_damage=2.0, max_dist=12.0, far_threshold=0.5, far_penalty=0.05,
+                 close_threshold=0.35, close_bonus=0.002, kill_bonus=10.0, death_penalty=2.0, no_stamina_penalty=0.01,
+                 step_penalty=0.005, heal_action=8, heal_amount=250, heal_high_hp=0.65, heal_high_penalty=0.5,
+                 heal_low_hp=0.45, heal_low_bonus=0.5, heal_limit=3, heal_overuse_penalty=0.1):
+        self.boss_damage = boss_damage
+        self.player_damage = player_damage
+        self.max_dist = max_dist
+        self.far_threshold = far_threshold
+        self.far_penalty = far_penalty
+        self.close_threshold = close_threshold
+        self.close_bonus = close_bonus
+        self.kill_bonus = kill_bonus
+        self.death_penalty = death_penalty
+        self.no_stamina_penalty = no_stamina_penalty
+        self.step_penalty = step_penalty
+        self.heal_action = heal_action
+        self.heal_amount = heal_amount
+        self.heal_high_hp = heal_high_hp
+        self.heal_high_penalty = heal_high_penalty
+        self.heal_low_hp = heal_low_hp
+        self.heal_low_bonus = heal_low_bonus
+        self.heal_limit = heal_limit
+        self.heal_overuse_penalty = heal_overuse_penalty
+
+
+    def replace(self, **changes):
+        '''Copy with some coefficients changed'''
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(changes)
+        return type(self)(**values)
+
+
+    def __repr__(self):
+        fields = ", ".join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)
+        return f'{type(self).__name__}({fields})'
+
+
+DEFAULT = RewardConfig()
+
+
+def heal_counts(actions, episode_starts, config=DEFAULT):
+    '''Heals so far in the episode, this step's included, for every step. episode_starts is a bool mask.'''
+    heals = np.cumsum(np.asarray(actions) == config.heal_action)
+    # Heals before each step's episode started, carried forward from the episode's first step
+    starts = np.flatnonzero(episode_starts)
+    before = np.zeros_like(heals)
+    before[starts] = heals[starts] - (np.asarray(actions)[starts] == config.heal_action)
+    episode = np.maximum.accumulate(np.where(episode_starts, np.arange(len(heals)), 0))
+    return heals - before[episode]
+
+
+def state(prev, curr):
+    '''
+    Reward inputs for the steps prev -> curr: two GameSnapshots (plain floats, cheap for one step)
+    or SNAPSHOT_DTYPE arrays of any shape (arrays).
+    '''
+
+    if isinstance(curr, GameSnapshot):
+        player, boss = curr.player, curr.boss
+        return {
+            "boss_damage": prev.boss.norm_hp - boss.norm_hp,
+            "player_damage": prev.player.norm_hp - player.norm_hp,
+            "dist": math.dist(player.pos, boss.pos),
+            "player_hp": player.hp,
+            "player_max_hp": player.max_hp,
+            "player_sp": player.sp,
+            "boss_hp": boss.hp
+        }
+
+    player, boss = curr["player"], curr["boss"]
+    # Positions are float32 in the records, the game's floats. Differences are taken in float64 like math.dist.
+    squares = sum((player[axis].astype(np.float64) - boss[axis]) ** 2 for axis in ("x", "z", "y"))
+    return {
+        "boss_damage": prev["boss"]["hp"] / prev["boss"]["max_hp"] - boss["hp"] / boss["max_hp"],
+        "player_damage": prev["player"]["hp"] / prev["player"]["max_hp"] - player["hp"] / player["max_hp"],
+        "dist": np.sqrt(squares),
+        "player_hp": player["hp"],
+        "player_max_hp": player["max_hp"],
+        "player_sp": player["sp"],
+        "boss_hp": boss["hp"]
+    }
+
+
+def reward(state, action, heal_count, config=DEFAULT):
+    '''
+    Reward for steps described by state (see state()) taking action, heal_count heals into the episode
+    (see heal_counts). Only arithmetic and NumPy ufuncs, so the inputs can be plain numbers for one
+    step or arrays (float64 out) for many.
+    '''
+
+    # Damage dealt and taken
+    reward = np.maximum(state["boss_damage"], 0.0) * config.boss_damage
+    reward -= np.maximum(state["player_damage"], 0.0) * config.player_damage
+
+    # Staying in range
+    norm_dist = np.minimum(state["dist"], config.max_dist) / config.max_dist
+    far = (norm_dist - config.far_threshold) / (1 - config.far_threshold)
+    reward -= (norm_dist > config.far_threshold) * config.far_penalty * far
+    reward += (norm_dist < config.close_threshold) * config.close_bonus
+
+    reward += (state["boss_hp"] <= 0) * config.kill_bonus
+    reward -= (state["player_hp"] <= 0) * config.death_penalty
+    reward -= (state["player_sp"] <= 0) * config.no_stamina_penalty
+    reward -= config.step_penalty
+
+    # Flask use: wasteful heals at high HP are penalized, heals at low HP rewarded, so is healing too often
+    hp, max_hp = state["player_hp"], state["player_max_hp"]
+    missing_hp = np.maximum(max_hp, 0.0) - hp
+    wasted = np.minimum(1.0, np.maximum(0.0, config.heal_amount - missing_hp) / config.heal_amount)
+    hp_frac = hp / max_hp
+    heal = (hp_frac <= config.heal_low_hp) * config.heal_low_bonus * (1.0 - wasted)
+    heal -= (hp_frac > config.heal_high_hp) * config.heal_high_penalty
+    heal -= np.maximum(heal_count - config.heal_limit, 0) * config.heal_overuse_penalty
+    reward += (np.asarray(action) == config.heal_action) * heal
+
+    return reward
+
+
+def relabel(recording, config=DEFAULT, gamma=0.99):
+    '''
+    Rewards and returns of every step of a Recording (it needs the snapshot column) under config.
+    Reset rows get reward 0 like when recorded. Returns are cut at episode ends, episodes that stop
+    without being terminated or truncated are treated as truncated. Returns a dict of
+    "reward", "returns" and the bool mask "episode_starts".
+    '''
+
+    data = recording.steps(0, len(recording), columns=["snapshot", "action", "terminated", "truncated"])
+    snapshots, actions = data["snapshot"], data["action"].astype(np.int64)
+    steps = len(snapshots)
+
+    episode_starts = np.zeros(steps, dtype=bool)
+    episode_starts[recording.episodes] = True
+
+    rewards = np.zeros(steps, dtype=np.float64)
+    heals = heal_counts(actions, episode_starts, config)
+    rewards[1:] = reward(state(snapshots[:-1], snapshots[1:]), actions[1:], heals[1:], config)
+    rewards[episode_starts] = 0.0
+
+    # The row before each reset ends its episode
+    ended = np.zeros(steps, dtype=bool)
+    ended[:-1] = episode_starts[1:]
+    terminated = data["terminated"].astype(bool)
+    truncated = data["truncated"].astype(bool) | (ended & ~terminated)
+
+    returns = discounted_returns(rewards, terminated, truncated, gamma=gamma)
+    return {"reward": rewards.astype(np.float32), "returns": returns, "episode_starts": episode_starts}
+
+
+def compare(recording, configs, gamma=0.99):
+    '''Per named config: mean undiscounted episode return, mean discounted return from episode starts, mean step reward'''
+    results = {}
+    for name, config in configs.items():
+        labels = relabel(recording, config, gamma)
+        starts = labels["episode_starts"]
+        results[name] = {
+            "episode_return": float(np.add.reduceat(labels["reward"], np.flatnonzero(starts)).mean()),
+            "discounted_return": float(labels["returns"][starts].mean()),
+            "step_reward": float(labels["reward"][~starts].mean())
+        }
+    return results
@@ -0,0 +1,135 @@
+import numpy as np
+import torch
+
+
+class RolloutBuffer:
+    '''
+    Fixed-capacity storage for one PPO rollout, allocated once and written in place every step.
+
+    Frames stay uint8 (the network scales them), everything else is float32 except actions,
+    which are int64 so they can index the action distribution directly. Nothing is converted
+    until a minibatch is taken: the rows are gathered into a staging buffer and moved to device,
+    frames channel-first. With pin_memory only the staging buffers are pinned (sized to the
+    largest minibatch, not the rollout), so the copy to the GPU can overlap.
+
+    Ex:
+        buffer = RolloutBuffer(2048, stats_shape=(5,), frame_shape=(128, 128, 1))
+        buffer.add(obs, action, reward, done, log_prob, value)
+        for batch in buffer.minibatches(256, device="cuda"):
+            ...
+    '''
+
+    fields = ("frames", "stats", "actions", "rewards", "dones", "truncated", "log_probs", "values")
+
+
+    def __init__(self, capacity, stats_shape, frame_shape, pin_memory=False):
+        self.capacity = capacity
+        self.stats_shape = tuple(stats_shape)
+        self.frame_shape = tuple(frame_shape)
+        self.pin_memory = pin_memory and torch.cuda.is_available()
+
+        def alloc(shape, dtype):
+            return torch.zeros((capacity, *shape), dtype=dtype)
+
+        self.frames = alloc(self.frame_shape, torch.uint8)
+        self.stats = alloc(self.stats_shape, torch.float32)
+        self.actions = alloc((), torch.int64)
+        self.rewards = alloc((), torch.float32)
+        self.dones = alloc((), torch.float32)
+        self.truncated = alloc((), torch.float32)
+        self.log_probs = alloc((), torch.float32)
+        self.values = alloc((), torch.float32)
+
+        # NumPy views of the same memory, writing a step is a few small copies
+        self._np = {name: getattr(self, name).numpy() for name in self.fields}
+        self._staging = None
+        self._copied = None
+        self.size = 0
+
+
+    def __len__(self):
+        return self.size
+
+
+    @property
+    def full(self):
+        return self.size == self.capacity
+
+
+    def reset(self):
+        '''Starts a new rollout. The storage is kept and overwritten.'''
+        self.size = 0
+
+
+    def add(self, obs, action, reward, done, log_prob=0.0, value=0.0, truncated=False):
+        '''done is the env's terminated, truncated is kept apart so cut episodes can be bootstrapped'''
+        if self.size == self.capacity:
+            raise BufferError(f'Rollout buffer is full ({self.capacity} steps), update before storing more.')
+
+        i = self.size
+        arrays = self._np
+        arrays["frames"][i] = obs["frame"]
+        arrays["stats"][i] = obs["stats"]
+        arrays["actions"][i] = action
+        arrays["rewards"][i] = reward
+        arrays["dones"][i] = done
+        arrays["truncated"][i] = truncated
+        arrays["log_probs"][i] = log_prob
+        arrays["values"][i] = value
+        self.size += 1
+
+
+    def batch(self, indices, device="cpu"):
+        '''Rows at indices (a LongTensor, or None for the whole rollout) as tensors on device, plus the indices'''
+        if indices is None:
+            # The whole rollout is contiguous already, no gather needed
+            batch = {name: getattr(self, name)[:self.size].to(device) for name in self.fields}
+            batch["frames"] = batch["frames"].permute(0, 3, 1, 2)
+            batch["indices"] = torch.arange(self.size, device=device)
+            return batch
+
+        if self._copied is not None:
+            # The previous batch may still be copying out of the staging buffer
+            self._copied.synchronize()
+            self._copied = None
+
+        # Staging only pays off for copies to the GPU, on CPU the gathered rows are the batch
+        staged = self.pin_memory and torch.device(device).type == "cuda"
+        batch = {}
+        for name in self.fields:
+            data = getattr(self, name)
+            if staged:
+                rows = self._staging_buffer(name, len(indices))
+                torch.index_select(data, 0, indices, out=rows)
+            else:
+                rows = data[indices]
+            batch[name] = rows.to(device, non_blocking=staged)
+
+        if staged:
+            self._copied = torch.cuda.Event()
+            self._copied.record()
+
+        # NHWC -> NCHW on device, still uint8
+        batch["frames"] = batch["frames"].permute(0, 3, 1, 2)
+        batch["indices"] = indices.to(device)
+        return batch
+
+
+    def _staging_buffer(self, name, n):
+        if self._staging is None or len(self._staging[name]) < n:
+            self._staging = {
+                field: torch.empty((n, *getattr(self, field).shape[1:]), dtype=getattr(self, field).dtype, pin_memory=True)
+                for field in self.fields
+            }
+        return self._staging[name][:n]
+
+
+    def minibatches(self, batch_size, device="cpu", shuffle=True, generator=None):
+        '''Yields batch() dicts covering the rollout once, in random order if shuffle'''
+        if not shuffle and batch_size >= self.size:
+            yield self.batch(None, device)
+            return
+
+        order = torch.randperm(self.size, generator=generator) if shuffle else torch.arange(self.size)
+        for start in range(0, self.size, batch_size):
+            yield self.batch(order[start:start + batch_size], device)
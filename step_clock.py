@@ -0,0 +1,83 @@
+import time
+
+from input_scheduler import precise_sleep_until
+
+
+class StepClock:
+    '''
+    Aligns environment steps to a fixed rate. Each step starts on a tick of a 1/hz grid,
+    the action is sent at the tick and the observation is taken obs_budget seconds before
+    the next tick. Whatever is left of the period after that (inference, bookkeeping) is slack.
+
+    When a step is called after its tick the step is late: it counts as an overrun and the
+    grid is realigned to now instead of bursting through the missed ticks.
+    '''
+
+    def __init__(self, hz, obs_budget=0.02):
+        if hz <= 0:
+            raise ValueError(f'Step rate has to be positive, got {hz}.')
+
+        self.period = 1.0 / hz
+        if obs_budget >= self.period:
+            raise ValueError(f'The observation budget ({obs_budget} s) leaves no time for actions in a {self.period:.4f} s step.')
+        self.obs_budget = obs_budget
+        self.next_tick = None
+        self.tick_time = None
+        self.steps = 0
+        self.overruns = 0
+        self.total_late = 0.0
+        self.max_late = 0.0
+        self.last_late = 0.0
+        self.last_slack = 0.0
+
+
+    @property
+    def hold_time(self):
+        '''How long held actions (idle, running) can last and still end before the observation'''
+        return self.period - self.obs_budget
+
+
+    def reset(self):
+        '''Starts a new grid at the next tick(), e.g. after an episode reset'''
+        self.next_tick = None
+
+
+    def tick(self):
+        '''Waits for the next tick and returns its time.perf_counter() time'''
+        now = time.perf_counter()
+        late = slack = 0.0
+
+        if self.next_tick is None:
+            tick = now
+        elif now <= self.next_tick:
+            slack = self.next_tick - now
+            precise_sleep_until(self.next_tick)
+            tick = self.next_tick
+        else:
+            late = now - self.next_tick
+            self.overruns += 1
+            self.total_late += late
+            self.max_late = max(self.max_late, late)
+            tick = now
+
+        self.steps += 1
+        self.last_late = late
+        self.last_slack = slack
+        self.tick_time = tick
+        self.next_tick = tick + self.period
+        return tick
+
+
+    def wait_observe(self):
+        '''Sleeps until the observation point of the current step'''
+        precise_sleep_until(self.tick_time + self.hold_time)
+
+
+    def stats(self):
+        return {
+            "step_late": self.last_late,
+            "step_slack": self.last_slack,
+            "overruns": self.overruns,
+            "overrun_rate": self.overruns / self.steps if self.steps else 0.0,
+            "max_late": self.max_late
+        }
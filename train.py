@@ -11,63 +11,32 @@ import numpy as np
 import torch
 import os
 import argparse
+import functools
+import time
 
 from datetime import datetime
 from ppov2 import DS3Env
-
-def make_env():
-    env = DS3Env()
+from replay import ReplayEnv
+from recorder import TrajectoryRecorder
+from frame_stack import FrameStack
+from instances import find_instances, launch
+from profiler import Profiler
+
+def make_env(instance=None, rank=0, replay=None, step_hz=None, record=None, frame_stack=None, profile=False):
+    # Module level and argument-only so SubprocVecEnv workers can build it
+    profiler = Profiler() if profile else None
+    if replay:
+        env = ReplayEnv(replay, profiler=profiler)
+    else:
+        env = DS3Env(step_hz=step_hz, instance=instance, profiler=profiler)
+    if record:
+        env = TrajectoryRecorder(env, record[rank] if isinstance(record, list) else record)
+    if frame_stack:
+        # Recordings keep single frames, the stack is built after them
+        env = FrameStack(env, n_stack=frame_stack)
     env = Monitor(env)
     return env
 
-parser = argparse.ArgumentParser(description="DS3 Agent Trainer")
-parser.add_argument("--steps", type=int, default=100_000)
-parser.add_argument("--load", type=str, help="Provide a path to the model")
-args = parser.parse_args()
-
-
-env = DummyVecEnv([make_env])
-env = VecFrameStack(env, n_stack=4, channels_order="last")
-env = VecTransposeImage(env)
-
-policy_kwargs = {
-    "net_arch": {
-        "pi": [128, 128],
-        "vf": [128, 128]
-    },
-    "activation_fn": torch.nn.ReLU
-}
-
-checkpoint = CheckpointCallback(
-    save_freq=4096,
-    save_path="./models",
-)
-
-if args.load:
-    model = PPO.load(args.load, env=env)
-else: 
-    model = PPO(
-        "MultiInputPolicy", 
-        env, 
-        policy_kwargs=policy_kwargs,
-        verbose=1, 
-        n_steps=1024,
-        device="cuda",
-        tensorboard_log="./ppo_ds3_logs"
-    )
-
-eval_env = DummyVecEnv([make_env])
-eval_env = VecFrameStack(eval_env, n_stack=4, channels_order="last")
-eval_env = VecTransposeImage(eval_env)
-eval_cb = EvalCallback(
-    eval_env,
-    best_model_save_path="./models/best_eval",
-    log_path="./models/eval_logs",
-    eval_freq=10_000,
-    n_eval_episodes=5,
-    deterministic=True,
-    render=False
-)
 
 class winRate(BaseCallback):
     def __init__(self, window_size=100, check_freq=2000, save_path="./models/best_winrate", verbose=1):
@@ -104,11 +73,169 @@ class winRate(BaseCallback):
 
         return True
 
-try:
-    print("Begin training")
-    win_cb = winRate(window_size=100)
 
-    model.learn(args.steps, callback=[checkpoint, eval_cb, win_cb])
-except KeyboardInterrupt:
-    print("Training cancelled...")
-    model.save(f"./models/{datetime.now().strftime('%Y-%m-%d@%H:%M')}")
+class stepProfiler(BaseCallback):
+    '''
+    Logs p50/p95/p99 (ms) of every profiled phase and env steps per second at the end of each rollout.
+    Times the policy forward (torch hooks on the policy, CUDA synchronized so the GPU time lands in it),
+    the whole rollout step and the PPO update here, and merges in the phases the envs recorded
+    (make_env(profile=True)). Only add it when profiling, without it nothing is timed.
+    '''
+
+    def __init__(self, verbose=0):
+        super().__init__(verbose)
+        self.profiler = Profiler()
+        self._hooks = []
+        self._forward_start = None
+        self._last_step = None
+        self._train_start = None
+        self._since = None
+        self._since_steps = 0
+
+    def _on_training_start(self):
+        policy = self.model.policy
+        sync = torch.cuda.synchronize if self.model.device.type == "cuda" else None
+
+        def before(module, args):
+            if sync:
+                sync()
+            self._forward_start = time.perf_counter()
+
+        def after(module, args, output):
+            if sync:
+                sync()
+            self.profiler.add("policy.forward", time.perf_counter() - self._forward_start)
+
+        self._hooks = [policy.register_forward_pre_hook(before), policy.register_forward_hook(after)]
+        self._since = time.perf_counter()
+        self._since_steps = self.num_timesteps
+
+    def _on_rollout_start(self):
+        now = time.perf_counter()
+        if self._train_start is not None:
+            self.profiler.add("train", now - self._train_start)
+        self._last_step = now
+
+    def _on_step(self) -> bool:
+        # Policy forward, env step and buffer bookkeeping of one rollout step
+        now = time.perf_counter()
+        self.profiler.add("rollout.step", now - self._last_step)
+        self._last_step = now
+        return True
+
+    def _on_rollout_end(self):
+        for histograms in self.training_env.env_method("profile"):
+            self.profiler.merge(histograms)
+
+        now = time.perf_counter()
+        self.logger.record("profile/steps_per_s", (self.num_timesteps - self._since_steps) / (now - self._since))
+        for phase, stats in self.profiler.stats().items():
+            for q in ("p50", "p95", "p99"):
+                self.logger.record(f"profile/{phase}_{q}_ms", stats[q] * 1000)
+        self.profiler.take()
+        self._since, self._since_steps = now, self.num_timesteps
+        self._train_start = now
+
+    def _on_training_end(self):
+        for hook in self._hooks:
+            hook.remove()
+        self._hooks = []
+
+
+# Workers of SubprocVecEnv import this file again, only the main process trains
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="DS3 Agent Trainer")
+    parser.add_argument("--steps", type=int, default=100_000)
+    parser.add_argument("--load", type=str, help="Provide a path to the model")
+    parser.add_argument("--step-hz", type=float, help="Run env steps on a fixed-rate clock, e.g. 10")
+    parser.add_argument("--replay", type=str, help="Train on a recorded trace instead of the game (for profiling)")
+    parser.add_argument("--record", type=str, help="Directory to record the training env's trajectories to")
+    parser.add_argument("--instances", type=int, default=1, help="Number of game instances to train on in parallel")
+    parser.add_argument("--native-stack", action="store_true",
+                        help="Stack frames inside the env (frame_stack.FrameStack) instead of with VecFrameStack")
+    parser.add_argument("--profile", action="store_true",
+                        help="Log per-phase step, policy and update timings (profile/ in TensorBoard)")
+    args = parser.parse_args()
+
+    if args.replay:
+        # Stand-in instances, every worker replays the trace on its own
+        instances = [None] * (args.instances + 1)
+    elif args.instances > 1:
+        instances = find_instances()
+        if len(instances) < args.instances:
+            raise RuntimeError(f'Asked for {args.instances} game instances, found {len(instances)}.')
+    else:
+        instances = [None]
+
+    record = args.record
+    if record and args.instances > 1:
+        # One recording per instance
+        record = [os.path.join(args.record, f'instance_{rank}') for rank in range(args.instances)]
+
+    # Same stacked, channel-first observations either way
+    frame_stack = 4 if args.native_stack else None
+    env_fn = functools.partial(make_env, replay=args.replay, step_hz=args.step_hz, record=record, frame_stack=frame_stack,
+                               profile=args.profile)
+    env = launch(instances[:args.instances], env_fn)
+    if not args.native_stack:
+        env = VecFrameStack(env, n_stack=4, channels_order="last")
+        env = VecTransposeImage(env)
+
+    policy_kwargs = {
+        "net_arch": {
+            "pi": [128, 128],
+            "vf": [128, 128]
+        },
+        "activation_fn": torch.nn.ReLU
+    }
+
+    checkpoint = CheckpointCallback(
+        save_freq=4096,
+        save_path="./models",
+    )
+
+    if args.load:
+        model = PPO.load(args.load, env=env)
+    else: 
+        model = PPO(
+            "MultiInputPolicy", 
+            env, 
+            policy_kwargs=policy_kwargs,
+            verbose=1, 
+            n_steps=1024,
+            device="cuda",
+            tensorboard_log="./ppo_ds3_logs"
+        )
+
+    # Evaluates on a spare instance if there is one, otherwise shares the first game
+    eval_instance = instances[args.instances] if len(instances) > args.instances else instances[0]
+    eval_env = DummyVecEnv([lambda: make_env(eval_instance, replay=args.replay, step_hz=args.step_hz, frame_stack=frame_stack)])
+    if not args.native_stack:
+        eval_env = VecFrameStack(eval_env, n_stack=4, channels_order="last")
+        eval_env = VecTransposeImage(eval_env)
+    eval_cb = EvalCallback(
+        eval_env,
+        best_model_save_path="./models/best_eval",
+        log_path="./models/eval_logs",
+        eval_freq=10_000,
+        n_eval_episodes=5,
+        deterministic=True,
+        render=False
+    )
+
+    try:
+        print("Begin training")
+        win_cb = winRate(window_size=100)
+
+        callbacks = [checkpoint, eval_cb, win_cb]
+        if args.profile:
+            callbacks.append(stepProfiler())
+
+        model.learn(args.steps, callback=callbacks)
+    except KeyboardInterrupt:
+        print("Training cancelled...")
+        model.save(f"./models/{datetime.now().strftime('%Y-%m-%d@%H:%M')}")
+    finally:
+        # Recorders write their last partial chunk on close
+        env.close()
+        eval_env.close()